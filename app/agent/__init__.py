@@ -3,7 +3,7 @@ from __future__ import annotations
 import importlib
 import os
 from types import ModuleType
-from typing import Dict
+from typing import Dict, Iterable, List
 
 ENGINE_ALIAS_MAP = {
     "local_multi": ".engine_local_multi",
@@ -18,6 +18,14 @@ ENGINE_ALIAS_MAP = {
     "local-selftest": ".engine_local_selftest",
     "api_selftest": ".engine_api_selftest",
     "api-selftest": ".engine_api_selftest",
+    "local_cascade": ".engine_local_cascade",
+    "local-cascade": ".engine_local_cascade",
+    "api_cascade": ".engine_api_cascade",
+    "api-cascade": ".engine_api_cascade",
+    "local_consensus": ".engine_local_consensus",
+    "local-consensus": ".engine_local_consensus",
+    "api_consensus": ".engine_api_consensus",
+    "api-consensus": ".engine_api_consensus",
 }
 
 _ENGINE_CACHE: Dict[str, ModuleType] = {}
@@ -45,14 +53,49 @@ def _get_engine(name: str | None = None) -> ModuleType:
     return _ENGINE_CACHE[key]
 
 
-def agent_reply(message: str, history, engine: str | None = None):
+def warm_up_engines(names: Iterable[str | None] = (None,), prefill: bool = False) -> List[Dict]:
+    """Build the named engines' agents and probe their backends ahead of traffic."""
+
+    from .factory import REGISTRY
+
+    configs = []
+    for name in names:
+        config = _get_engine(name).CONFIG
+        if config not in configs:
+            configs.append(config)
+    return REGISTRY.warm_up(configs, prefill=prefill)
+
+
+def _configured_agent(impl: ModuleType, options: Dict | None):
+    # Options such as a lower max_attempts select a separate, cached agent instance.
+    if not options:
+        return None
+    from .factory import REGISTRY
+
+    return REGISTRY.get(impl.CONFIG.with_options(**options))
+
+
+def agent_reply(message: str, history, engine: str | None = None, cancel=None, options: Dict | None = None):
     impl = _get_engine(engine)
-    return impl.agent_reply(message, history)
+    agent = _configured_agent(impl, options)
+    if agent is not None:
+        return agent.run(message, history, cancel=cancel)
+    return impl.agent_reply(message, history, cancel=cancel)
 
 
-def agent_stream(message: str, history, engine: str | None = None):
+def agent_stream(message: str, history, engine: str | None = None, cancel=None, options: Dict | None = None):
     impl = _get_engine(engine)
-    yield from impl.agent_stream(message, history)
+    agent = _configured_agent(impl, options)
+    if agent is not None:
+        yield from agent.stream(message, history, cancel=cancel)
+        return
+    yield from impl.agent_stream(message, history, cancel=cancel)
 
 
-__all__ = ["agent_reply", "agent_stream", "ENGINE_ALIAS_MAP", "normalize_engine_name"]
+__all__ = [
+    "agent_reply",
+    "agent_stream",
+    "ENGINE_ALIAS_MAP",
+    "normalize_engine_name",
+    "warm_up_engines",
+]
@@ -0,0 +1,73 @@
+"""Cooperative cancellation shared by the server, agents, clients and sandbox."""
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, List
+
+
+class AgentCancelled(RuntimeError):
+    """Raised inside a pipeline once its cancel token has fired."""
+
+
+class CancelToken:
+    """Thread-safe flag with callbacks that abort in-flight work when set.
+
+    Blocking resources (streaming HTTP responses, checker subprocesses)
+    register a callback that tears them down, so cancellation takes effect
+    immediately instead of at the next polling point.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # pragma: no cover - best effort teardown
+                pass
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run ``callback`` on cancel; returns a function that unregisters it."""
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def unregister() -> None:
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return unregister
+        callback()
+        return lambda: None
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise AgentCancelled(self.reason or "cancelled")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._event.wait(timeout)
+
+
+def raise_if_cancelled(cancel: CancelToken | None) -> None:
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+
+__all__ = ["AgentCancelled", "CancelToken", "raise_if_cancelled"]
@@ -0,0 +1,240 @@
+"""Cascade agent: answer with the single-shot agent, escalate only on failure."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .exec_feedback_agent import AttemptResult, ExecutionFeedbackAgent, _extract_code_block
+from .pipeline_utils import extract_headline, timed_event, truncate_log
+from .preflight import PREFLIGHT_ENABLED, preflight_check
+from .sandbox import run_checker
+from .simple_messages import BaseMessage
+from .single_agent import SingleShotAgent
+
+ESCALATION_TARGETS = ("exec", "multi")
+
+
+class _CountingClient:
+    """Client proxy that counts LLM calls so each tier can report its cost."""
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.config = getattr(client, "config", None)
+        self.supports_temperature = getattr(client, "supports_temperature", True)
+        self.calls = 0
+
+    def chat(self, messages: Iterable[BaseMessage], **kwargs: Any) -> str:
+        self.calls += 1
+        return self.client.chat(messages, **kwargs)
+
+
+def _failure_reason(output: str) -> str:
+    """Condense checker/preflight output into a one-line escalation reason."""
+
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    if not lines:
+        return "single-shot check failed"
+    if lines[0].startswith("Preflight rejected") and len(lines) > 1:
+        return "preflight: " + lines[1].lstrip("- ")
+    return lines[-1]
+
+
+@dataclass(slots=True)
+class TierCost:
+    tier: str
+    elapsed_ms: float
+    llm_calls: int
+    success: bool
+    detail: str
+
+
+class CascadeAgent:
+    """Run ``SingleShotAgent`` first and escalate to a stronger loop on failure.
+
+    The single-shot answer is accepted when its code passes pre-flight and
+    (for benchmark tasks) the checker. Otherwise the failure is handed to the
+    execution-feedback loop as a seed attempt, or the three-stage
+    ``LangGraphAgent`` named by ``multi_config`` is run from scratch.
+    """
+
+    def __init__(
+        self,
+        client,
+        escalation: str = "exec",
+        max_attempts: int = 3,
+        multi_config: Any | None = None,
+    ) -> None:
+        if escalation not in ESCALATION_TARGETS:
+            raise ValueError(
+                f"Unknown cascade escalation '{escalation}'. Choices: {', '.join(ESCALATION_TARGETS)}"
+            )
+        self.client = client
+        self.escalation = escalation
+        self.max_attempts = max_attempts
+        self.multi_config = multi_config
+
+    def _multi_agent(self):
+        """The shared registry agent, so escalations reuse one compiled graph."""
+
+        if self.multi_config is None:
+            from .multi_agent import LangGraphAgent
+
+            return LangGraphAgent(self.client)
+        from .factory import REGISTRY
+
+        return REGISTRY.get(self.multi_config)
+
+    def _check(
+        self,
+        message: str,
+        code: Optional[str],
+        checker: Optional[Path],
+        cancel: CancelToken | None,
+    ) -> Tuple[bool, str]:
+        if not code:
+            return False, "no code block found in single-shot reply"
+        if PREFLIGHT_ENABLED:
+            # Interactive prompts have no sandbox policy or declared signature;
+            # only benchmark tasks with a checker are held to either.
+            preflight = preflight_check(
+                code,
+                message if checker else None,
+                blocked_imports=None if checker else frozenset(),
+            )
+            if not preflight.ok:
+                return False, preflight.report()
+        if checker is None:
+            return True, "no checker provided"
+        if not checker.exists():
+            return False, "checker file missing on disk"
+        return run_checker(checker, code, cancel=cancel, prefix="cascade-")
+
+    def run(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task: Any | None = None,
+        cancel: CancelToken | None = None,
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for event in self.stream(message, history=history, task=task, cancel=cancel):
+            if event["stage"] == "complete":
+                result = {
+                    "headline": event["headline"],
+                    "body": event["body"],
+                    "trace": event["trace"],
+                }
+        return result
+
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task: Any | None = None,
+        cancel: CancelToken | None = None,
+    ):
+        started = time.perf_counter()
+        checker_path = getattr(task, "checker", None)
+        checker = Path(checker_path) if checker_path else None
+        tiers: List[TierCost] = []
+
+        yield timed_event("tier", started, tier="single", content="Tier 1: single-shot answer")
+        tier_started = time.perf_counter()
+        counting = _CountingClient(self.client)
+        single = SingleShotAgent(counting).run(message, history, cancel=cancel)
+        body = single["body"]
+        code = _extract_code_block(body, getattr(task, "language", None))
+        if code:
+            code = code.replace("<END-OF-CODE>", "").strip()
+        success, output = self._check(message, code, checker, cancel)
+        tiers.append(
+            TierCost(
+                tier="single",
+                elapsed_ms=round((time.perf_counter() - tier_started) * 1000, 1),
+                llm_calls=counting.calls,
+                success=success,
+                detail=truncate_log(output),
+            )
+        )
+        yield timed_event(
+            "checker_result",
+            started,
+            tier="single",
+            success=success,
+            content=truncate_log(output),
+        )
+
+        escalation_reason = None
+        final_body = body
+        if not success:
+            raise_if_cancelled(cancel)
+            escalation_reason = _failure_reason(output)
+            yield timed_event(
+                "tier",
+                started,
+                tier=self.escalation,
+                reason=escalation_reason,
+                content=f"Escalating to {self.escalation}: {escalation_reason}",
+            )
+            tier_started = time.perf_counter()
+            counting = _CountingClient(self.client)
+            tier_success = False
+            detail = ""
+            stage_calls = 0
+            if self.escalation == "exec":
+                agent = ExecutionFeedbackAgent(counting, max_attempts=self.max_attempts)
+                seed = AttemptResult(
+                    attempt=1, raw_reply=body, code=code, success=False, checker_output=output
+                )
+                events = agent.stream(message, history, task=task, cancel=cancel, seed=seed)
+            else:
+                events = self._multi_agent().stream(message, history, cancel=cancel)
+            for event in events:
+                if event["stage"] == "complete":
+                    final_body = event.get("body", event["content"])
+                    tier_success = bool(event.get("success", False))
+                    if event.get("stopped_early"):
+                        detail = f"stopped early ({event['stopped_early']}): {detail}"
+                    continue
+                if event["stage"] == "checker_result":
+                    detail = event.get("content", "")
+                elif self.escalation == "multi":
+                    # The shared multi agent calls its own client, once per coder stage.
+                    stage_calls += 1
+                yield {**event, "tier": self.escalation}
+            if self.escalation == "multi":
+                final_code = _extract_code_block(final_body, getattr(task, "language", None))
+                if final_code:
+                    final_code = final_code.replace("<END-OF-CODE>", "").strip()
+                tier_success, detail = self._check(message, final_code, checker, cancel)
+            tiers.append(
+                TierCost(
+                    tier=self.escalation,
+                    elapsed_ms=round((time.perf_counter() - tier_started) * 1000, 1),
+                    llm_calls=counting.calls + stage_calls,
+                    success=tier_success,
+                    detail=truncate_log(detail),
+                )
+            )
+
+        headline, _ = extract_headline(final_body)
+        trace = {
+            "escalated": escalation_reason is not None,
+            "escalation_reason": escalation_reason,
+            "tiers": [asdict(tier) for tier in tiers],
+        }
+        yield timed_event(
+            "complete",
+            started,
+            headline=headline,
+            content=final_body,
+            body=final_body,
+            trace=trace,
+        )
+
+
+__all__ = ["CascadeAgent", "TierCost", "ESCALATION_TARGETS"]
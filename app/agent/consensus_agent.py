@@ -0,0 +1,233 @@
+"""Test-consensus agent: sample solutions and test suites, vote by execution."""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .pipeline_utils import SELF_TEST_SYSTEM_PROMPT, build_conversation, extract_headline, timed_event
+from .preflight import PREFLIGHT_ENABLED, preflight_check
+from .sandbox import SANDBOX_MAX_PROCS
+from .self_test_agent import ParsedBlocks, _extract_blocks, _run_self_tests
+from .simple_messages import BaseMessage, SystemMessage
+from .stagnation import code_fingerprint
+
+
+@dataclass(slots=True)
+class Sample:
+    index: int
+    reply: str
+    blocks: Optional[ParsedBlocks]
+    solution_ok: bool = False
+    suite_ok: bool = False
+
+
+@dataclass(slots=True)
+class Cluster:
+    members: List[int]
+    passed_suites: FrozenSet[int]
+    score: int = 0
+
+
+class ConsensusAgent:
+    """Sample K solution+test replies and return the best-agreeing solution.
+
+    Every parsed solution runs against every parsed self-test suite. Solutions
+    are clustered by the exact set of suites they pass, and each cluster is
+    scored by ``len(members) * len(passed_suites)`` (CodeT-style dual
+    agreement). The first member of the top cluster is returned.
+    """
+
+    def __init__(
+        self,
+        client,
+        samples: int = 4,
+        temperature: float | None = 0.7,
+        checker_workers: int = SANDBOX_MAX_PROCS,
+    ) -> None:
+        self.client = client
+        self.samples = max(samples, 1)
+        self.temperature = temperature
+        self.checker_workers = max(checker_workers, 1)
+
+    def _sample(self, prompts: List[BaseMessage], index: int, cancel: CancelToken | None) -> Sample:
+        raise_if_cancelled(cancel)
+        # The first sample keeps the client's default temperature so the
+        # greedy answer always takes part in the vote.
+        temperature = None if index == 0 else self.temperature
+        reply = self.client.chat(prompts, cancel=cancel, temperature=temperature).strip()
+        return Sample(index=index, reply=reply, blocks=_extract_blocks(reply))
+
+    def _validate(self, sample: Sample, message: str, checked: bool) -> None:
+        if sample.blocks is None:
+            return
+        if not PREFLIGHT_ENABLED:
+            sample.solution_ok = sample.suite_ok = True
+            return
+        # Without a task checker (interactive use) the sandbox import policy and
+        # a signature parsed from chat text do not apply; syntax still does.
+        blocked = None if checked else frozenset()
+        sample.solution_ok = preflight_check(
+            sample.blocks.solution, message if checked else None, blocked_imports=blocked
+        ).ok
+        sample.suite_ok = preflight_check(
+            sample.blocks.tests, entry_point="run_tests", blocked_imports=blocked
+        ).ok
+
+    def _cross_execute(
+        self,
+        solutions: List[Sample],
+        suites: List[Sample],
+        cancel: CancelToken | None,
+    ) -> Dict[Tuple[int, int], bool]:
+        # Identical solutions only need to run once per suite.
+        unique: Dict[str, Sample] = {}
+        for sample in solutions:
+            unique.setdefault(code_fingerprint(sample.blocks.solution), sample)
+
+        def run_pair(pair: Tuple[str, Sample]) -> Tuple[str, int, bool]:
+            fingerprint, suite = pair
+            solution = unique[fingerprint].blocks.solution
+            success, _ = _run_self_tests(solution, suite.blocks.tests, cancel=cancel)
+            return fingerprint, suite.index, success
+
+        pairs = [(fingerprint, suite) for fingerprint in unique for suite in suites]
+        with ThreadPoolExecutor(max_workers=self.checker_workers) as pool:
+            outcomes = {(fp, suite): ok for fp, suite, ok in pool.map(run_pair, pairs)}
+
+        results: Dict[Tuple[int, int], bool] = {}
+        for sample in solutions:
+            fingerprint = code_fingerprint(sample.blocks.solution)
+            for suite in suites:
+                results[(sample.index, suite.index)] = outcomes[(fingerprint, suite.index)]
+        return results
+
+    @staticmethod
+    def _cluster(
+        solutions: List[Sample],
+        suites: List[Sample],
+        results: Dict[Tuple[int, int], bool],
+    ) -> List[Cluster]:
+        clusters: Dict[FrozenSet[int], Cluster] = {}
+        for sample in solutions:
+            passed = frozenset(
+                suite.index for suite in suites if results[(sample.index, suite.index)]
+            )
+            cluster = clusters.setdefault(passed, Cluster(members=[], passed_suites=passed))
+            cluster.members.append(sample.index)
+        for cluster in clusters.values():
+            cluster.score = len(cluster.members) * len(cluster.passed_suites)
+        return sorted(
+            clusters.values(),
+            key=lambda item: (item.score, len(item.passed_suites), -min(item.members)),
+            reverse=True,
+        )
+
+    def run(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task=None,
+        cancel: CancelToken | None = None,
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for event in self.stream(message, history=history, task=task, cancel=cancel):
+            if event["stage"] == "complete":
+                result = {
+                    "headline": event["headline"],
+                    "body": event["content"],
+                    "trace": event["trace"],
+                }
+        return result
+
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task=None,
+        cancel: CancelToken | None = None,
+    ):
+        started = time.perf_counter()
+        prompts: List[BaseMessage] = [SystemMessage(content=SELF_TEST_SYSTEM_PROMPT)]
+        prompts.extend(build_conversation(history, message))
+
+        yield timed_event(
+            "attempt",
+            started,
+            attempt=1,
+            max_attempts=1,
+            content=f"Sampling {self.samples} solution + test-suite replies",
+        )
+        with ThreadPoolExecutor(max_workers=self.samples) as pool:
+            samples = list(
+                pool.map(lambda index: self._sample(prompts, index, cancel), range(self.samples))
+            )
+        checked = getattr(task, "checker", None) is not None
+        for sample in samples:
+            self._validate(sample, message, checked)
+            yield timed_event(
+                "candidate",
+                started,
+                attempt=sample.index + 1,
+                code_found=sample.blocks is not None,
+                solution_ok=sample.solution_ok,
+                suite_ok=sample.suite_ok,
+                content=sample.reply,
+            )
+
+        solutions = [sample for sample in samples if sample.solution_ok]
+        suites = [sample for sample in samples if sample.suite_ok]
+        chosen = samples[0]
+        clusters: List[Cluster] = []
+        if solutions and suites:
+            raise_if_cancelled(cancel)
+            yield timed_event(
+                "checker_start",
+                started,
+                attempt=1,
+                content=f"Cross-executing {len(solutions)} solutions x {len(suites)} suites",
+            )
+            results = self._cross_execute(solutions, suites, cancel)
+            clusters = self._cluster(solutions, suites, results)
+            chosen = samples[clusters[0].members[0]]
+            yield timed_event(
+                "checker_result",
+                started,
+                attempt=1,
+                success=bool(clusters[0].passed_suites),
+                content=(
+                    f"Top cluster: samples {[m + 1 for m in clusters[0].members]} pass "
+                    f"{len(clusters[0].passed_suites)}/{len(suites)} suites (score {clusters[0].score})"
+                ),
+            )
+        elif solutions:
+            chosen = solutions[0]
+
+        headline, _ = extract_headline(chosen.reply)
+        trace = {
+            "samples": len(samples),
+            "valid_solutions": len(solutions),
+            "valid_suites": len(suites),
+            "chosen": chosen.index,
+            "clusters": [
+                {
+                    "members": cluster.members,
+                    "passed_suites": sorted(cluster.passed_suites),
+                    "score": cluster.score,
+                }
+                for cluster in clusters
+            ],
+        }
+        yield timed_event(
+            "complete",
+            started,
+            headline=headline,
+            content=chosen.reply,
+            trace=trace,
+        )
+
+
+__all__ = ["ConsensusAgent"]
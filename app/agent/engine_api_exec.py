@@ -1,16 +1,10 @@
 from __future__ import annotations
 
-import os
 from typing import Any, Dict, List
 
-from .exec_feedback_agent import ExecutionFeedbackAgent
-from .openai_client import OpenAIChatClient
+from .factory import REGISTRY, EngineConfig
 
-_CLIENT = OpenAIChatClient()
-_AGENT = ExecutionFeedbackAgent(
-    _CLIENT,
-    max_attempts=int(os.getenv("EXEC_AGENT_MAX_ATTEMPTS", "3")),
-)
+CONFIG = EngineConfig(backend="api", kind="exec")
 
 
 def agent_reply(
@@ -18,7 +12,9 @@ def agent_reply(
     history: List[Dict[str, str]] | None = None,
     **kwargs: Any,
 ) -> Dict[str, str]:
-    return _AGENT.run(message, history, task=kwargs.get("task"))
+    return REGISTRY.get(CONFIG).run(
+        message, history, task=kwargs.get("task"), cancel=kwargs.get("cancel")
+    )
 
 
 def agent_stream(
@@ -26,7 +22,9 @@ def agent_stream(
     history: List[Dict[str, str]] | None = None,
     **kwargs: Any,
 ):
-    yield from _AGENT.stream(message, history, task=kwargs.get("task"))
+    yield from REGISTRY.get(CONFIG).stream(
+        message, history, task=kwargs.get("task"), cancel=kwargs.get("cancel")
+    )
 
 
-__all__ = ["agent_reply", "agent_stream", "ExecutionFeedbackAgent"]
+__all__ = ["CONFIG", "agent_reply", "agent_stream"]
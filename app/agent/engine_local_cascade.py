@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from .factory import REGISTRY, EngineConfig
+
+CONFIG = EngineConfig(backend="local", kind="cascade")
+
+
+def agent_reply(
+    message: str,
+    history: List[Dict[str, str]] | None = None,
+    **kwargs: Any,
+) -> Dict[str, str]:
+    return REGISTRY.get(CONFIG).run(
+        message, history, task=kwargs.get("task"), cancel=kwargs.get("cancel")
+    )
+
+
+def agent_stream(
+    message: str,
+    history: List[Dict[str, str]] | None = None,
+    **kwargs: Any,
+):
+    yield from REGISTRY.get(CONFIG).stream(
+        message, history, task=kwargs.get("task"), cancel=kwargs.get("cancel")
+    )
+
+
+__all__ = ["CONFIG", "agent_reply", "agent_stream"]
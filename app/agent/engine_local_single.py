@@ -2,27 +2,25 @@ from __future__ import annotations
 
 from typing import Any, Dict, List
 
-from .llama_client import LlamaServerClient
-from .single_agent import SingleShotAgent
+from .factory import REGISTRY, EngineConfig
 
-_CLIENT = LlamaServerClient()
-_AGENT = SingleShotAgent(_CLIENT)
+CONFIG = EngineConfig(backend="local", kind="single")
 
 
 def agent_reply(
     message: str,
     history: List[Dict[str, str]] | None = None,
-    **_kwargs: Any,
+    **kwargs: Any,
 ) -> Dict[str, str]:
-    return _AGENT.run(message, history)
+    return REGISTRY.get(CONFIG).run(message, history, cancel=kwargs.get("cancel"))
 
 
 def agent_stream(
     message: str,
     history: List[Dict[str, str]] | None = None,
-    **_kwargs: Any,
+    **kwargs: Any,
 ):
-    yield from _AGENT.stream(message, history)
+    yield from REGISTRY.get(CONFIG).stream(message, history, cancel=kwargs.get("cancel"))
 
 
-__all__ = ["agent_reply", "agent_stream", "SingleShotAgent"]
+__all__ = ["CONFIG", "agent_reply", "agent_stream"]
@@ -1,9 +1,7 @@
 from __future__ import annotations
 
 import re
-import subprocess
-import sys
-import tempfile
+import time
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
@@ -12,8 +10,23 @@ from .pipeline_utils import (
     EXECUTION_REPAIR_SYSTEM_PROMPT,
     build_conversation,
     extract_headline,
+    timed_event,
+    truncate_log,
 )
+from .cancellation import CancelToken, raise_if_cancelled
+from .patching import (
+    REPAIR_MODE,
+    REPAIR_MODES,
+    SEARCH_REPLACE_INSTRUCTIONS,
+    PatchError,
+    apply_edits,
+    extract_edits,
+    strip_edits,
+)
+from .preflight import PREFLIGHT_ENABLED, preflight_check
+from .sandbox import run_checker
 from .simple_messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .stagnation import StagnationDetector
 
 CODE_BLOCK_RE = re.compile(r"```(?P<lang>[^\n]*)\n(?P<code>.*?)```", re.DOTALL)
 MAX_ERROR_CHARS = 2000
@@ -58,26 +71,19 @@ class ExecutionFeedbackAgent:
         client,
         system_prompt: str = EXECUTION_REPAIR_SYSTEM_PROMPT,
         max_attempts: int = 3,
+        repair_mode: str = REPAIR_MODE,
     ) -> None:
+        if repair_mode not in REPAIR_MODES:
+            raise ValueError(f"Unknown repair mode '{repair_mode}'. Choices: {', '.join(REPAIR_MODES)}")
         self.client = client
         self.system_prompt = system_prompt
         self.max_attempts = max_attempts
+        self.repair_mode = repair_mode
 
-    def _run_checker(self, checker: Path, code: str) -> Tuple[bool, str]:
-        with tempfile.TemporaryDirectory(prefix="exec-feedback-") as tmpdir:
-            submission = Path(tmpdir) / "submission.py"
-            submission.write_text(code, encoding="utf-8")
-            proc = subprocess.run(
-                [sys.executable, str(checker), str(submission)],
-                capture_output=True,
-                text=True,
-                check=False,
-            )
-            output = (proc.stdout + proc.stderr).strip()
-            success = proc.returncode == 0
-            if not output:
-                output = "PASS" if success else "checker failed without output"
-            return success, output
+    def _run_checker(
+        self, checker: Path, code: str, cancel: CancelToken | None = None
+    ) -> Tuple[bool, str]:
+        return run_checker(checker, code, cancel=cancel, prefix="exec-feedback-")
 
     def _failure_prompt(
         self,
@@ -99,12 +105,81 @@ class ExecutionFeedbackAgent:
             f"- You have {remaining} retries after this."
         )
 
+    def _patch_failure_prompt(
+        self,
+        original_prompt: str,
+        previous_code: str,
+        error_output: str,
+        attempt: int,
+    ) -> str:
+        remaining = max(self.max_attempts - attempt, 0)
+        return (
+            f"Attempt {attempt} failed against the automated checker.\n\n"
+            f"[Task]\n{original_prompt.strip()}\n\n"
+            f"[Previous Code]\n```python\n{previous_code}\n```\n\n"
+            f"[Checker Output]\n{_truncate(error_output)}\n\n"
+            f"{SEARCH_REPLACE_INSTRUCTIONS}\n"
+            "- Ensure the final line of your message is <END-OF-CODE>.\n"
+            f"- You have {remaining} retries after this."
+        )
+
+    def _rewrite_fallback_prompt(self, error: str) -> str:
+        return (
+            f"Your edits could not be applied to the previous code ({error}).\n"
+            "Rewrite the FULL Python solution instead: one concise explanation followed by a "
+            "single Python code block, and end with <END-OF-CODE>."
+        )
+
+    def _stagnation_prompt(
+        self,
+        original_prompt: str,
+        previous_code: Optional[str],
+        error_output: str,
+        attempt: int,
+    ) -> str:
+        remaining = max(self.max_attempts - attempt, 0)
+        code_section = previous_code or "(previous attempt did not include a code block)"
+        return (
+            f"Your repairs keep failing the same way (attempt {attempt}).\n\n"
+            f"[Task]\n{original_prompt.strip()}\n\n"
+            f"[Rejected Approach]\n```python\n{code_section}\n```\n\n"
+            f"[Recurring Checker Output]\n{_truncate(error_output)}\n\n"
+            "Do NOT patch the rejected approach. Re-read the task, list the requirement it "
+            "misses, and write a new solution using a different algorithm or structure.\n"
+            "- Keep one concise explanation followed by a single Python code block.\n"
+            "- Ensure the final line of your message is <END-OF-CODE>.\n"
+            f"- You have {remaining} retries after this."
+        )
+
     def run(
         self,
         message: str,
         history: List[Dict[str, str]] | None = None,
         task: Any | None = None,
+        cancel: CancelToken | None = None,
+        seed: AttemptResult | None = None,
     ) -> Dict[str, str]:
+        result: Dict[str, str] = {}
+        for event in self.stream(message, history=history, task=task, cancel=cancel, seed=seed):
+            if event["stage"] == "complete":
+                result = {"headline": event["headline"], "body": event["content"]}
+        return result
+
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task: Any | None = None,
+        cancel: CancelToken | None = None,
+        seed: AttemptResult | None = None,
+    ):
+        """Yield progress events for every attempt, ending with ``complete``.
+
+        ``seed`` is a failed attempt produced elsewhere (e.g. a cheaper tier);
+        its reply and checker output open the conversation as feedback.
+        """
+
+        started = time.perf_counter()
         preferred_language = getattr(task, "language", None)
         checker_path = getattr(task, "checker", None)
         checker = Path(checker_path) if checker_path else None
@@ -114,14 +189,96 @@ class ExecutionFeedbackAgent:
 
         attempts: List[AttemptResult] = []
         final_reply = ""
+        stagnation = StagnationDetector(
+            temperature_control=getattr(self.client, "supports_temperature", True)
+        )
+        base_temperature = getattr(getattr(self.client, "config", None), "temperature", None)
+        temperature: float | None = None
+        stop_reason: str | None = None
+        patch_base: str | None = None
+
+        if seed is not None:
+            messages.append(AIMessage(content=seed.raw_reply))
+            messages.append(
+                HumanMessage(
+                    content=self._failure_prompt(
+                        message, seed.code, seed.checker_output, seed.attempt
+                    )
+                )
+            )
+            stagnation.observe(0, seed.code, seed.checker_output)
 
         for attempt in range(1, self.max_attempts + 1):
-            reply = self.client.chat(messages).strip()
+            raise_if_cancelled(cancel)
+            yield timed_event(
+                "attempt",
+                started,
+                attempt=attempt,
+                max_attempts=self.max_attempts,
+                content=f"Attempt {attempt}/{self.max_attempts}: generating code",
+            )
+            llm_started = time.perf_counter()
+            reply = self.client.chat(messages, cancel=cancel, temperature=temperature).strip()
+            llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+            repair = "rewrite"
+            if patch_base is not None:
+                code = _extract_code_block(strip_edits(reply), preferred_language)
+                try:
+                    patched = apply_edits(patch_base, extract_edits(reply))
+                except PatchError as exc:
+                    if code is None:
+                        yield timed_event(
+                            "patch_failed",
+                            started,
+                            attempt=attempt,
+                            llm_ms=llm_ms,
+                            content=f"Patch did not apply ({exc}); requesting a full rewrite",
+                        )
+                        messages.append(AIMessage(content=reply))
+                        messages.append(HumanMessage(content=self._rewrite_fallback_prompt(str(exc))))
+                        llm_started = time.perf_counter()
+                        reply = self.client.chat(
+                            messages, cancel=cancel, temperature=temperature
+                        ).strip()
+                        llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+                        code = _extract_code_block(reply, preferred_language)
+                else:
+                    code = patched
+                    repair = "patch"
+                    reply = (
+                        f"{strip_edits(reply)}\n\n```python\n{patched}\n```\n<END-OF-CODE>"
+                    ).strip()
+                patch_base = None
+            else:
+                code = _extract_code_block(reply, preferred_language)
             final_reply = reply
-            code = _extract_code_block(reply, preferred_language)
+            yield timed_event(
+                "candidate",
+                started,
+                attempt=attempt,
+                llm_ms=llm_ms,
+                code_found=code is not None,
+                repair=repair,
+                content=reply,
+            )
+
+            preflight = (
+                preflight_check(code, message) if code and checker and PREFLIGHT_ENABLED else None
+            )
 
-            if checker and checker.exists() and code:
-                success, checker_output = self._run_checker(checker, code)
+            checker_ms = 0.0
+            if preflight is not None and not preflight.ok:
+                success, checker_output = False, preflight.report()
+            elif checker and checker.exists() and code:
+                yield timed_event(
+                    "checker_start",
+                    started,
+                    attempt=attempt,
+                    content=f"Attempt {attempt}: running {checker.name}",
+                )
+                checker_started = time.perf_counter()
+                success, checker_output = self._run_checker(checker, code, cancel=cancel)
+                checker_ms = round((time.perf_counter() - checker_started) * 1000, 1)
             elif not checker:
                 success, checker_output = True, "no checker provided"
             elif not code:
@@ -138,33 +295,81 @@ class ExecutionFeedbackAgent:
                     checker_output=checker_output,
                 )
             )
+            yield timed_event(
+                "checker_result",
+                started,
+                attempt=attempt,
+                success=success,
+                checker_ms=checker_ms,
+                content=truncate_log(checker_output),
+            )
 
             if success:
                 break
 
-            messages.append(AIMessage(content=reply))
-            messages.append(
-                HumanMessage(
-                    content=self._failure_prompt(
-                        message,
-                        code,
-                        checker_output,
-                        attempt,
+            reaction = "continue"
+            if attempt < self.max_attempts and stagnation.enabled:
+                reason = stagnation.observe(attempt, code, checker_output)
+                if reason:
+                    reaction = stagnation.react()
+                    yield timed_event(
+                        "stagnation",
+                        started,
+                        attempt=attempt,
+                        reason=reason,
+                        reaction=reaction,
+                        content=f"Repair loop stalled ({reason}); reaction: {reaction}",
                     )
+                    if reaction == "stop":
+                        stop_reason = reason
+                        break
+                    temperature = stagnation.temperature(base_temperature)
+
+            if reaction == "reprompt":
+                messages = [SystemMessage(content=self.system_prompt)]
+                messages.extend(build_conversation(history, message))
+                messages.append(
+                    HumanMessage(content=self._stagnation_prompt(message, code, checker_output, attempt))
+                )
+            elif self.repair_mode == "diff" and code:
+                messages.append(AIMessage(content=reply))
+                messages.append(
+                    HumanMessage(
+                        content=self._patch_failure_prompt(message, code, checker_output, attempt)
+                    )
+                )
+                patch_base = code
+            else:
+                messages.append(AIMessage(content=reply))
+                messages.append(
+                    HumanMessage(
+                        content=self._failure_prompt(
+                            message,
+                            code,
+                            checker_output,
+                            attempt,
+                        )
+                    )
+                )
+            if attempt < self.max_attempts:
+                yield timed_event(
+                    "retry",
+                    started,
+                    attempt=attempt,
+                    remaining=self.max_attempts - attempt,
+                    content=f"Retrying with checker feedback ({self.max_attempts - attempt} left)",
                 )
-            )
 
         headline, _ = extract_headline(final_reply)
-        return {"headline": headline, "body": final_reply}
-
-    def stream(
-        self,
-        message: str,
-        history: List[Dict[str, str]] | None = None,
-        task: Any | None = None,
-    ):
-        result = self.run(message, history=history, task=task)
-        yield {"stage": "complete", "headline": result["headline"], "content": result["body"]}
+        yield timed_event(
+            "complete",
+            started,
+            headline=headline,
+            content=final_reply,
+            attempts=len(attempts),
+            success=bool(attempts and attempts[-1].success),
+            stopped_early=stop_reason,
+        )
 
 
-__all__ = ["ExecutionFeedbackAgent"]
+__all__ = ["ExecutionFeedbackAgent", "AttemptResult"]
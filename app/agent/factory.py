@@ -0,0 +1,242 @@
+"""Lazy, shareable construction of engine agents and backend clients."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from .graph_runner import GRAPH_BACKEND
+from .patching import REPAIR_MODE
+from .pipeline_utils import (
+    CODER1_SYSTEM_PROMPT,
+    EXECUTION_REPAIR_SYSTEM_PROMPT,
+    SELF_TEST_SYSTEM_PROMPT,
+    SINGLE_AGENT_SYSTEM_PROMPT,
+)
+from .simple_messages import SystemMessage
+
+BACKENDS = ("local", "api")
+AGENT_KINDS = ("single", "multi", "exec", "selftest", "cascade", "consensus")
+
+# System prompt that opens each agent's first request; used for prefix prefill.
+_PREFILL_PROMPTS = {
+    "single": SINGLE_AGENT_SYSTEM_PROMPT,
+    "multi": CODER1_SYSTEM_PROMPT,
+    "exec": EXECUTION_REPAIR_SYSTEM_PROMPT,
+    "selftest": SELF_TEST_SYSTEM_PROMPT,
+    "cascade": SINGLE_AGENT_SYSTEM_PROMPT,
+    "consensus": SELF_TEST_SYSTEM_PROMPT,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class EngineConfig:
+    """Identity of one agent instance: backend, agent kind, model and options.
+
+    Two configs that compare equal share an agent; configs that differ (for
+    example the same kind on two models) get independent instances.
+    """
+
+    backend: str
+    kind: str
+    model: str | None = None
+    options: Tuple[Tuple[str, Any], ...] = field(default=())
+
+    def __post_init__(self) -> None:
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{self.backend}'. Choices: {', '.join(BACKENDS)}")
+        if self.kind not in AGENT_KINDS:
+            raise ValueError(f"Unknown agent kind '{self.kind}'. Choices: {', '.join(AGENT_KINDS)}")
+
+    @classmethod
+    def from_name(cls, name: str, model: str | None = None, **options: Any) -> "EngineConfig":
+        """Parse engine names such as ``local_multi`` or ``api-selftest``."""
+
+        backend, _, kind = name.replace("-", "_").partition("_")
+        return cls(backend=backend, kind=kind, model=model, options=tuple(sorted(options.items())))
+
+    @property
+    def name(self) -> str:
+        suffix = f"@{self.model}" if self.model else ""
+        return f"{self.backend}_{self.kind}{suffix}"
+
+    def option(self, key: str, default: Any) -> Any:
+        return dict(self.options).get(key, default)
+
+    def with_options(self, **options: Any) -> "EngineConfig":
+        """Copy of this config with ``options`` overriding existing ones."""
+
+        merged = {**dict(self.options), **options}
+        return replace(self, options=tuple(sorted(merged.items())))
+
+
+_CLIENTS: Dict[Tuple[str, str | None], Any] = {}
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client(backend: str, model: str | None = None):
+    """Return the shared client for ``backend``/``model``, building it on first use."""
+
+    key = (backend, model)
+    with _CLIENT_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            if backend == "local":
+                from .llama_client import LlamaServerClient, LlamaServerConfig
+
+                config = LlamaServerConfig(model=model) if model else None
+                client = LlamaServerClient(config)
+            elif backend == "api":
+                from .openai_client import OpenAIChatClient, OpenAIClientConfig
+
+                config = OpenAIClientConfig(model=model) if model else None
+                client = OpenAIChatClient(config)
+            else:
+                raise ValueError(f"Unknown backend '{backend}'. Choices: {', '.join(BACKENDS)}")
+            _CLIENTS[key] = client
+    return client
+
+
+def _build_single(client, config: EngineConfig):
+    from .single_agent import SingleShotAgent
+
+    return SingleShotAgent(client)
+
+
+def _build_multi(client, config: EngineConfig):
+    from .multi_agent import LangGraphAgent
+
+    return LangGraphAgent(client, graph_backend=config.option("graph_backend", GRAPH_BACKEND))
+
+
+def _build_exec(client, config: EngineConfig):
+    from .exec_feedback_agent import ExecutionFeedbackAgent
+
+    return ExecutionFeedbackAgent(
+        client,
+        max_attempts=config.option("max_attempts", int(os.getenv("EXEC_AGENT_MAX_ATTEMPTS", "3"))),
+        repair_mode=config.option("repair_mode", REPAIR_MODE),
+    )
+
+
+def _build_selftest(client, config: EngineConfig):
+    from .self_test_agent import SelfTestAgent
+
+    return SelfTestAgent(
+        client,
+        max_attempts=config.option(
+            "max_attempts", int(os.getenv("SELFTEST_AGENT_MAX_ATTEMPTS", "3"))
+        ),
+        repair_mode=config.option("repair_mode", REPAIR_MODE),
+    )
+
+
+def _build_cascade(client, config: EngineConfig):
+    from .cascade_agent import CascadeAgent
+
+    return CascadeAgent(
+        client,
+        escalation=config.option("escalation", os.getenv("CASCADE_ESCALATION", "exec")),
+        max_attempts=config.option("max_attempts", int(os.getenv("EXEC_AGENT_MAX_ATTEMPTS", "3"))),
+        multi_config=EngineConfig(backend=config.backend, kind="multi", model=config.model),
+    )
+
+
+def _build_consensus(client, config: EngineConfig):
+    from .consensus_agent import ConsensusAgent
+
+    return ConsensusAgent(
+        client,
+        samples=config.option("samples", int(os.getenv("CONSENSUS_SAMPLES", "4"))),
+        temperature=config.option("temperature", float(os.getenv("CONSENSUS_TEMPERATURE", "0.7"))),
+    )
+
+
+_BUILDERS: Dict[str, Callable[[Any, EngineConfig], Any]] = {
+    "single": _build_single,
+    "multi": _build_multi,
+    "exec": _build_exec,
+    "selftest": _build_selftest,
+    "cascade": _build_cascade,
+    "consensus": _build_consensus,
+}
+
+
+def build_agent(config: EngineConfig):
+    """Construct a new agent for ``config`` on top of the shared client."""
+
+    return _BUILDERS[config.kind](get_client(config.backend, config.model), config)
+
+
+class EngineRegistry:
+    """Per-config agent cache; agents are built on first use and then reused."""
+
+    def __init__(self) -> None:
+        self._agents: Dict[EngineConfig, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, config: EngineConfig):
+        agent = self._agents.get(config)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(config)
+                if agent is None:
+                    agent = build_agent(config)
+                    self._agents[config] = agent
+        return agent
+
+    def configs(self) -> List[EngineConfig]:
+        return list(self._agents)
+
+    def warm_up(self, configs: Iterable[EngineConfig], prefill: bool = False) -> List[Dict[str, Any]]:
+        """Build agents, probe their backends and optionally prefill prompt prefixes.
+
+        Failures are reported per config instead of raised so a server can
+        start even when one backend is down.
+        """
+
+        report: List[Dict[str, Any]] = []
+        probed: Dict[Tuple[str, str | None], Dict[str, Any]] = {}
+        for config in configs:
+            started = time.perf_counter()
+            entry: Dict[str, Any] = {"engine": config.name, "ok": True}
+            try:
+                self.get(config)
+                key = (config.backend, config.model)
+                client = get_client(*key)
+                if key not in probed:
+                    probed[key] = client.health()
+                entry["health"] = probed[key]
+                if prefill:
+                    entry["prefilled"] = client.prefill(
+                        [SystemMessage(content=_PREFILL_PROMPTS[config.kind])]
+                    )
+            except Exception as exc:
+                entry.update(ok=False, error=str(exc))
+            entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            report.append(entry)
+        return report
+
+
+REGISTRY = EngineRegistry()
+
+
+def engine_agent(backend: str, kind: str):
+    """Agent for the default configuration of ``backend``/``kind``."""
+
+    return REGISTRY.get(EngineConfig(backend=backend, kind=kind))
+
+
+__all__ = [
+    "AGENT_KINDS",
+    "BACKENDS",
+    "EngineConfig",
+    "EngineRegistry",
+    "REGISTRY",
+    "build_agent",
+    "engine_agent",
+    "get_client",
+]
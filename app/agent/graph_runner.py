@@ -0,0 +1,114 @@
+"""Minimal in-process graph runner for linear node chains.
+
+Implements the subset of LangGraph's ``StateGraph`` API that the coder
+pipeline uses (nodes, single outgoing edges, ``invoke`` and ``stream`` in
+``updates`` mode) so the multi-agent engine can run without importing
+``langgraph``.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+from typing import Any, Callable, Dict, Iterator, Mapping, Tuple
+
+END = "__end__"
+
+GRAPH_BACKENDS = ("auto", "langgraph", "builtin")
+GRAPH_BACKEND = os.getenv("AGENT_GRAPH_BACKEND", "auto").lower()
+
+Node = Callable[[Dict[str, Any]], Mapping[str, Any] | None]
+
+
+class StateGraph:
+    """Builder for a chain of nodes, each with at most one successor."""
+
+    def __init__(self, state_schema: Any = None) -> None:
+        self.state_schema = state_schema
+        self.nodes: Dict[str, Node] = {}
+        self.edges: Dict[str, str] = {}
+        self.entry_point: str | None = None
+
+    def add_node(self, name: str, node: Node) -> None:
+        if name in self.nodes or name == END:
+            raise ValueError(f"Node '{name}' is already defined")
+        self.nodes[name] = node
+
+    def add_edge(self, source: str, target: str) -> None:
+        if source in self.edges:
+            raise ValueError(f"Node '{source}' already has an outgoing edge; branches are not supported")
+        self.edges[source] = target
+
+    def set_entry_point(self, name: str) -> None:
+        self.entry_point = name
+
+    def compile(self) -> "CompiledGraph":
+        if self.entry_point is None:
+            raise ValueError("Graph has no entry point")
+        order = []
+        current = self.entry_point
+        while current != END:
+            if current not in self.nodes:
+                raise ValueError(f"Edge points at unknown node '{current}'")
+            if current in order:
+                raise ValueError(f"Cycle detected at node '{current}'")
+            order.append(current)
+            if current not in self.edges:
+                raise ValueError(f"Node '{current}' has no outgoing edge to END")
+            current = self.edges[current]
+        return CompiledGraph(tuple((name, self.nodes[name]) for name in order))
+
+
+class CompiledGraph:
+    """Runs nodes in order, merging each returned update into the state."""
+
+    def __init__(self, steps: Tuple[Tuple[str, Node], ...]) -> None:
+        self.steps = steps
+
+    def stream(self, state: Mapping[str, Any], stream_mode: str = "updates") -> Iterator[Dict[str, Any]]:
+        if stream_mode != "updates":
+            raise ValueError("The built-in graph runner only supports stream_mode='updates'")
+        current = dict(state)
+        for name, node in self.steps:
+            update = dict(node(current) or {})
+            current.update(update)
+            yield {name: update}
+
+    def invoke(self, state: Mapping[str, Any]) -> Dict[str, Any]:
+        current = dict(state)
+        for update in self.stream(current):
+            for payload in update.values():
+                current.update(payload)
+        return current
+
+
+def resolve_graph_backend(backend: str = GRAPH_BACKEND) -> str:
+    """Pick ``langgraph`` or ``builtin``; ``auto`` uses LangGraph only when installed."""
+
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(f"Unknown graph backend '{backend}'. Choices: {', '.join(GRAPH_BACKENDS)}")
+    if backend == "auto":
+        return "langgraph" if importlib.util.find_spec("langgraph") is not None else "builtin"
+    return backend
+
+
+def load_state_graph(backend: str = GRAPH_BACKEND):
+    """Return ``(StateGraph, END)`` for the selected backend, importing lazily."""
+
+    if resolve_graph_backend(backend) == "langgraph":
+        from langgraph.graph import END as LANGGRAPH_END
+        from langgraph.graph import StateGraph as LangGraphStateGraph
+
+        return LangGraphStateGraph, LANGGRAPH_END
+    return StateGraph, END
+
+
+__all__ = [
+    "END",
+    "GRAPH_BACKEND",
+    "GRAPH_BACKENDS",
+    "CompiledGraph",
+    "StateGraph",
+    "load_state_graph",
+    "resolve_graph_backend",
+]
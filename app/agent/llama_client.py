@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import json
 import os
+import socket
+import threading
+import time
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Any, Iterable, List
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from .cancellation import CancelToken, raise_if_cancelled
+from .llm_slots import LLM_SLOTS
+from .metrics import observe_llm_call
 from .simple_messages import BaseMessage
 
 from .pipeline_utils import debug_log_messages, serialize_message
@@ -22,6 +30,51 @@ class LlamaServerConfig:
     timeout: int = int(os.getenv("LLAMA_SERVER_TIMEOUT", "300"))
     stop: List[str] = ("<END-OF-CODE>",)
     ignore_eos: bool = True
+    cache_prompt: bool = os.getenv("LLAMA_SERVER_CACHE_PROMPT", "0").lower() in ("1", "true", "yes")
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """Transport adapter whose connections can be shut down from another thread.
+
+    ``post(stream=True)`` only returns once llama-server starts streaming,
+    i.e. after prompt processing, so closing the response cannot interrupt
+    prefill. Shutting the socket down wakes the blocked read at any point.
+    """
+
+    def __init__(self) -> None:
+        self._connections: List[Any] = []
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        track = self._track
+        # urllib3 creates every connection through the pool's ``_new_conn``.
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(
+                pool_cls.__name__,
+                (pool_cls,),
+                {"_new_conn": lambda pool, base=pool_cls: track(base._new_conn(pool))},
+            )
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def _track(self, connection: Any) -> Any:
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def abort(self) -> None:
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
 class LlamaServerClient:
@@ -33,20 +86,144 @@ class LlamaServerClient:
         print("[llama] max_tokens =", self.config.max_tokens)  # Debug helper line
 
 
-    def chat(self, messages: Iterable[BaseMessage]) -> str:
-        debug_log_messages(list(messages), header="llama chat")
+    def chat(
+        self,
+        messages: Iterable[BaseMessage],
+        cancel: CancelToken | None = None,
+        temperature: float | None = None,
+    ) -> str:
+        message_list = list(messages)
+        debug_log_messages(message_list, header="llama chat")
         payload = {
             "model": self.config.model,
-            "temperature": self.config.temperature,
+            "temperature": self.config.temperature if temperature is None else temperature,
             "max_tokens": self.config.max_tokens,
             "ignore_eos": self.config.ignore_eos,
             "stop": list(self.config.stop),
 
 
-            "cache_prompt": False,  # Do not reuse cached prompts from previous requests
+            "cache_prompt": self.config.cache_prompt,  # Off by default: no reuse across requests
             "n_keep": 0,            # Keep zero tokens in the KV cache
 
             
+            "messages": [serialize_message(msg) for msg in message_list],
+        }
+        with LLM_SLOTS.hold("llama", cancel):
+            if cancel is not None:
+                return self._chat_streaming(payload, cancel)
+            return self._chat_blocking(payload)
+
+    def _chat_blocking(self, payload: dict) -> str:
+        started = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{self.config.base_url.rstrip('/')}/v1/chat/completions",
+                json=payload,
+                timeout=self.config.timeout,
+            )
+            self._raise_for_status(response)
+            data = response.json()
+            content = data["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError) as exc:  # pragma: no cover - defensive
+            observe_llm_call("llama", 0.0, 0, outcome="error")
+            raise RuntimeError(f"Unexpected llama-server payload: {data}") from exc
+        except Exception:
+            observe_llm_call("llama", 0.0, 0, outcome="error")
+            raise
+        tokens = (data.get("usage") or {}).get("completion_tokens") or 0
+        observe_llm_call("llama", time.perf_counter() - started, tokens)
+        return content
+
+    def _chat_streaming(self, payload: dict, cancel: CancelToken) -> str:
+        """Stream the completion so closing the socket frees the server slot."""
+
+        raise_if_cancelled(cancel)
+        started = time.perf_counter()
+        # A per-call session, so cancelling aborts this request's connection only.
+        adapter = _AbortableAdapter()
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        unregister = cancel.register(adapter.abort)
+        response = None
+        chunks: List[str] = []
+        outcome = "error"
+        try:
+            response = session.post(
+                f"{self.config.base_url.rstrip('/')}/v1/chat/completions",
+                json={**payload, "stream": True},
+                timeout=self.config.timeout,
+                stream=True,
+            )
+            self._raise_for_status(response)
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel.cancelled:
+                    break
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta") or {}
+                except (ValueError, KeyError, IndexError) as exc:  # pragma: no cover - defensive
+                    raise RuntimeError(f"Unexpected llama-server chunk: {data}") from exc
+                chunks.append(delta.get("content") or "")
+            outcome = "ok"
+        except (requests.RequestException, AttributeError, ValueError, OSError):
+            # An aborted socket surfaces as a connection error; report it as the cancel.
+            if not cancel.cancelled:
+                raise
+        finally:
+            unregister()
+            if response is not None:
+                response.close()
+            session.close()
+            # llama-server streams one token per chunk.
+            observe_llm_call(
+                "llama",
+                time.perf_counter() - started,
+                sum(1 for chunk in chunks if chunk),
+                outcome="cancelled" if cancel.cancelled else outcome,
+            )
+        raise_if_cancelled(cancel)
+        return "".join(chunks).strip()
+
+    def health(self) -> dict:
+        """Probe llama-server's /health endpoint; raises RuntimeError when unavailable."""
+
+        try:
+            response = requests.get(f"{self.config.base_url.rstrip('/')}/health", timeout=5)
+        except requests.RequestException as exc:
+            raise RuntimeError(f"llama-server unreachable at {self.config.base_url}: {exc}") from exc
+        self._raise_for_status(response)
+        try:
+            return response.json()
+        except ValueError:
+            return {"status": response.text.strip() or "ok"}
+
+    def total_slots(self) -> int:
+        """Parallel slots reported by llama-server's /props (its ``--parallel`` setting)."""
+
+        try:
+            response = requests.get(f"{self.config.base_url.rstrip('/')}/props", timeout=5)
+        except requests.RequestException as exc:
+            raise RuntimeError(f"llama-server unreachable at {self.config.base_url}: {exc}") from exc
+        self._raise_for_status(response)
+        try:
+            return max(int(response.json().get("total_slots") or 1), 1)
+        except (ValueError, TypeError, AttributeError):
+            return 1
+
+    def prefill(self, messages: Iterable[BaseMessage]) -> bool:
+        """Warm the server's prompt cache with a shared prefix (needs cache_prompt)."""
+
+        if not self.config.cache_prompt:
+            return False
+        payload = {
+            "model": self.config.model,
+            "max_tokens": 1,
+            "cache_prompt": True,
             "messages": [serialize_message(msg) for msg in messages],
         }
         response = requests.post(
@@ -54,6 +231,11 @@ class LlamaServerClient:
             json=payload,
             timeout=self.config.timeout,
         )
+        self._raise_for_status(response)
+        return True
+
+    @staticmethod
+    def _raise_for_status(response) -> None:
         try:
             response.raise_for_status()
         except requests.HTTPError as exc:
@@ -61,11 +243,6 @@ class LlamaServerClient:
             raise RuntimeError(
                 f"llama-server HTTP {response.status_code}: {detail or 'no detail'}"
             ) from exc
-        data = response.json()
-        try:
-            return data["choices"][0]["message"]["content"].strip()
-        except (KeyError, IndexError) as exc:  # pragma: no cover - defensive
-            raise RuntimeError(f"Unexpected llama-server payload: {data}") from exc
 
 
 __all__ = ["LlamaServerClient", "LlamaServerConfig"]
@@ -0,0 +1,91 @@
+"""Process-wide cap on concurrent LLM calls, per backend.
+
+llama-server serves a fixed number of parallel slots; requests beyond that
+queue inside the server where they cannot be cancelled or observed. Both
+chat clients take a slot here first, so a caller running many pipelines at
+once (the benchmark runner, consensus sampling) never oversubscribes the
+backend. Backends are limited independently, so hosted API calls never wait
+behind local ones. ``LLM_MAX_CONCURRENCY=0`` (the default) leaves calls
+unlimited.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .metrics import METRICS
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+
+_SLOT_POLL_SEC = 0.05
+
+CALLS_BUSY = METRICS.gauge(
+    "agent_llm_calls_busy", "LLM calls holding a concurrency slot.", ("backend",)
+)
+CALLS_LIMIT = METRICS.gauge(
+    "agent_llm_calls_limit", "LLM call concurrency cap (0 = unlimited).", ("backend",)
+)
+SLOT_WAIT_SECONDS = METRICS.histogram(
+    "agent_llm_slot_wait_seconds", "Time spent waiting for a free LLM call slot.", ("backend",)
+)
+
+
+class CallSlots:
+    """Bounded semaphores around LLM calls that give up when the caller is cancelled."""
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENCY) -> None:
+        self._default = max(limit, 0)
+        self._limits: Dict[str, int] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore | None] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limit: int, backend: str | None = None) -> None:
+        """Set the cap for ``backend`` (or every backend); call before LLM traffic starts."""
+
+        with self._lock:
+            if backend is None:
+                self._default = max(limit, 0)
+                self._limits.clear()
+                self._slots.clear()
+            else:
+                self._limits[backend] = max(limit, 0)
+                self._slots.pop(backend, None)
+
+    def limit(self, backend: str) -> int:
+        return self._limits.get(backend, self._default)
+
+    def _semaphore(self, backend: str) -> threading.BoundedSemaphore | None:
+        with self._lock:
+            if backend not in self._slots:
+                limit = self.limit(backend)
+                self._slots[backend] = threading.BoundedSemaphore(limit) if limit else None
+                CALLS_LIMIT.set(backend, value=limit)
+            return self._slots[backend]
+
+    @contextmanager
+    def hold(self, backend: str, cancel: CancelToken | None = None) -> Iterator[None]:
+        slots = self._semaphore(backend)
+        if slots is None:
+            yield
+            return
+        started = time.perf_counter()
+        while not slots.acquire(timeout=_SLOT_POLL_SEC):
+            raise_if_cancelled(cancel)
+        SLOT_WAIT_SECONDS.observe(backend, value=time.perf_counter() - started)
+        CALLS_BUSY.inc(backend)
+        try:
+            yield
+        finally:
+            CALLS_BUSY.dec(backend)
+            slots.release()
+
+
+LLM_SLOTS = CallSlots()
+
+
+__all__ = ["CallSlots", "LLM_MAX_CONCURRENCY", "LLM_SLOTS"]
@@ -0,0 +1,321 @@
+"""In-process metrics registry rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects guarded by one lock
+per metric, so recording a sample costs a dict lookup and an addition.
+Values that already live elsewhere (queue depth, store sizes, cache stats)
+are read by callbacks at scrape time instead of being mirrored on every
+change.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request and pipeline-stage latencies span milliseconds (static files) to minutes (LLM runs).
+LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250)
+
+LabelValues = Tuple[str, ...]
+CallbackValue = Union[float, Mapping[LabelValues, float]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(value) for value in labels)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum.
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {cumulative}"
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose value is read from ``fn`` at scrape time.
+
+    ``fn`` returns a number, or a mapping of label-value tuples to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], CallbackValue],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self) -> Iterable[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        items = sorted(value.items()) if isinstance(value, Mapping) else [((), value)]
+        for key, number in items:
+            yield f"{self.name}{_labels(self.label_names, key)} {_format_value(float(number))}"
+
+
+class RecentWindow:
+    """The last ``size`` observations per key, for quantiles over recent traffic.
+
+    Histograms accumulate since process start; load decisions need what is
+    happening now, so this keeps a short, time-bounded sample instead.
+    """
+
+    def __init__(self, size: int = 64, max_age_sec: float = 120.0) -> None:
+        self.size = size
+        self.max_age_sec = max_age_sec
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, value: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.size)
+            samples.append((time.monotonic(), value))
+
+    def quantile(self, key: str, q: float) -> float:
+        """``q``-quantile of samples younger than ``max_age_sec``; 0 without samples."""
+
+        cutoff = time.monotonic() - self.max_age_sec
+        with self._lock:
+            values = sorted(value for stamp, value in self._samples.get(key, ()) if stamp >= cutoff)
+        if not values:
+            return 0.0
+        return values[min(max(math.ceil(q * len(values)) - 1, 0), len(values) - 1)]
+
+
+class MetricsRegistry:
+    """Named collection of metrics; defining a name twice returns the existing metric."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _define(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and type(existing) is type(metric):
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._define(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._define(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._define(Histogram(name, help_text, labels, buckets))
+
+    def callback(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], CallbackValue],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        """Register (or replace) a metric computed on every scrape."""
+
+        metric = CallbackMetric(name, help_text, fn, labels, kind)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+LLM_CALLS = METRICS.counter(
+    "agent_llm_calls_total", "LLM chat calls by backend and outcome.", ("backend", "outcome")
+)
+LLM_SECONDS = METRICS.histogram(
+    "agent_llm_call_duration_seconds", "Wall time of completed LLM chat calls.", ("backend",)
+)
+LLM_TOKENS = METRICS.counter(
+    "agent_llm_completion_tokens_total", "Completion tokens generated.", ("backend",)
+)
+LLM_TOKENS_PER_SEC = METRICS.histogram(
+    "agent_llm_tokens_per_second",
+    "Completion tokens per second of wall time, per call.",
+    ("backend",),
+    buckets=THROUGHPUT_BUCKETS,
+)
+
+
+# Per-backend latency of recent LLM calls; read by the server's load policy.
+LLM_RECENT_SECONDS = RecentWindow()
+
+
+def observe_llm_call(backend: str, elapsed_sec: float, tokens: int, outcome: str = "ok") -> None:
+    LLM_CALLS.inc(backend, outcome)
+    if outcome != "ok":
+        return
+    LLM_SECONDS.observe(backend, value=elapsed_sec)
+    LLM_RECENT_SECONDS.observe(backend, elapsed_sec)
+    if tokens:
+        LLM_TOKENS.inc(backend, amount=tokens)
+        if elapsed_sec > 0:
+            LLM_TOKENS_PER_SEC.observe(backend, value=tokens / elapsed_sec)
+
+
+def hit_ratio(stats: Mapping[str, Mapping[str, float]]) -> Dict[LabelValues, float]:
+    """``{cache: {"hits": h, "misses": m}}`` -> ``{(cache,): h / (h + m)}``."""
+
+    ratios: Dict[LabelValues, float] = {}
+    for cache, counts in stats.items():
+        total = counts.get("hits", 0) + counts.get("misses", 0)
+        ratios[(cache,)] = counts.get("hits", 0) / total if total else 0.0
+    return ratios
+
+
+__all__ = [
+    "CONTENT_TYPE",
+    "LATENCY_BUCKETS",
+    "LLM_RECENT_SECONDS",
+    "METRICS",
+    "CallbackMetric",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "RecentWindow",
+    "hit_ratio",
+    "observe_llm_call",
+]
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from typing import Dict, List, TypedDict
+from typing import Any, Dict, List, TypedDict
 
 from .simple_messages import BaseMessage, HumanMessage, SystemMessage
-from langgraph.graph import END, StateGraph
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .graph_runner import GRAPH_BACKEND, load_state_graph, resolve_graph_backend
 
 from .pipeline_utils import (
     CODER1_SYSTEM_PROMPT,
@@ -21,10 +23,15 @@ class AgentState(TypedDict, total=False):
     draft1: str
     draft2: str
     final: str
+    cancel: Any
 
 
 class LangGraphAgent:
-    """Three-stage coder pipeline (coder1 → coder2 → coder3)."""
+    """Three-stage coder pipeline (coder1 → coder2 → coder3).
+
+    ``graph_backend`` selects LangGraph or the built-in sequential runner
+    (``AGENT_GRAPH_BACKEND``); both emit the same node updates.
+    """
 
     def __init__(
         self,
@@ -32,14 +39,17 @@ class LangGraphAgent:
         coder1_prompt: str = CODER1_SYSTEM_PROMPT,
         coder2_prompt: str = CODER2_SYSTEM_PROMPT,
         coder3_prompt: str = CODER3_SYSTEM_PROMPT,
+        graph_backend: str = GRAPH_BACKEND,
     ) -> None:
         self.client = client
         self.coder1_prompt = coder1_prompt
         self.coder2_prompt = coder2_prompt
         self.coder3_prompt = coder3_prompt
+        self.graph_backend = resolve_graph_backend(graph_backend)
         self.graph = self._build_graph()
 
     def _build_graph(self):
+        StateGraph, END = load_state_graph(self.graph_backend)
         workflow = StateGraph(AgentState)
         workflow.add_node("coder1", self._coder1)
         workflow.add_node("coder2", self._coder2)
@@ -50,6 +60,11 @@ class LangGraphAgent:
         workflow.add_edge("coder3", END)
         return workflow.compile()
 
+    def _chat(self, state: AgentState, prompts: List[BaseMessage]) -> str:
+        cancel = state.get("cancel")
+        raise_if_cancelled(cancel)
+        return self.client.chat(prompts, cancel=cancel)
+
     def _coder1(self, state: AgentState):
         dialogue = dialogue_transcript(state["messages"])
         prompts = [
@@ -84,7 +99,7 @@ User requirements and dialogue:
 
 Provide the first solution."""),
         ]
-        draft1 = self.client.chat(prompts)
+        draft1 = self._chat(state, prompts)
         return {"draft1": draft1}
 
     def _coder2(self, state: AgentState):
@@ -145,7 +160,7 @@ Verify the code above and rewrite a better complete solution if needed."""
                 )
             ),
         ]
-        draft2 = self.client.chat(prompts)
+        draft2 = self._chat(state, prompts)
         return {"draft2": draft2}
 
     def _coder3(self, state: AgentState):
@@ -229,11 +244,14 @@ Use the information above to deliver the final verification/refactoring result."
                 )
             ),
         ]
-        final = self.client.chat(prompts)
+        final = self._chat(state, prompts)
         return {"final": final}
 
     def _initial_state(
-        self, message: str, history: List[Dict[str, str]] | None = None
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        cancel: CancelToken | None = None,
     ) -> AgentState:
         conversation = build_conversation(history, message)
         return {
@@ -241,10 +259,16 @@ Use the information above to deliver the final verification/refactoring result."
             "draft1": "",
             "draft2": "",
             "final": "",
+            "cancel": cancel,
         }
 
-    def run(self, message: str, history: List[Dict[str, str]] | None = None) -> Dict[str, str]:
-        initial_state = self._initial_state(message, history)
+    def run(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        cancel: CancelToken | None = None,
+    ) -> Dict[str, str]:
+        initial_state = self._initial_state(message, history, cancel)
         result = self.graph.invoke(initial_state)
 
         draft1 = (result.get("draft1") or "").strip()
@@ -256,8 +280,13 @@ Use the information above to deliver the final verification/refactoring result."
 
         return {"headline": headline, "body": content}
 
-    def stream(self, message: str, history: List[Dict[str, str]] | None = None):
-        initial_state = self._initial_state(message, history)
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        cancel: CancelToken | None = None,
+    ):
+        initial_state = self._initial_state(message, history, cancel)
         draft1 = ""
         draft2 = ""
         final = ""
@@ -281,7 +310,12 @@ Use the information above to deliver the final verification/refactoring result."
                         yield {"stage": "coder3", "content": final}
         headline, _ = extract_headline(final or draft2 or draft1)
         body = render_response(headline, draft1, draft2, final)
-        yield {"stage": "complete", "headline": headline, "content": body}
+        yield {
+            "stage": "complete",
+            "headline": headline,
+            "content": body,
+            "body": final or draft2 or draft1,
+        }
 
 
 __all__ = ["LangGraphAgent", "AgentState"]
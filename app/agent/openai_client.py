@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import os
+import time
 from dataclasses import dataclass
 from typing import Iterable, List, Sequence
 
 from openai import OpenAI
 
+from .cancellation import CancelToken, raise_if_cancelled
+from .llm_slots import LLM_SLOTS
+from .metrics import observe_llm_call
 from .simple_messages import BaseMessage
 from .pipeline_utils import debug_log_messages, serialize_message
 
@@ -29,6 +33,12 @@ class OpenAIClientConfig:
         os.getenv("OPENAI_MAX_COMPLETION_TOKENS", os.getenv("OPENAI_MAX_TOKENS", "2048"))
     )
 
+
+def _output_tokens(response) -> int:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "output_tokens", 0) or 0
+
+
 class OpenAIChatClient:
     """Minimal chat-completions client so we can swap backends easily."""
 
@@ -38,38 +48,122 @@ class OpenAIChatClient:
             raise RuntimeError("OPENAI_API_KEY is required for API-based engines.")
         self.client = OpenAI(api_key=self.config.api_key, base_url=self.config.base_url)
 
-    def chat(self, messages: Iterable[BaseMessage]) -> str:
+    @property
+    def supports_temperature(self) -> bool:
+        """Whether per-call ``temperature`` overrides reach the model (see ``_request_kwargs``)."""
+
+        return self.config.temperature is not None
+
+    def chat(
+        self,
+        messages: Iterable[BaseMessage],
+        cancel: CancelToken | None = None,
+        temperature: float | None = None,
+    ) -> str:
         message_list = list(messages)
         debug_log_messages(message_list, header="openai chat")
         serialized = [serialize_message(msg) for msg in message_list]
 
-
-        return self._call_chat_endpoint(serialized)
+        with LLM_SLOTS.hold("openai", cancel):
+            if cancel is not None:
+                return self._call_streaming_endpoint(serialized, cancel, temperature)
+            return self._call_chat_endpoint(serialized, temperature)
 
     # ---------- chat.completions ----------
 
-    def _call_chat_endpoint(self, serialized_messages: Sequence[dict]) -> str:
+    def _request_kwargs(
+        self, serialized_messages: Sequence[dict], temperature: float | None = None
+    ) -> dict:
         kwargs = {
             "model": self.config.model,
-            "input": serialized_messages, 
+            "input": serialized_messages,
         }
-        
-
+        # Only models configured with OPENAI_TEMPERATURE accept the parameter,
+        # so per-call overrides are ignored when no base temperature is set.
         if self.config.temperature is not None:
-            kwargs["temperature"] = self.config.temperature
-
-
-        response = self.client.responses.create(**kwargs)
+            kwargs["temperature"] = (
+                self.config.temperature if temperature is None else temperature
+            )
+        return kwargs
+
+    def _call_streaming_endpoint(
+        self,
+        serialized_messages: Sequence[dict],
+        cancel: CancelToken,
+        temperature: float | None = None,
+    ) -> str:
+        """Stream output deltas so a cancelled request is closed mid-generation."""
+
+        raise_if_cancelled(cancel)
+        started = time.perf_counter()
+        stream = self.client.responses.create(
+            **self._request_kwargs(serialized_messages, temperature), stream=True
+        )
+        unregister = cancel.register(stream.close)
+        chunks: List[str] = []
+        tokens = 0
+        outcome = "error"
+        try:
+            for event in stream:
+                if cancel.cancelled:
+                    break
+                event_type = getattr(event, "type", "")
+                if event_type == "response.output_text.delta":
+                    chunks.append(event.delta)
+                elif event_type == "response.completed":
+                    tokens = _output_tokens(getattr(event, "response", None))
+            outcome = "ok"
+        except Exception:
+            if not cancel.cancelled:
+                raise
+        finally:
+            unregister()
+            stream.close()
+            observe_llm_call(
+                "openai",
+                time.perf_counter() - started,
+                tokens or len(chunks),
+                outcome="cancelled" if cancel.cancelled else outcome,
+            )
+        raise_if_cancelled(cancel)
+        return "".join(chunks).strip()
+
+    def _call_chat_endpoint(
+        self, serialized_messages: Sequence[dict], temperature: float | None = None
+    ) -> str:
+        started = time.perf_counter()
+        try:
+            response = self.client.responses.create(
+                **self._request_kwargs(serialized_messages, temperature)
+            )
+        except Exception:
+            observe_llm_call("openai", 0.0, 0, outcome="error")
+            raise
 
         try:
 
             content = response.output_text
         except (AttributeError, IndexError) as exc:  
+            observe_llm_call("openai", 0.0, 0, outcome="error")
             raise RuntimeError("Unexpected OpenAI payload: {}".format(response)) from exc
 
+        observe_llm_call("openai", time.perf_counter() - started, _output_tokens(response))
         return content.strip()
 
 
+    def health(self) -> dict:
+        """Check that the configured model is reachable with the current key."""
+
+        try:
+            model = self.client.models.retrieve(self.config.model)
+        except Exception as exc:
+            raise RuntimeError(f"OpenAI model '{self.config.model}' unavailable: {exc}") from exc
+        return {"status": "ok", "model": getattr(model, "id", self.config.model)}
+
+    def prefill(self, _messages: Iterable[BaseMessage]) -> bool:
+        # Prompt caching is automatic on the hosted API; nothing to warm.
+        return False
+
     def _use_responses_api(self) -> bool:
         lowered = self.config.model.lower()
 
@@ -0,0 +1,214 @@
+"""Parse and apply model-written edits (SEARCH/REPLACE blocks or unified diffs)."""
+
+from __future__ import annotations
+
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+REPAIR_MODES = ("rewrite", "diff")
+REPAIR_MODE = os.getenv("AGENT_REPAIR_MODE", "rewrite").lower()
+PATCH_FUZZ_RATIO = float(os.getenv("AGENT_PATCH_FUZZ_RATIO", "0.85"))
+
+SEARCH_REPLACE_RE = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(?P<search>.*?)^={5,9}[^\n]*\n(?P<replace>.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.DOTALL | re.MULTILINE,
+)
+DIFF_BLOCK_RE = re.compile(r"```(?:diff|patch|udiff)[^\n]*\n(?P<diff>.*?)```", re.DOTALL)
+HUNK_HEADER_RE = re.compile(r"^@@[^@]*@@")
+
+SEARCH_REPLACE_INSTRUCTIONS = """
+Reply with a one-paragraph diagnosis followed by SEARCH/REPLACE edits against the previous code:
+<<<<<<< SEARCH
+(lines copied exactly from the previous code)
+=======
+(replacement lines)
+>>>>>>> REPLACE
+- Use as many edits as needed; keep each SEARCH section short but unique.
+- Do NOT resend unchanged code; this overrides the full-rewrite rule for this round.
+""".strip()
+
+
+class PatchError(ValueError):
+    """Raised when an edit cannot be located in the source."""
+
+
+@dataclass(slots=True)
+class Edit:
+    search: str
+    replace: str
+
+
+def parse_search_replace(text: str) -> List[Edit]:
+    return [
+        Edit(search=match.group("search"), replace=match.group("replace"))
+        for match in SEARCH_REPLACE_RE.finditer(text)
+    ]
+
+
+def parse_unified_diff(text: str) -> List[Edit]:
+    """Turn each hunk of a unified diff into a context-anchored edit."""
+
+    edits: List[Edit] = []
+    search: List[str] = []
+    replace: List[str] = []
+    in_hunk = False
+
+    def flush() -> None:
+        if search or replace:
+            edits.append(Edit(search="".join(search), replace="".join(replace)))
+        search.clear()
+        replace.clear()
+
+    for line in text.splitlines(keepends=True):
+        if HUNK_HEADER_RE.match(line):
+            flush()
+            in_hunk = True
+            continue
+        if line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            flush()
+            in_hunk = False
+            continue
+        if not in_hunk:
+            continue
+        body = line[1:] if line[:1] in (" ", "-", "+") else line
+        if line.startswith("-"):
+            search.append(body)
+        elif line.startswith("+"):
+            replace.append(body)
+        elif line.startswith("\\"):
+            continue
+        else:
+            search.append(body)
+            replace.append(body)
+    flush()
+    return [edit for edit in edits if edit.search.strip() or edit.replace.strip()]
+
+
+def extract_edits(reply: str) -> List[Edit]:
+    edits = parse_search_replace(reply)
+    if edits:
+        return edits
+    for match in DIFF_BLOCK_RE.finditer(reply):
+        edits.extend(parse_unified_diff(match.group("diff")))
+    return edits
+
+
+def strip_edits(reply: str) -> str:
+    """Remove edit blocks from a reply, leaving the model's explanation."""
+
+    text = SEARCH_REPLACE_RE.sub("", reply)
+    text = DIFF_BLOCK_RE.sub("", text)
+    return text.replace("<END-OF-CODE>", "").strip()
+
+
+def _fuzzy_locate(lines: Sequence[str], target: Sequence[str], ratio: float) -> Optional[int]:
+    size = len(target)
+    if not size or size > len(lines):
+        return None
+    wanted = "\n".join(line.strip() for line in target)
+    best_index, best_ratio = None, ratio
+    for index in range(len(lines) - size + 1):
+        window = "\n".join(line.strip() for line in lines[index : index + size])
+        score = difflib.SequenceMatcher(None, wanted, window, autojunk=False).ratio()
+        if score >= best_ratio:
+            best_index, best_ratio = index, score
+    return best_index
+
+
+def _find_whole_lines(source: str, search: str) -> Optional[int]:
+    """Offset of the first exact occurrence of ``search`` spanning whole lines."""
+
+    start = source.find(search)
+    while start != -1:
+        end = start + len(search)
+        at_line_start = start == 0 or source[start - 1] == "\n"
+        at_line_end = search.endswith("\n") or end == len(source) or source[end] == "\n"
+        if at_line_start and at_line_end:
+            return start
+        start = source.find(search, start + 1)
+    return None
+
+
+def _indent_of(lines: Sequence[str]) -> str:
+    for line in lines:
+        if line.strip():
+            return line[: len(line) - len(line.lstrip())]
+    return ""
+
+
+def _reindent(replace: str, indent: str) -> str:
+    """Shift ``replace`` so its first non-blank line sits at ``indent``, keeping relative indents."""
+
+    lines = replace.splitlines(keepends=True)
+    base = len(_indent_of(lines))
+    shifted = []
+    for line in lines:
+        if not line.strip():
+            shifted.append(line)
+            continue
+        own = len(line) - len(line.lstrip())
+        shifted.append(indent + line[min(own, base) :])
+    return "".join(shifted)
+
+
+def apply_edit(source: str, edit: Edit, fuzz_ratio: float = PATCH_FUZZ_RATIO) -> str:
+    """Apply one edit: exact whole-line match, then whitespace-insensitive, then fuzzy lines.
+
+    An exact match must start and end on line boundaries, so an unindented
+    SEARCH never lands inside an indented line or a longer name. Looser
+    matches re-indent REPLACE to the indentation of the matched lines.
+    """
+
+    if not edit.search.strip():
+        if edit.replace.strip():
+            return source.rstrip("\n") + "\n" + edit.replace
+        raise PatchError("empty edit")
+    offset = _find_whole_lines(source, edit.search)
+    if offset is not None:
+        return source[:offset] + edit.replace + source[offset + len(edit.search) :]
+
+    lines = source.splitlines(keepends=True)
+    target = edit.search.splitlines(keepends=True)
+    stripped = [line.strip() for line in lines]
+    wanted = [line.strip() for line in target]
+    start = None
+    for index in range(len(lines) - len(target) + 1):
+        if stripped[index : index + len(target)] == wanted:
+            start = index
+            break
+    if start is None:
+        start = _fuzzy_locate(lines, target, fuzz_ratio)
+    if start is None:
+        first = next((line.strip() for line in target if line.strip()), "")
+        raise PatchError(f"could not locate SEARCH text starting with: {first[:80]!r}")
+    replacement = _reindent(edit.replace, _indent_of(lines[start : start + len(target)]))
+    if replacement and not replacement.endswith("\n") and start + len(target) < len(lines):
+        replacement += "\n"
+    return "".join(lines[:start]) + replacement + "".join(lines[start + len(target) :])
+
+
+def apply_edits(source: str, edits: Sequence[Edit], fuzz_ratio: float = PATCH_FUZZ_RATIO) -> str:
+    if not edits:
+        raise PatchError("reply contained no edits")
+    patched = source
+    for edit in edits:
+        patched = apply_edit(patched, edit, fuzz_ratio)
+    return patched
+
+
+__all__ = [
+    "REPAIR_MODE",
+    "REPAIR_MODES",
+    "SEARCH_REPLACE_INSTRUCTIONS",
+    "Edit",
+    "PatchError",
+    "apply_edit",
+    "apply_edits",
+    "extract_edits",
+    "parse_search_replace",
+    "parse_unified_diff",
+    "strip_edits",
+]
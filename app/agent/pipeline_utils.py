@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List, Tuple
+import time
+from typing import Any, Dict, List, Tuple
 
 from .simple_messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
@@ -55,6 +56,7 @@ You are a helpful Python coding assistant. Read the latest user message (plus an
 
 MAX_RECENT_TURNS = int(os.getenv("AGENT_RECENT_TURNS", "6"))
 SUMMARY_CHAR_LIMIT = int(os.getenv("AGENT_HISTORY_SUMMARY_CHARS", "1200"))
+STREAM_LOG_CHARS = int(os.getenv("AGENT_STREAM_LOG_CHARS", "600"))
 PROMPT_DEBUG = os.getenv("AGENT_PROMPT_DEBUG", "1").lower() not in ("0", "false", "no")
 
 
@@ -175,6 +177,20 @@ def extract_headline(markdown: str) -> Tuple[str, str]:
     return "AI Code Plan", markdown
 
 
+def timed_event(stage: str, started: float, **fields: Any) -> Dict[str, Any]:
+    """Build a stream event stamped with milliseconds elapsed since ``started``."""
+
+    event: Dict[str, Any] = {"stage": stage, **fields}
+    event["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return event
+
+
+def truncate_log(text: str, limit: int = STREAM_LOG_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return text[: limit - 3].rstrip() + "..."
+
+
 def render_response(headline: str, draft1: str, draft2: str, final: str) -> str:
     sections = [
         f"### {headline or 'AI Code Plan'}",
@@ -197,11 +213,14 @@ __all__ = [
     "SINGLE_AGENT_SYSTEM_PROMPT",
     "MAX_RECENT_TURNS",
     "SUMMARY_CHAR_LIMIT",
+    "STREAM_LOG_CHARS",
     "coerce_content",
     "serialize_message",
     "summarize_history",
     "build_conversation",
     "dialogue_transcript",
     "extract_headline",
+    "timed_event",
+    "truncate_log",
     "render_response",
 ]
@@ -0,0 +1,211 @@
+"""In-process static checks that run before a submission reaches a checker."""
+
+from __future__ import annotations
+
+import ast
+import os
+import re
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional
+
+PREFLIGHT_ENABLED = os.getenv("AGENT_PREFLIGHT", "1").lower() not in ("0", "false", "no")
+DEFAULT_BLOCKED_IMPORTS = "subprocess,socket,ctypes,multiprocessing,shutil,requests,urllib,http"
+BLOCKED_IMPORTS: FrozenSet[str] = frozenset(
+    name.strip()
+    for name in os.getenv("PREFLIGHT_BLOCKED_IMPORTS", DEFAULT_BLOCKED_IMPORTS).split(",")
+    if name.strip()
+)
+
+PROMPT_CODE_BLOCK_RE = re.compile(r"```(?:python|py)?[^\n]*\n(?P<code>.*?)```", re.DOTALL)
+DEF_LINE_RE = re.compile(r"^\s*def\s+\w+\s*\(.*?\)[^:\n]*:", re.MULTILINE | re.DOTALL)
+
+
+@dataclass(slots=True)
+class DeclaredSignature:
+    name: str
+    positional: List[str]
+    required_positional: int
+    keyword_only: List[str]
+    required_keyword_only: List[str]
+
+    def describe(self) -> str:
+        parts = list(self.positional)
+        if self.keyword_only:
+            parts.append("*")
+            parts.extend(self.keyword_only)
+        return f"{self.name}({', '.join(parts)})"
+
+
+@dataclass(slots=True)
+class PreflightResult:
+    ok: bool
+    diagnostics: List[str] = field(default_factory=list)
+
+    def report(self) -> str:
+        if self.ok:
+            return "preflight passed"
+        lines = ["Preflight rejected the submission before execution:"]
+        lines.extend(f"- {item}" for item in self.diagnostics)
+        return "\n".join(lines)
+
+
+def _signature_from_def(node: ast.FunctionDef | ast.AsyncFunctionDef) -> DeclaredSignature:
+    args = node.args
+    positional = [arg.arg for arg in [*args.posonlyargs, *args.args]]
+    required_positional = len(positional) - len(args.defaults)
+    keyword_only = [arg.arg for arg in args.kwonlyargs]
+    required_keyword_only = [
+        arg.arg
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults)
+        if default is None
+    ]
+    return DeclaredSignature(
+        name=node.name,
+        positional=positional,
+        required_positional=required_positional,
+        keyword_only=keyword_only,
+        required_keyword_only=required_keyword_only,
+    )
+
+
+def parse_declared_signature(prompt: str | None) -> Optional[DeclaredSignature]:
+    """Find the `def ...:` signature the task prompt asks the model to implement."""
+
+    if not prompt:
+        return None
+    candidates = [m.group("code") for m in PROMPT_CODE_BLOCK_RE.finditer(prompt)]
+    candidates.append(prompt)
+    for text in candidates:
+        for match in DEF_LINE_RE.finditer(text):
+            source = " ".join(match.group(0).split()) + "\n    pass\n"
+            try:
+                tree = ast.parse(source)
+            except SyntaxError:
+                continue
+            node = tree.body[0]
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                return _signature_from_def(node)
+    return None
+
+
+def _syntax_diagnostic(exc: SyntaxError, code: str) -> str:
+    location = f"line {exc.lineno}" if exc.lineno else "unknown line"
+    if exc.offset:
+        location += f", column {exc.offset}"
+    detail = f"{type(exc).__name__} at {location}: {exc.msg}"
+    lines = code.splitlines()
+    if exc.lineno and 0 < exc.lineno <= len(lines):
+        detail += f"\n    {lines[exc.lineno - 1].rstrip()}"
+    return detail
+
+
+def _blocked_import_diagnostics(tree: ast.AST, blocked: FrozenSet[str]) -> List[str]:
+    diagnostics: List[str] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            root = name.split(".", 1)[0]
+            if root in blocked:
+                diagnostics.append(
+                    f"line {node.lineno}: import of '{name}' is blocked by the sandbox policy "
+                    "(solve the task without it)"
+                )
+    return diagnostics
+
+
+def _find_entry_point(tree: ast.Module, name: str):
+    found = None
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+            found = node
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == name for target in node.targets
+        ):
+            found = node
+    return found
+
+
+def _arity_diagnostics(node: ast.FunctionDef | ast.AsyncFunctionDef, declared: DeclaredSignature) -> List[str]:
+    actual = _signature_from_def(node)
+    args = node.args
+    diagnostics: List[str] = []
+    declared_count = len(declared.positional)
+    accepts_varargs = args.vararg is not None
+    if actual.required_positional > declared_count:
+        diagnostics.append(
+            f"line {node.lineno}: {actual.describe()} requires {actual.required_positional} "
+            f"positional arguments but the task calls {declared.describe()} "
+            f"with {declared_count}"
+        )
+    elif declared_count > len(actual.positional) and not accepts_varargs:
+        diagnostics.append(
+            f"line {node.lineno}: {actual.describe()} accepts {len(actual.positional)} "
+            f"positional arguments but the task signature is {declared.describe()}"
+        )
+    accepts_kwargs = args.kwarg is not None
+    accepted_keywords = set(actual.keyword_only) | set(actual.positional)
+    for name in declared.keyword_only:
+        if name not in accepted_keywords and not accepts_kwargs:
+            diagnostics.append(
+                f"line {node.lineno}: {actual.describe()} does not accept keyword "
+                f"argument '{name}' required by {declared.describe()}"
+            )
+    for name in actual.required_keyword_only:
+        if name not in declared.keyword_only:
+            diagnostics.append(
+                f"line {node.lineno}: keyword-only argument '{name}' must have a default; "
+                f"the task signature is {declared.describe()}"
+            )
+    return diagnostics
+
+
+def preflight_check(
+    code: str,
+    prompt: str | None = None,
+    *,
+    entry_point: str | None = None,
+    blocked_imports: FrozenSet[str] | None = None,
+) -> PreflightResult:
+    """Parse, compile and statically validate ``code`` without executing it.
+
+    The required entry point defaults to the function declared in ``prompt``;
+    when neither is available only syntax and import checks are performed.
+    """
+
+    blocked = BLOCKED_IMPORTS if blocked_imports is None else blocked_imports
+    try:
+        tree = ast.parse(code, filename="<submission>")
+        compile(tree, "<submission>", "exec")
+    except SyntaxError as exc:
+        return PreflightResult(ok=False, diagnostics=[_syntax_diagnostic(exc, code)])
+    except ValueError as exc:
+        return PreflightResult(ok=False, diagnostics=[f"source could not be compiled: {exc}"])
+
+    diagnostics = _blocked_import_diagnostics(tree, blocked)
+
+    declared = parse_declared_signature(prompt)
+    name = entry_point or (declared.name if declared else None)
+    if name:
+        node = _find_entry_point(tree, name)
+        if node is None:
+            hint = f" with signature {declared.describe()}" if declared else ""
+            diagnostics.append(f"missing top-level function '{name}'{hint}")
+        elif declared and name == declared.name and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            diagnostics.extend(_arity_diagnostics(node, declared))
+
+    return PreflightResult(ok=not diagnostics, diagnostics=diagnostics)
+
+
+__all__ = [
+    "PREFLIGHT_ENABLED",
+    "BLOCKED_IMPORTS",
+    "DeclaredSignature",
+    "PreflightResult",
+    "parse_declared_signature",
+    "preflight_check",
+]
@@ -0,0 +1,140 @@
+"""Subprocess helpers for running checkers and self-tests on generated code."""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Sequence, Tuple
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .metrics import METRICS
+
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "0")) or None
+SANDBOX_MAX_PROCS = int(os.getenv("SANDBOX_MAX_PROCS", "0")) or (os.cpu_count() or 2)
+
+_PROC_SLOTS = threading.BoundedSemaphore(SANDBOX_MAX_PROCS)
+_SLOT_POLL_SEC = 0.05
+
+PROCS_BUSY = METRICS.gauge("agent_sandbox_procs_busy", "Checker/self-test subprocesses running.")
+PROCS_LIMIT = METRICS.gauge("agent_sandbox_procs_limit", "Checker pool size (SANDBOX_MAX_PROCS).")
+PROCS_LIMIT.set(value=SANDBOX_MAX_PROCS)
+SLOT_WAIT_SECONDS = METRICS.histogram(
+    "agent_sandbox_slot_wait_seconds", "Time spent waiting for a free checker slot."
+)
+PROC_SECONDS = METRICS.histogram(
+    "agent_sandbox_proc_duration_seconds", "Checker subprocess wall time by outcome.", ("outcome",)
+)
+
+
+def configure_proc_slots(limit: int) -> None:
+    """Resize the checker pool; call before any checker runs."""
+
+    global _PROC_SLOTS
+    _PROC_SLOTS = threading.BoundedSemaphore(max(limit, 1))
+    PROCS_LIMIT.set(value=max(limit, 1))
+
+
+def _acquire_slot(cancel: CancelToken | None) -> None:
+    started = time.perf_counter()
+    while not _PROC_SLOTS.acquire(timeout=_SLOT_POLL_SEC):
+        raise_if_cancelled(cancel)
+    SLOT_WAIT_SECONDS.observe(value=time.perf_counter() - started)
+    PROCS_BUSY.inc()
+
+
+def _release_slot() -> None:
+    PROCS_BUSY.dec()
+    _PROC_SLOTS.release()
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        proc.kill()
+
+
+def run_python(
+    args: Sequence[str],
+    cancel: CancelToken | None = None,
+    timeout: float | None = SANDBOX_TIMEOUT,
+    empty_failure: str = "checker failed without output",
+) -> Tuple[bool, str]:
+    """Run ``python *args`` and return (success, combined output).
+
+    At most ``SANDBOX_MAX_PROCS`` children run at once across the process.
+    Each child gets its own process group so cancellation also kills anything
+    it spawned.
+    """
+
+    raise_if_cancelled(cancel)
+    _acquire_slot(cancel)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=os.name == "posix",
+        )
+        unregister = cancel.register(lambda: _kill_group(proc)) if cancel else (lambda: None)
+        try:
+            try:
+                stdout, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _kill_group(proc)
+                stdout, stderr = proc.communicate()
+                output = (stdout + stderr).strip()
+                outcome = "timeout"
+                return False, f"timed out after {timeout:g}s\n{output}".strip()
+        finally:
+            unregister()
+        outcome = "pass" if proc.returncode == 0 else "fail"
+    finally:
+        _release_slot()
+        PROC_SECONDS.observe(outcome, value=time.perf_counter() - started)
+    raise_if_cancelled(cancel)
+
+    output = (stdout + stderr).strip()
+    success = proc.returncode == 0
+    if not output:
+        output = "PASS" if success else empty_failure
+    return success, output
+
+
+def run_checker(
+    checker: Path,
+    code: str,
+    cancel: CancelToken | None = None,
+    prefix: str = "checker-",
+) -> Tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix=prefix) as tmpdir:
+        submission = Path(tmpdir) / "submission.py"
+        submission.write_text(code, encoding="utf-8")
+        return run_python([str(checker), str(submission)], cancel=cancel)
+
+
+def run_script(
+    source: str,
+    cancel: CancelToken | None = None,
+    prefix: str = "script-",
+    filename: str = "script.py",
+    empty_failure: str = "script failed without output",
+) -> Tuple[bool, str]:
+    with tempfile.TemporaryDirectory(prefix=prefix) as tmpdir:
+        script = Path(tmpdir) / filename
+        script.write_text(source, encoding="utf-8")
+        return run_python([str(script)], cancel=cancel, empty_failure=empty_failure)
+
+
+__all__ = ["SANDBOX_MAX_PROCS", "SANDBOX_TIMEOUT", "configure_proc_slots", "run_python", "run_checker", "run_script"]
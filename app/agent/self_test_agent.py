@@ -1,15 +1,32 @@
 from __future__ import annotations
 
 import re
-import subprocess
-import sys
-import tempfile
+import time
 from dataclasses import dataclass
-from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-from .pipeline_utils import SELF_TEST_SYSTEM_PROMPT, build_conversation, extract_headline
+from .cancellation import CancelToken, raise_if_cancelled
+from .patching import (
+    REPAIR_MODE,
+    REPAIR_MODES,
+    SEARCH_REPLACE_INSTRUCTIONS,
+    Edit,
+    PatchError,
+    apply_edit,
+    extract_edits,
+    strip_edits,
+)
+from .pipeline_utils import (
+    SELF_TEST_SYSTEM_PROMPT,
+    build_conversation,
+    extract_headline,
+    timed_event,
+    truncate_log,
+)
+from .preflight import PREFLIGHT_ENABLED, PreflightResult, preflight_check
+from .sandbox import run_script
 from .simple_messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .stagnation import StagnationDetector
 
 CODE_BLOCK_RE = re.compile(r"```(?P<lang>[^\n]*)\n(?P<code>.*?)```", re.DOTALL)
 MAX_ERROR_CHARS = 2000
@@ -45,24 +62,52 @@ def _extract_blocks(markdown: str) -> Optional[ParsedBlocks]:
     return None
 
 
-def _run_self_tests(solution: str, tests: str) -> Tuple[bool, str]:
-    with tempfile.TemporaryDirectory(prefix="selftest-") as tmpdir:
-        script = Path(tmpdir) / "submission_with_tests.py"
-        script.write_text(
-            "\n\n".join([solution, tests, "\nif __name__ == '__main__':\n    run_tests()\n"]),
-            encoding="utf-8",
-        )
-        proc = subprocess.run(
-            [sys.executable, str(script)],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        output = (proc.stdout + proc.stderr).strip()
-        success = proc.returncode == 0
-        if not output:
-            output = "PASS" if success else "self-tests failed without output"
-        return success, output
+def _preflight_blocks(blocks: ParsedBlocks, prompt: str, checked: bool) -> PreflightResult:
+    # Interactive prompts have no task checker: only syntax and the run_tests
+    # protocol apply, not the sandbox import policy or a signature from chat text.
+    blocked = None if checked else frozenset()
+    solution_check = preflight_check(
+        blocks.solution, prompt if checked else None, blocked_imports=blocked
+    )
+    tests_check = preflight_check(
+        "\n\n".join([blocks.solution, blocks.tests]),
+        entry_point="run_tests",
+        blocked_imports=blocked,
+    )
+    diagnostics = list(solution_check.diagnostics)
+    diagnostics.extend(
+        f"self-test block: {item}"
+        for item in tests_check.diagnostics
+        if item not in solution_check.diagnostics
+    )
+    return PreflightResult(ok=not diagnostics, diagnostics=diagnostics)
+
+
+def _run_self_tests(solution: str, tests: str, cancel: CancelToken | None = None) -> Tuple[bool, str]:
+    return run_script(
+        "\n\n".join([solution, tests, "\nif __name__ == '__main__':\n    run_tests()\n"]),
+        cancel=cancel,
+        prefix="selftest-",
+        filename="submission_with_tests.py",
+        empty_failure="self-tests failed without output",
+    )
+
+
+def _apply_block_edits(blocks: ParsedBlocks, edits: List[Edit]) -> ParsedBlocks:
+    """Apply each edit to whichever block contains its SEARCH text."""
+
+    if not edits:
+        raise PatchError("reply contained no edits")
+    solution, tests = blocks.solution, blocks.tests
+    for edit in edits:
+        if edit.search and edit.search not in solution and edit.search in tests:
+            tests = apply_edit(tests, edit)
+            continue
+        try:
+            solution = apply_edit(solution, edit)
+        except PatchError:
+            tests = apply_edit(tests, edit)
+    return ParsedBlocks(solution=solution, tests=tests)
 
 
 def _truncate(text: str, limit: int = MAX_ERROR_CHARS) -> str:
@@ -74,9 +119,27 @@ def _truncate(text: str, limit: int = MAX_ERROR_CHARS) -> str:
 class SelfTestAgent:
     """Generate solution + tests, run them, retry with feedback (max_attempts)."""
 
-    def __init__(self, client, max_attempts: int = 3) -> None:
+    def __init__(self, client, max_attempts: int = 3, repair_mode: str = REPAIR_MODE) -> None:
+        if repair_mode not in REPAIR_MODES:
+            raise ValueError(f"Unknown repair mode '{repair_mode}'. Choices: {', '.join(REPAIR_MODES)}")
         self.client = client
         self.max_attempts = max_attempts
+        self.repair_mode = repair_mode
+
+    def _patch_failure_prompt(self, user_prompt: str, blocks: ParsedBlocks, error: str, attempt: int) -> str:
+        remaining = max(self.max_attempts - attempt, 0)
+        return (
+            f"Attempt {attempt} failed when running your self-tests.\n\n"
+            f"[Task]\n{user_prompt.strip()}\n\n"
+            f"[Solution Block]\n```python\n{blocks.solution}\n```\n\n"
+            f"[Self-Test Block]\n```python\n{blocks.tests}\n```\n\n"
+            f"[Test Run Output]\n{_truncate(error)}\n\n"
+            "Fix the solution and/or the tests so they are correct and non-flaky. "
+            "Edits may target either block.\n"
+            f"{SEARCH_REPLACE_INSTRUCTIONS}\n"
+            "- End with <END-OF-CODE>.\n"
+            f"- Remaining retries after this: {remaining}.\n"
+        )
 
     def _failure_prompt(self, user_prompt: str, blocks: ParsedBlocks | None, error: str, attempt: int, last_reply: str = "") -> str:
         remaining = max(self.max_attempts - attempt, 0)
@@ -110,50 +173,218 @@ class SelfTestAgent:
             )
         return base
 
+    def _stagnation_prompt(self, user_prompt: str, blocks: ParsedBlocks | None, error: str, attempt: int) -> str:
+        remaining = max(self.max_attempts - attempt, 0)
+        sol = blocks.solution if blocks is not None else "(no solution block parsed)"
+        return (
+            f"Your revisions keep failing the same way (attempt {attempt}).\n\n"
+            f"[Task]\n{user_prompt.strip()}\n\n"
+            f"[Rejected Solution]\n```python\n{sol}\n```\n\n"
+            f"[Recurring Test Run Output]\n{_truncate(error)}\n\n"
+            "Start over: re-read the task, pick a different algorithm or structure, and write "
+            "fresh tests derived only from the task statement.\n"
+            "- Output format: short explanation, then two Python code blocks (solution first, tests second with run_tests()).\n"
+            "- End with <END-OF-CODE>.\n"
+            f"- Remaining retries after this: {remaining}.\n"
+        )
+
     def run(
         self,
         message: str,
         history: List[Dict[str, str]] | None = None,
         task=None,
+        cancel: CancelToken | None = None,
     ) -> Dict[str, str]:
+        result: Dict[str, str] = {}
+        for event in self.stream(message, history=history, task=task, cancel=cancel):
+            if event["stage"] == "complete":
+                result = {"headline": event["headline"], "body": event["content"]}
+        return result
 
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        task=None,
+        cancel: CancelToken | None = None,
+    ):
+        """Yield progress events for every attempt, ending with ``complete``."""
+
+        started = time.perf_counter()
         prompts: List[BaseMessage] = [SystemMessage(content=SELF_TEST_SYSTEM_PROMPT)]
         prompts.extend(build_conversation(history, message))
 
         final_reply = ""
+        success = False
+        attempts = 0
+        stagnation = StagnationDetector(
+            temperature_control=getattr(self.client, "supports_temperature", True)
+        )
+        base_temperature = getattr(getattr(self.client, "config", None), "temperature", None)
+        temperature: float | None = None
+        stop_reason: str | None = None
+        patch_base: ParsedBlocks | None = None
 
         for attempt in range(1, self.max_attempts + 1):
-            reply = self.client.chat(prompts).strip()
+            raise_if_cancelled(cancel)
+            attempts = attempt
+            yield timed_event(
+                "attempt",
+                started,
+                attempt=attempt,
+                max_attempts=self.max_attempts,
+                content=f"Attempt {attempt}/{self.max_attempts}: generating solution and tests",
+            )
+            llm_started = time.perf_counter()
+            reply = self.client.chat(prompts, cancel=cancel, temperature=temperature).strip()
+            llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+            repair = "rewrite"
+            if patch_base is not None:
+                try:
+                    blocks = _apply_block_edits(patch_base, extract_edits(reply))
+                except PatchError as exc:
+                    blocks = _extract_blocks(strip_edits(reply))
+                    if blocks is None:
+                        yield timed_event(
+                            "patch_failed",
+                            started,
+                            attempt=attempt,
+                            llm_ms=llm_ms,
+                            content=f"Patch did not apply ({exc}); requesting a full rewrite",
+                        )
+                        prompts.append(AIMessage(content=reply))
+                        prompts.append(
+                            HumanMessage(
+                                content=(
+                                    f"Your edits could not be applied ({exc}). Resend BOTH full "
+                                    "Python code blocks (solution first, tests second with "
+                                    "run_tests()) and end with <END-OF-CODE>."
+                                )
+                            )
+                        )
+                        llm_started = time.perf_counter()
+                        reply = self.client.chat(
+                            prompts, cancel=cancel, temperature=temperature
+                        ).strip()
+                        llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+                        blocks = _extract_blocks(reply)
+                else:
+                    repair = "patch"
+                    reply = (
+                        f"{strip_edits(reply)}\n\n```python\n{blocks.solution}\n```\n\n"
+                        f"```python\n{blocks.tests}\n```\n<END-OF-CODE>"
+                    ).strip()
+                patch_base = None
+            else:
+                blocks = _extract_blocks(reply)
             final_reply = reply
-            blocks = _extract_blocks(reply)
+            yield timed_event(
+                "candidate",
+                started,
+                attempt=attempt,
+                llm_ms=llm_ms,
+                code_found=blocks is not None,
+                repair=repair,
+                content=reply,
+            )
+
+            preflight = (
+                _preflight_blocks(blocks, message, checked=getattr(task, "checker", None) is not None)
+                if blocks and PREFLIGHT_ENABLED
+                else None
+            )
 
-            if blocks:
-                success, output = _run_self_tests(blocks.solution, blocks.tests)
+            checker_ms = 0.0
+            if preflight is not None and not preflight.ok:
+                success, output = False, preflight.report()
+            elif blocks:
+                yield timed_event(
+                    "checker_start",
+                    started,
+                    attempt=attempt,
+                    content=f"Attempt {attempt}: running self-tests",
+                )
+                checker_started = time.perf_counter()
+                success, output = _run_self_tests(blocks.solution, blocks.tests, cancel=cancel)
+                checker_ms = round((time.perf_counter() - checker_started) * 1000, 1)
             else:
                 success, output = False, "Expected two Python code blocks (solution + self-tests) but could not parse them."
 
+            yield timed_event(
+                "checker_result",
+                started,
+                attempt=attempt,
+                success=success,
+                checker_ms=checker_ms,
+                content=truncate_log(output),
+            )
+
             if success:
                 break
 
-            prompts.append(AIMessage(content=reply))
-            prompts.append(
-                HumanMessage(
-                    content=self._failure_prompt(
-                        message,
-                        blocks,
-                        output,
-                        attempt,
-                        last_reply=reply,
+            reaction = "continue"
+            if attempt < self.max_attempts and stagnation.enabled:
+                candidate = "\n\n".join([blocks.solution, blocks.tests]) if blocks else None
+                reason = stagnation.observe(attempt, candidate, output)
+                if reason:
+                    reaction = stagnation.react()
+                    yield timed_event(
+                        "stagnation",
+                        started,
+                        attempt=attempt,
+                        reason=reason,
+                        reaction=reaction,
+                        content=f"Repair loop stalled ({reason}); reaction: {reaction}",
                     )
+                    if reaction == "stop":
+                        stop_reason = reason
+                        break
+                    temperature = stagnation.temperature(base_temperature)
+
+            if reaction == "reprompt":
+                prompts = [SystemMessage(content=SELF_TEST_SYSTEM_PROMPT)]
+                prompts.extend(build_conversation(history, message))
+                prompts.append(
+                    HumanMessage(content=self._stagnation_prompt(message, blocks, output, attempt))
+                )
+            elif self.repair_mode == "diff" and blocks is not None:
+                prompts.append(AIMessage(content=reply))
+                prompts.append(
+                    HumanMessage(content=self._patch_failure_prompt(message, blocks, output, attempt))
+                )
+                patch_base = blocks
+            else:
+                prompts.append(AIMessage(content=reply))
+                prompts.append(
+                    HumanMessage(
+                        content=self._failure_prompt(
+                            message,
+                            blocks,
+                            output,
+                            attempt,
+                            last_reply=reply,
+                        )
+                    )
+                )
+            if attempt < self.max_attempts:
+                yield timed_event(
+                    "retry",
+                    started,
+                    attempt=attempt,
+                    remaining=self.max_attempts - attempt,
+                    content=f"Retrying with self-test feedback ({self.max_attempts - attempt} left)",
                 )
-            )
 
         headline, _ = extract_headline(final_reply)
-        return {"headline": headline, "body": final_reply}
-
-    def stream(self, message: str, history: List[Dict[str, str]] | None = None, task=None):
-        result = self.run(message, history=history, task=task)
-        yield {"stage": "complete", "headline": result["headline"], "content": result["body"]}
+        yield timed_event(
+            "complete",
+            started,
+            headline=headline,
+            content=final_reply,
+            attempts=attempts,
+            success=success,
+            stopped_early=stop_reason,
+        )
 
 
 __all__ = ["SelfTestAgent"]
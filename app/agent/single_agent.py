@@ -4,6 +4,7 @@ from __future__ import annotations
 
 from typing import Dict, List
 
+from .cancellation import CancelToken
 from .simple_messages import SystemMessage
 
 from .pipeline_utils import (
@@ -41,15 +42,25 @@ class SingleShotAgent:
         self.client = client
         self.system_prompt = system_prompt
 
-    def run(self, message: str, history: List[Dict[str, str]] | None = None) -> Dict[str, str]:
+    def run(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        cancel: CancelToken | None = None,
+    ) -> Dict[str, str]:
         conversation = build_conversation(history, f"""{SINGLE_AGENT_PROMPT}\n\n{message}""")
         prompts = [SystemMessage(content=self.system_prompt), *conversation]
-        final = self.client.chat(prompts).strip()
+        final = self.client.chat(prompts, cancel=cancel).strip()
         headline, _ = extract_headline(final)
         return {"headline": headline, "body": final}
 
-    def stream(self, message: str, history: List[Dict[str, str]] | None = None):
-        response = self.run(message, history)
+    def stream(
+        self,
+        message: str,
+        history: List[Dict[str, str]] | None = None,
+        cancel: CancelToken | None = None,
+    ):
+        response = self.run(message, history, cancel=cancel)
         yield {"stage": "complete", "headline": response["headline"], "content": response["body"]}
 
 
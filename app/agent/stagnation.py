@@ -0,0 +1,154 @@
+"""Detect repair loops that stopped making progress."""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional
+
+STAGNATION_REACTIONS = ("stop", "temperature", "reprompt")
+STAGNATION_POLICY = [
+    item.strip()
+    for item in os.getenv("AGENT_STAGNATION_POLICY", "temperature,stop").split(",")
+    if item.strip() in STAGNATION_REACTIONS
+]
+STAGNATION_ERROR_REPEATS = int(os.getenv("AGENT_STAGNATION_ERROR_REPEATS", "2"))
+STAGNATION_TEMPERATURE_STEP = float(os.getenv("AGENT_STAGNATION_TEMPERATURE_STEP", "0.4"))
+STAGNATION_TEMPERATURE_MAX = float(os.getenv("AGENT_STAGNATION_TEMPERATURE_MAX", "1.2"))
+
+_PATH_RE = re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.\-]+)+[\\/]?")
+_HEX_RE = re.compile(r"0x[0-9a-fA-F]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+class _StripDocstrings(ast.NodeTransformer):
+    def _strip(self, node):
+        self.generic_visit(node)
+        body = getattr(node, "body", None)
+        if (
+            body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            node.body = body[1:] or [ast.Pass()]
+        return node
+
+    visit_Module = _strip
+    visit_FunctionDef = _strip
+    visit_AsyncFunctionDef = _strip
+    visit_ClassDef = _strip
+
+
+def code_fingerprint(code: str | None) -> str:
+    """Hash of the normalized AST, so formatting/comment-only edits collide."""
+
+    if not code:
+        return ""
+    try:
+        tree = _StripDocstrings().visit(ast.parse(code))
+        normalized = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    except (SyntaxError, ValueError):
+        normalized = " ".join(code.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def error_fingerprint(output: str | None) -> str:
+    """Hash of checker output with paths, addresses and numbers masked."""
+
+    if not output:
+        return ""
+    text = _PATH_RE.sub("<path>", output)
+    text = _HEX_RE.sub("<addr>", text)
+    text = _NUMBER_RE.sub("N", text)
+    normalized = " ".join(text.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class StagnationDetector:
+    """Track attempt fingerprints and pick a reaction when the loop stalls.
+
+    A loop is stagnant when a candidate repeats any earlier candidate (a
+    cycle) or when the checker reports the same failure signature
+    ``error_repeats`` times in a row. Each detection consumes the next entry
+    of ``policy``; the last entry is reused once the list is exhausted.
+    Clients that ignore per-call temperatures pass ``temperature_control=False``
+    so the policy skips the ``temperature`` reaction instead of wasting an attempt.
+    """
+
+    def __init__(
+        self,
+        policy: List[str] | None = None,
+        error_repeats: int = STAGNATION_ERROR_REPEATS,
+        temperature_step: float = STAGNATION_TEMPERATURE_STEP,
+        temperature_max: float = STAGNATION_TEMPERATURE_MAX,
+        temperature_control: bool = True,
+    ) -> None:
+        self.policy = [
+            reaction
+            for reaction in (STAGNATION_POLICY if policy is None else policy)
+            if temperature_control or reaction != "temperature"
+        ]
+        self.error_repeats = max(error_repeats, 2)
+        self.temperature_step = temperature_step
+        self.temperature_max = temperature_max
+        self._code_seen: Dict[str, int] = {}
+        self._last_error = ""
+        self._error_streak = 0
+        self._reactions_used = 0
+        self._temperature_boosts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.policy)
+
+    def observe(self, attempt: int, code: str | None, output: str) -> Optional[str]:
+        """Record a failed attempt; return a reason string if the loop stalled."""
+
+        reason = None
+        code_hash = code_fingerprint(code)
+        if code_hash and code_hash in self._code_seen:
+            reason = (
+                f"attempt {attempt} repeated the candidate from attempt "
+                f"{self._code_seen[code_hash]}"
+            )
+        elif code_hash:
+            self._code_seen[code_hash] = attempt
+
+        error_hash = error_fingerprint(output)
+        if error_hash and error_hash == self._last_error:
+            self._error_streak += 1
+        else:
+            self._last_error = error_hash
+            self._error_streak = 1
+        if reason is None and self._error_streak >= self.error_repeats:
+            reason = f"the same failure signature was reported {self._error_streak} times in a row"
+        return reason
+
+    def react(self) -> str:
+        if not self.policy:
+            return "continue"
+        reaction = self.policy[min(self._reactions_used, len(self.policy) - 1)]
+        self._reactions_used += 1
+        if reaction == "temperature":
+            self._temperature_boosts += 1
+        return reaction
+
+    def temperature(self, base: float | None) -> float | None:
+        """Temperature override for the next call, or None to keep the client default."""
+
+        if not self._temperature_boosts:
+            return None
+        boosted = (base or 0.0) + self.temperature_step * self._temperature_boosts
+        return min(boosted, self.temperature_max)
+
+
+__all__ = [
+    "STAGNATION_POLICY",
+    "STAGNATION_REACTIONS",
+    "StagnationDetector",
+    "code_fingerprint",
+    "error_fingerprint",
+]
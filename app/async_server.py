@@ -0,0 +1,719 @@
+"""Asyncio HTTP/1.1 server with admission control for agent runs.
+
+Serves the same routes as ``server.py``. Agent executions are bounded by a
+fixed concurrency pool. Requests beyond that wait in a FIFO queue of limited
+depth, and a saturated queue answers ``429 Too Many Requests`` with
+``Retry-After``. JSON and static routes keep connections alive; SSE streams
+close the connection when the pipeline completes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from agent.cancellation import AgentCancelled, CancelToken
+from agent.metrics import METRICS
+from runs import PipelineRun
+from service import (
+    ASSETS,
+    JOB_PATH_RE,
+    METRICS_CONTENT_TYPE,
+    SSE_HEARTBEAT,
+    SSE_HEARTBEAT_SEC,
+    SSE_STREAMS,
+    WS_CONNECTIONS,
+    AgentChannel,
+    RequestError,
+    cached_reply,
+    cancel_job,
+    create_session,
+    execute_turn,
+    final_event,
+    get_job,
+    job_event_start,
+    join_run,
+    observe_request,
+    pending_jobs,
+    prepare_turn,
+    render_metrics,
+    resume_run,
+    sse_frame,
+    sse_preamble,
+    submit_job,
+)
+from static_assets import API_CACHE_CONTROL, AssetCache
+from supervisor import LIFECYCLE, WORKER_GRACE_SEC
+from ws_protocol import CLOSE_GOING_AWAY, HandshakeError, ServerProtocol, accept_handshake, handshake_response
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "2"))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "8"))
+KEEPALIVE_TIMEOUT_SEC = float(os.getenv("AGENT_KEEPALIVE_SEC", "15"))
+# Seed for the run-duration average behind Retry-After until real runs finish.
+RETRY_AFTER_SEED_SEC = float(os.getenv("AGENT_RETRY_AFTER_SEED_SEC", "20"))
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+_EWMA_ALPHA = 0.2
+
+
+class Saturated(Exception):
+    """Raised when both the concurrency pool and its wait queue are full."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"server busy; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionPool:
+    """Concurrency limit with a bounded FIFO wait queue.
+
+    A released slot is handed directly to the oldest waiter, so queued
+    requests are admitted strictly in arrival order.
+    """
+
+    def __init__(self, concurrency: int = AGENT_MAX_CONCURRENCY, max_queue: int = AGENT_MAX_QUEUE) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_run_sec = RETRY_AFTER_SEED_SEC
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up."""
+
+        waves = (self.queued + 1) / self.concurrency
+        return max(1, math.ceil(self._avg_run_sec * waves))
+
+    async def acquire(self) -> None:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Saturated(self.retry_after())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before cancellation; pass it on.
+                self.release()
+            raise
+
+    def release(self, elapsed_sec: float | None = None) -> None:
+        if elapsed_sec is not None:
+            self._avg_run_sec += _EWMA_ALPHA * (elapsed_sec - self._avg_run_sec)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, cancel: CancelToken | None = None) -> AsyncIterator[None]:
+        """Hold a slot for the block; a fired ``cancel`` abandons the wait."""
+
+        loop = asyncio.get_running_loop()
+        acquiring = asyncio.ensure_future(self.acquire())
+        unregister = (
+            cancel.register(lambda: loop.call_soon_threadsafe(acquiring.cancel))
+            if cancel
+            else (lambda: None)
+        )
+        try:
+            await acquiring
+        except asyncio.CancelledError:
+            if cancel is not None and cancel.cancelled:
+                raise AgentCancelled(cancel.reason) from None
+            raise
+        finally:
+            unregister()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+        }
+
+
+@dataclass(slots=True)
+class Request:
+    method: str
+    target: str
+    version: str
+    headers: Dict[str, str]
+    body: bytes = b""
+    path: str = ""
+    query: Dict[str, List[str]] = field(default_factory=dict)
+    # Set by the agent handlers once the turn is resolved; labels request metrics.
+    engine: str = ""
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> Dict[str, Any]:
+        try:
+            payload = json.loads(self.body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return {}
+        return payload if isinstance(payload, dict) else {}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Connection:
+    """One client connection; buffers bytes read while watching for disconnects."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.buffer = bytearray()
+        self.eof = False
+        self.status: int | None = None
+
+    async def _fill(self) -> bool:
+        chunk = await self.reader.read(65536)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer.extend(chunk)
+        return True
+
+    async def read_request(self) -> Request | None:
+        while b"\r\n\r\n" not in self.buffer:
+            if len(self.buffer) > MAX_HEADER_BYTES:
+                raise BadRequest("request headers too large")
+            if self.eof or not await self._fill():
+                if self.buffer.strip():
+                    raise BadRequest("incomplete request")
+                return None
+        head, _, rest = bytes(self.buffer).partition(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise BadRequest("malformed request line") from None
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise BadRequest("invalid Content-Length") from None
+        if length < 0 or length > MAX_BODY_BYTES:
+            raise BadRequest("request body too large")
+        self.buffer = bytearray(rest)
+        while len(self.buffer) < length:
+            if self.eof or not await self._fill():
+                raise BadRequest("incomplete request body")
+        body = bytes(self.buffer[:length])
+        del self.buffer[:length]
+        parsed = urlparse(target)
+        return Request(
+            method=method.upper(),
+            target=target,
+            version=version.strip(),
+            headers=headers,
+            body=body,
+            path=parsed.path,
+            query=parse_qs(parsed.query or ""),
+        )
+
+    async def watch_disconnect(self, token: CancelToken) -> None:
+        """Cancel ``token`` when the peer closes; pipelined bytes stay buffered."""
+
+        while not self.eof and not token.cancelled:
+            if not await self._fill():
+                token.cancel("client disconnected")
+
+    async def send(
+        self,
+        status: HTTPStatus,
+        headers: Iterable[Tuple[str, str]],
+        body: bytes = b"",
+        keep_alive: bool = True,
+        head_only: bool = False,
+        streaming: bool = False,
+    ) -> None:
+        self.status = status.value
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if not streaming and status != HTTPStatus.NOT_MODIFIED:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        if keep_alive:
+            lines.append(f"Keep-Alive: timeout={int(KEEPALIVE_TIMEOUT_SEC)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body and not head_only:
+            self.writer.write(body)
+        await self.writer.drain()
+
+    async def send_json(
+        self,
+        payload: Dict[str, Any],
+        status: HTTPStatus = HTTPStatus.OK,
+        keep_alive: bool = True,
+        extra_headers: Iterable[Tuple[str, str]] = (),
+    ) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        headers = [("Content-Type", "application/json"), ("Cache-Control", API_CACHE_CONTROL), *extra_headers]
+        await self.send(status, headers, data, keep_alive=keep_alive)
+
+
+class AgentServer:
+    def __init__(
+        self,
+        pool: AdmissionPool | None = None,
+        assets: AssetCache = ASSETS,
+    ) -> None:
+        self.pool = pool or AdmissionPool()
+        self.assets = assets
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.pool.concurrency, thread_name_prefix="agent-run"
+        )
+        METRICS.callback("agent_admission_active", "Agent runs holding an admission slot.", lambda: self.pool.active)
+        METRICS.callback("agent_admission_queued", "Agent runs waiting for an admission slot.", lambda: self.pool.queued)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        conn = Connection(reader, writer)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(conn.read_request(), KEEPALIVE_TIMEOUT_SEC)
+                except asyncio.TimeoutError:
+                    break
+                except BadRequest as exc:
+                    await conn.send_json({"error": str(exc)}, HTTPStatus.BAD_REQUEST, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                started = time.perf_counter()
+                conn.status = None
+                LIFECYCLE.request_started()
+                try:
+                    keep_alive = await self.dispatch(conn, request)
+                finally:
+                    LIFECYCLE.request_finished()
+                    observe_request(request.path, request.engine, conn.status, time.perf_counter() - started)
+                if LIFECYCLE.retiring.is_set():
+                    break
+                if not keep_alive or conn.eof:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+    async def dispatch(self, conn: Connection, request: Request) -> bool:
+        """Handle one request; returns whether the connection may be reused."""
+
+        keep_alive = request.keep_alive
+        if request.method == "POST" and request.path == "/api/session":
+            # Session, job and turn setup may touch sqlite; keep it off the loop.
+            session = await asyncio.to_thread(create_session, request.json())
+            await conn.send_json(session, keep_alive=keep_alive)
+            return keep_alive
+        if request.method == "POST" and request.path == "/api/agent":
+            return await self._handle_agent(conn, request)
+        if request.method == "GET" and request.path == "/api/agent-stream":
+            await self._handle_agent_stream(conn, request)
+            return False
+        if request.method == "POST" and request.path == "/api/jobs":
+            return await self._handle_job_submit(conn, request)
+        if request.path == "/api/ws":
+            await self._handle_websocket(conn, request)
+            return False
+        match = JOB_PATH_RE.match(request.path)
+        if match is not None and request.method in ("GET", "DELETE"):
+            return await self._handle_job(conn, request, match.group("job_id"), bool(match.group("events")))
+        if request.method == "GET" and request.path == "/metrics":
+            await conn.send(
+                HTTPStatus.OK,
+                [("Content-Type", METRICS_CONTENT_TYPE), ("Cache-Control", "no-store")],
+                render_metrics(),
+                keep_alive=keep_alive,
+            )
+            return keep_alive
+        if request.method in ("GET", "HEAD"):
+            await self._serve_static(conn, request)
+            return keep_alive
+        await conn.send_json({"error": "Route not found"}, HTTPStatus.NOT_FOUND, keep_alive=keep_alive)
+        return keep_alive
+
+    async def _busy(self, conn: Connection, exc: Saturated, keep_alive: bool) -> None:
+        await conn.send_json(
+            {"error": "Server busy", "retryAfter": exc.retry_after, **self.pool.snapshot()},
+            HTTPStatus.TOO_MANY_REQUESTS,
+            keep_alive=keep_alive,
+            extra_headers=[("Retry-After", str(exc.retry_after))],
+        )
+
+    async def _wait_turn(self, run: PipelineRun) -> None:
+        """Wait on the loop until earlier runs of the session finish; no thread is held."""
+
+        loop = asyncio.get_running_loop()
+        turn = asyncio.Event()
+        waiting = asyncio.ensure_future(turn.wait())
+        unregister_turn = run.on_turn(lambda: loop.call_soon_threadsafe(turn.set))
+        unregister_cancel = run.cancel.register(lambda: loop.call_soon_threadsafe(waiting.cancel))
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            if run.cancel.cancelled:
+                raise AgentCancelled(run.cancel.reason) from None
+            raise
+        finally:
+            unregister_turn()
+            unregister_cancel()
+        run.cancel.raise_if_cancelled()
+
+    async def _execute(self, run: PipelineRun, work: Callable[[PipelineRun], Any]) -> None:
+        """Leader side of a run: wait for the session's turn, then an admission slot."""
+
+        loop = asyncio.get_running_loop()
+        try:
+            await self._wait_turn(run)
+            async with self.pool.slot(run.cancel):
+                result = await loop.run_in_executor(self.executor, work, run)
+        except Exception as exc:
+            run.finish(error=exc)
+        else:
+            run.finish(result=result)
+
+    def _subscribe(
+        self, run: PipelineRun, cancel: CancelToken, start: int = 0, detach: bool = True
+    ) -> asyncio.Queue:
+        """Queue fed with ``(seq, event)`` after ``start``, then ``None`` at the end or on disconnect."""
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def forward(seq: int, event: Dict[str, Any] | None) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, None if event is None else (seq, event))
+
+        cancel.register(run.listen(forward, start))
+        cancel.register(lambda: loop.call_soon_threadsafe(queue.put_nowait, None))
+        if detach:
+            cancel.register(run.detach)
+        return queue
+
+    async def _handle_job_submit(self, conn: Connection, request: Request) -> bool:
+        keep_alive = request.keep_alive
+        try:
+            job = await asyncio.to_thread(submit_job, request.json())
+        except RequestError as exc:
+            await conn.send_json(exc.payload(), exc.status, keep_alive=keep_alive)
+            return keep_alive
+        request.engine = job["engine"]
+        await conn.send_json(job, HTTPStatus.ACCEPTED, keep_alive=keep_alive)
+        return keep_alive
+
+    async def _handle_job(self, conn: Connection, request: Request, job_id: str, events: bool) -> bool:
+        keep_alive = request.keep_alive
+        try:
+            if request.method == "DELETE":
+                if events:
+                    raise RequestError("Route not found", HTTPStatus.NOT_FOUND)
+                payload = await asyncio.to_thread(cancel_job, job_id)
+                request.engine = payload["engine"]
+                await conn.send_json(payload, keep_alive=keep_alive)
+                return keep_alive
+            job = await asyncio.to_thread(get_job, job_id)
+        except RequestError as exc:
+            await conn.send_json(exc.payload(), exc.status, keep_alive=keep_alive)
+            return keep_alive
+        request.engine = job.run.key.engine
+        if not events:
+            await conn.send_json(job.describe(), keep_alive=keep_alive)
+            return keep_alive
+        # Job streams only observe: a disconnect never cancels the job.
+        start = job_event_start(job, request.headers.get("last-event-id"))
+        await self._stream_run(conn, job.run, start, detach=False)
+        return False
+
+    async def _handle_agent(self, conn: Connection, request: Request) -> bool:
+        keep_alive = request.keep_alive
+        payload = request.json()
+        try:
+            turn = await asyncio.to_thread(
+                prepare_turn, payload.get("sessionId"), payload.get("message"), payload.get("engine")
+            )
+        except RequestError as exc:
+            await conn.send_json(exc.payload(), exc.status, keep_alive=keep_alive)
+            return keep_alive
+
+        request.engine = turn.engine_name
+        cached = await asyncio.to_thread(cached_reply, turn)
+        if cached is not None:
+            await conn.send_json(cached, keep_alive=keep_alive)
+            return keep_alive
+        run, leader = join_run(turn)
+        if leader:
+            asyncio.ensure_future(self._execute(run, lambda run: execute_turn(turn, run)))
+        cancel = CancelToken()
+        watcher = asyncio.ensure_future(conn.watch_disconnect(cancel))
+        queue = self._subscribe(run, cancel)
+        try:
+            while await queue.get() is not None:
+                pass
+        finally:
+            watcher.cancel()
+        if cancel.cancelled or isinstance(run.error, AgentCancelled):
+            return False
+        if isinstance(run.error, Saturated):
+            await self._busy(conn, run.error, keep_alive)
+        elif isinstance(run.error, RequestError):
+            await conn.send_json(run.error.payload(), run.error.status, keep_alive=keep_alive)
+        elif run.error is not None:
+            await conn.send_json(
+                {"error": f"Agent failed: {run.error}"},
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                keep_alive=keep_alive,
+            )
+        else:
+            await conn.send_json(run.result, keep_alive=keep_alive)
+        return keep_alive
+
+    async def _handle_agent_stream(self, conn: Connection, request: Request) -> None:
+        try:
+            turn = await asyncio.to_thread(
+                prepare_turn,
+                (request.query.get("sessionId") or [""])[0],
+                (request.query.get("message") or [""])[0],
+                (request.query.get("engine") or [""])[0],
+            )
+        except RequestError as exc:
+            await conn.send_json(exc.payload(), exc.status, keep_alive=False)
+            return
+
+        request.engine = turn.engine_name
+        resumed = resume_run(turn, request.headers.get("last-event-id"))
+        if resumed is not None:
+            run, start = resumed
+        else:
+            run, leader = join_run(turn)
+            start = 0
+            if leader:
+                asyncio.ensure_future(self._execute(run, lambda run: execute_turn(turn, run)))
+        await self._stream_run(conn, run, start)
+
+    async def _handle_websocket(self, conn: Connection, request: Request) -> None:
+        loop = asyncio.get_running_loop()
+        protocol = ServerProtocol()
+        outbox: asyncio.Queue = asyncio.Queue()
+
+        def send(message: Dict[str, Any]) -> None:
+            loop.call_soon_threadsafe(outbox.put_nowait, protocol.text(json.dumps(message)))
+
+        def start(run: PipelineRun, work: Callable[[PipelineRun], Any]) -> None:
+            # Runs go through the admission pool like every other agent request.
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._execute(run, work)))
+
+        try:
+            accept = accept_handshake(request.method, request.headers)
+            channel = await asyncio.to_thread(AgentChannel, (request.query.get("sessionId") or [""])[0], send, start)
+        except HandshakeError as exc:
+            await conn.send_json({"error": str(exc)}, HTTPStatus(exc.status), keep_alive=False)
+            return
+        except RequestError as exc:
+            await conn.send_json(exc.payload(), exc.status, keep_alive=False)
+            return
+
+        conn.status = HTTPStatus.SWITCHING_PROTOCOLS.value
+        conn.writer.write(handshake_response(accept))
+        writer = asyncio.ensure_future(self._ws_writer(conn, protocol, channel, outbox))
+        WS_CONNECTIONS.inc()
+        data, conn.buffer = bytes(conn.buffer), bytearray()
+        try:
+            while not protocol.closed:
+                if not data:
+                    data = await conn.reader.read(65536)
+                    if not data:
+                        break
+                for text in protocol.receive(data):
+                    # Submissions may read sqlite; keep them off the event loop, in order.
+                    await asyncio.to_thread(channel.handle, text)
+                control = protocol.take_outgoing()
+                if control:
+                    outbox.put_nowait(control)
+                data = b""
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            channel.close()
+            outbox.put_nowait(None)
+            try:
+                await asyncio.wait_for(writer, SSE_HEARTBEAT_SEC)
+            except (asyncio.TimeoutError, ConnectionResetError, BrokenPipeError):
+                pass
+            WS_CONNECTIONS.dec()
+
+    async def _ws_writer(
+        self, conn: Connection, protocol: ServerProtocol, channel: AgentChannel, outbox: asyncio.Queue
+    ) -> None:
+        """Sole writer of a WebSocket: queued frames, pings while idle, and a close when the worker retires."""
+
+        while True:
+            try:
+                data = await asyncio.wait_for(outbox.get(), SSE_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                if protocol.closed:
+                    # Our close frame went unanswered; unblock the reader.
+                    conn.writer.close()
+                    return
+                if LIFECYCLE.retiring.is_set() and channel.idle:
+                    data = protocol.close(CLOSE_GOING_AWAY, "server restarting")
+                else:
+                    data = protocol.ping()
+            if data is None:
+                return
+            conn.writer.write(data)
+            await conn.writer.drain()
+
+    async def _stream_run(self, conn: Connection, run: PipelineRun, start: int, detach: bool = True) -> None:
+        """Send ``run``'s events after ``start`` as SSE; the connection closes afterwards."""
+
+        cancel = CancelToken()
+        watcher = asyncio.ensure_future(conn.watch_disconnect(cancel))
+        queue = self._subscribe(run, cancel, start, detach=detach)
+        headers_sent = False
+
+        async def send_headers() -> None:
+            nonlocal headers_sent
+            await conn.send(
+                HTTPStatus.OK,
+                [
+                    ("Content-Type", "text/event-stream; charset=utf-8"),
+                    ("Cache-Control", "no-store"),
+                ],
+                keep_alive=False,
+                streaming=True,
+            )
+            await _sse_send(conn, sse_preamble())
+            headers_sent = True
+            SSE_STREAMS.inc()
+
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    # Still queued or thinking: commit to 200 and keep the connection warm.
+                    if not headers_sent:
+                        await send_headers()
+                    await _sse_send(conn, SSE_HEARTBEAT)
+                    continue
+                if item is None:
+                    break
+                if not headers_sent:
+                    await send_headers()
+                seq, event = item
+                await _sse_send(conn, sse_frame(event, f"{run.run_id}:{seq}"))
+            # Headers wait for the first event so a saturated pool can still answer 429.
+            if not headers_sent and isinstance(run.error, Saturated):
+                await self._busy(conn, run.error, keep_alive=False)
+                return
+            if cancel.cancelled:
+                return
+            if not headers_sent:
+                await send_headers()
+            closing = final_event(run)
+            if closing is not None:
+                await _sse_send(conn, sse_frame(closing))
+        except (ConnectionResetError, BrokenPipeError):
+            cancel.cancel("client disconnected")
+        finally:
+            watcher.cancel()
+            if headers_sent:
+                SSE_STREAMS.dec()
+
+    async def _serve_static(self, conn: Connection, request: Request) -> None:
+        keep_alive = request.keep_alive
+        response = await asyncio.to_thread(
+            self.assets.respond,
+            request.path,
+            request.headers.get("if-none-match", ""),
+            request.headers.get("accept-encoding", ""),
+        )
+        if response is None:
+            await conn.send_json({"error": "File not found"}, HTTPStatus.NOT_FOUND, keep_alive=keep_alive)
+            return
+        await conn.send(
+            response.status,
+            response.headers,
+            response.body,
+            keep_alive=keep_alive,
+            head_only=request.method == "HEAD",
+        )
+
+
+async def _sse_send(conn: Connection, data: bytes) -> None:
+    conn.writer.write(data)
+    await conn.writer.drain()
+
+
+async def _serve(host: str, port: int, sock: socket.socket | None = None) -> None:
+    app = AgentServer()
+    if sock is None:
+        server = await asyncio.start_server(app.handle_connection, host, port)
+        print(
+            f"Agent UI running at http://{host}:{port} "
+            f"(async, {app.pool.concurrency} concurrent runs, queue {app.pool.max_queue})"
+        )
+    else:
+        server = await asyncio.start_server(app.handle_connection, sock=sock)
+    loop = asyncio.get_running_loop()
+    retired = asyncio.Event()
+    LIFECYCLE.start(lambda: loop.call_soon_threadsafe(retired.set))
+    async with server:
+        await retired.wait()
+        # Stop accepting, then let in-flight requests and local jobs finish.
+        server.close()
+        await asyncio.to_thread(LIFECYCLE.drain, WORKER_GRACE_SEC, pending_jobs)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, sock: socket.socket | None = None) -> None:
+    try:
+        asyncio.run(_serve(host, port, sock))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = ["AdmissionPool", "AgentServer", "Saturated", "serve"]
@@ -0,0 +1,360 @@
+"""Run a grid of benchmark configurations through one shared worker pool.
+
+A JSON spec lists engines × task files × models × repeats::
+
+    {
+      "engines": ["local-single", "local-multi", "api-single"],
+      "tasks": ["benchmarks/tasks.jsonl"],
+      "models": [null, "qwen2.5-coder-7b"],
+      "repeats": 1,
+      "label": "nightly",
+      "workers": {"local": "auto", "api": 4},
+      "output_dir": "results/nightly"
+    }
+
+Every combination is a cell with its own result file. Each backend gets
+its own worker budget, and jobs are queued round-robin across cells, so all
+cells advance together and neither backend sits idle while the other has a
+long queue. ``manifest.json`` in the output directory lists every cell with
+its file and score. Optional ``task_timeout`` and ``suite_budget`` (seconds)
+bound each task and the whole run as in ``run_bench.py``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from app.run_bench import (
+    BUDGET_EXHAUSTED,
+    ENGINE_MODULES,
+    TASK_TIMEOUT,
+    ResultWriter,
+    Task,
+    TaskOutput,
+    compact_results,
+    completed_task_ids,
+    configure_limits,
+    engine_backend,
+    load_agent,
+    load_tasks,
+    parse_shard,
+    resolve_workers,
+    run_captured,
+    run_task,
+    select_shard,
+)
+
+MANIFEST_NAME = "manifest.json"
+_SLUG_RE = re.compile(r"[^A-Za-z0-9.]+")
+
+
+@dataclass(slots=True)
+class MatrixSpec:
+    engines: List[str]
+    tasks: List[Path]
+    models: List[Optional[str]] = field(default_factory=lambda: [None])
+    repeats: int = 1
+    label: str = ""
+    limit: Optional[int] = None
+    workers: Dict[str, str] = field(default_factory=dict)
+    llm_concurrency: Optional[int] = None
+    checker_concurrency: Optional[int] = None
+    output_dir: Path = Path("results/matrix")
+    shard: Optional[Tuple[int, int]] = None
+    task_timeout: Optional[float] = None
+    suite_budget: Optional[float] = None
+
+
+def load_spec(path: Path) -> MatrixSpec:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    engines = list(data.get("engines") or [])
+    unknown = [engine for engine in engines if engine not in ENGINE_MODULES]
+    if not engines or unknown:
+        raise ValueError(
+            f"Matrix spec needs engines from: {', '.join(ENGINE_MODULES)} (got {unknown or 'none'})"
+        )
+    task_files = [Path(entry) for entry in data.get("tasks") or []]
+    if not task_files:
+        raise ValueError("Matrix spec needs at least one task file under 'tasks'")
+    return MatrixSpec(
+        engines=engines,
+        tasks=task_files,
+        models=list(data.get("models") or [None]),
+        repeats=max(int(data.get("repeats", 1)), 1),
+        label=str(data.get("label", "")),
+        limit=data.get("limit"),
+        workers={backend: str(value) for backend, value in (data.get("workers") or {}).items()},
+        llm_concurrency=data.get("llm_concurrency"),
+        checker_concurrency=data.get("checker_concurrency"),
+        output_dir=Path(data.get("output_dir", "results/matrix")),
+        task_timeout=data.get("task_timeout"),
+        suite_budget=data.get("suite_budget"),
+    )
+
+
+@dataclass(slots=True)
+class Cell:
+    name: str
+    engine: str
+    tasks_path: Path
+    model: Optional[str]
+    repeat: int
+    output: Path
+    tasks: List[Task]
+    pending: List[Task] = field(default_factory=list)
+    writer: Optional[ResultWriter] = None
+    agent: Optional[Callable[..., Dict[str, str]]] = None
+    started: float = 0.0
+    finished: float = 0.0
+    rows: int = 0
+    successes: int = 0
+
+    @property
+    def backend(self) -> str:
+        return engine_backend(self.engine)
+
+
+def _cell_name(spec: MatrixSpec, engine: str, tasks_path: Path, model: Optional[str], repeat: int) -> str:
+    # Only dimensions that vary are named, which gives names like ``local_single_7b``.
+    parts = [engine.replace("-", "_")]
+    if len(spec.tasks) > 1:
+        parts.append(tasks_path.stem)
+    if model:
+        parts.append(_SLUG_RE.sub("-", model).strip("-"))
+    if spec.repeats > 1:
+        parts.append(f"r{repeat}")
+    return "_".join(parts)
+
+
+def build_cells(spec: MatrixSpec) -> List[Cell]:
+    loaded: Dict[Path, List[Task]] = {}
+    for tasks_path in spec.tasks:
+        tasks = load_tasks(tasks_path)
+        tasks = tasks[: spec.limit] if spec.limit else tasks
+        loaded[tasks_path] = select_shard(tasks, spec.shard) if spec.shard else tasks
+    cells = []
+    for engine, tasks_path, model, repeat in itertools.product(
+        spec.engines, spec.tasks, spec.models, range(1, spec.repeats + 1)
+    ):
+        name = _cell_name(spec, engine, tasks_path, model, repeat)
+        cells.append(
+            Cell(
+                name=name,
+                engine=engine,
+                tasks_path=tasks_path,
+                model=model,
+                repeat=repeat,
+                output=spec.output_dir / f"{name}.jsonl",
+                tasks=loaded[tasks_path],
+            )
+        )
+    names = [cell.name for cell in cells]
+    if len(set(names)) != len(names):
+        raise ValueError("Matrix cells would share result files; give task files distinct names")
+    return cells
+
+
+def interleave(cells: List[Cell]) -> Dict[str, Deque[Tuple[Cell, Task]]]:
+    """Per-backend job queues that take one task from each cell in turn."""
+
+    queues: Dict[str, Deque[Tuple[Cell, Task]]] = {}
+    depth = max((len(cell.pending) for cell in cells), default=0)
+    for index in range(depth):
+        for cell in cells:
+            if index < len(cell.pending):
+                queues.setdefault(cell.backend, deque()).append((cell, cell.pending[index]))
+    return queues
+
+
+def _write_manifest(spec: MatrixSpec, spec_path: Path, cells: List[Cell], status: str, **extra: Any) -> None:
+    manifest = {
+        "spec": str(spec_path),
+        "label": spec.label,
+        "shard": f"{spec.shard[0]}/{spec.shard[1]}" if spec.shard else None,
+        "status": status,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        **extra,
+        "cells": [
+            {
+                "cell": cell.name,
+                "engine": cell.engine,
+                "tasks": str(cell.tasks_path),
+                "model": cell.model,
+                "repeat": cell.repeat,
+                "output": str(cell.output),
+                "tasks_total": len(cell.tasks),
+                "rows": cell.rows,
+                "successes": cell.successes,
+                **({"elapsed_sec": round(cell.finished - cell.started, 3)} if cell.finished else {}),
+            }
+            for cell in cells
+        ],
+    }
+    path = spec.output_dir / MANIFEST_NAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def run_matrix(spec: MatrixSpec, spec_path: Path, resume: bool = False, progress: bool = False) -> None:
+    cells = build_cells(spec)
+    spec.output_dir.mkdir(parents=True, exist_ok=True)
+    for cell in cells:
+        done = completed_task_ids(cell.output, cell.engine, spec.label) if resume else set()
+        cell.pending = [task for task in cell.tasks if task.task_id not in done]
+    queues = interleave(cells)
+    workers = {
+        backend: resolve_workers(spec.workers.get(backend, "auto"), backend, len(queue))
+        for backend, queue in queues.items()
+    }
+    configure_limits(workers, spec.llm_concurrency, spec.checker_concurrency)
+    for cell in cells:
+        cell.agent = load_agent(cell.engine, progress=progress, model=cell.model)
+        cell.writer = ResultWriter(cell.output, append=resume)
+
+    total = sum(len(queue) for queue in queues.values())
+    skipped = sum(len(cell.tasks) for cell in cells) - total
+    print(
+        f"Matrix: {len(cells)} cells, {total} tasks ({skipped} already recorded), "
+        f"workers {', '.join(f'{backend}={count}' for backend, count in workers.items()) or 'none'}",
+        flush=True,
+    )
+    _write_manifest(spec, spec_path, cells, "running", workers=workers)
+
+    output = TaskOutput(sys.stdout)
+    numbers = itertools.count(1)
+    completed = 0
+    remaining = {cell.name: len(cell.pending) for cell in cells}
+
+    deadline = time.monotonic() + spec.suite_budget if spec.suite_budget else None
+    skipped = 0
+
+    def work(cell: Cell, task: Task, number: int, timeout: Optional[float], reason: str) -> None:
+        def execute() -> None:
+            fields = {"cell": cell.name, "model": cell.model, "repeat": cell.repeat}
+            if spec.shard:
+                fields["shard"] = f"{spec.shard[0]}/{spec.shard[1]}"
+            row = run_task(
+                task, cell.agent, cell.engine, spec.label, fields, timeout=timeout, timeout_reason=reason
+            )
+            cell.writer.write(row)
+
+        run_captured(output, f"[{number}/{total}] {cell.name} · task '{task.task_id}'", execute)
+
+    status = "interrupted"
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=max(sum(workers.values()), 1), thread_name_prefix="matrix") as pool:
+            inflight: Dict[Future, Tuple[str, Cell]] = {}
+            busy = {backend: 0 for backend in queues}
+
+            def fill() -> None:
+                nonlocal skipped
+                timeout, reason = spec.task_timeout, TASK_TIMEOUT
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        skipped += sum(len(queue) for queue in queues.values())
+                        for queue in queues.values():
+                            queue.clear()
+                        return
+                    if timeout is None or timeout > remaining:
+                        timeout, reason = remaining, BUDGET_EXHAUSTED
+                for backend, queue in queues.items():
+                    while queue and busy[backend] < workers[backend]:
+                        cell, task = queue.popleft()
+                        if not cell.started:
+                            cell.started = time.perf_counter()
+                        busy[backend] += 1
+                        future = pool.submit(work, cell, task, next(numbers), timeout, reason)
+                        inflight[future] = (backend, cell)
+
+            try:
+                fill()
+                while inflight:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        backend, cell = inflight.pop(future)
+                        busy[backend] -= 1
+                        completed += 1
+                        remaining[cell.name] -= 1
+                        if not remaining[cell.name]:
+                            cell.finished = time.perf_counter()
+                        future.result()
+                    fill()
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        status = "complete"
+    finally:
+        sys.stdout = output._stream
+        for cell in cells:
+            cell.writer.close()
+            cell.rows, cell.successes = compact_results(cell.output, cell.tasks, cell.engine, spec.label)
+        _write_manifest(spec, spec_path, cells, status, workers=workers, skipped=skipped)
+
+    width = max(len(cell.name) for cell in cells)
+    print(f"\nCompleted {completed} tasks across {len(cells)} cells:")
+    for cell in cells:
+        print(f"  {cell.name:<{width}}  {cell.successes}/{cell.rows}  {cell.output}")
+    if skipped:
+        print(f"Suite budget: {skipped} tasks not run; rerun with --resume to continue.")
+    print(f"Manifest: {spec.output_dir / MANIFEST_NAME}")
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a matrix of benchmark configurations on one worker pool.")
+    parser.add_argument("spec", type=Path, help="JSON matrix spec (engines, tasks, models, repeats).")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=None,
+        help="Directory for per-cell result files and the manifest (overrides the spec).",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Run only shard i of n (e.g. 2/4) of every cell's tasks.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip tasks already recorded in each cell's result file.",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Include per-stage progress events in each task's output.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv or sys.argv[1:])
+    spec = load_spec(args.spec)
+    if args.output_dir is not None:
+        spec.output_dir = args.output_dir
+    if args.shard:
+        spec.shard = parse_shard(args.shard)
+    run_matrix(spec, args.spec, resume=args.resume, progress=args.progress)
+
+
+if __name__ == "__main__":
+    main()
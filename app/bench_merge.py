@@ -0,0 +1,185 @@
+"""Merge sharded benchmark outputs into one result file.
+
+Shards come from ``run_bench.py --shard i/n`` (or ``bench_matrix.py --shard``)
+on several hosts. The merge refuses to write a result set that does not look
+like a single run. It fails on:
+
+- tasks of the task file with no row (``--allow-partial`` to accept)
+- a task recorded in more than one input (``--allow-duplicates`` keeps the newest)
+- rows from a different shard count, or in a shard their task does not hash to
+- rows for task IDs missing from the task file
+
+Without ``--tasks`` it can only check that every shard 1..n contributed rows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from app.run_bench import load_tasks, parse_shard, read_results, shard_of, write_results
+
+Row = Dict[str, object]
+RowKey = Tuple[str, str, str]
+
+
+def _group(engine: str, label: str) -> str:
+    return f"{engine}/{label}" if label else engine
+
+
+def _format_ids(ids: List[str], limit: int = 10) -> str:
+    shown = ", ".join(ids[:limit])
+    return shown + (f" (+{len(ids) - limit} more)" if len(ids) > limit else "")
+
+
+def merge_results(
+    inputs: List[Path],
+    expected: Optional[List[str]] = None,
+    allow_partial: bool = False,
+    allow_duplicates: bool = False,
+) -> Tuple[List[Row], List[str], List[str]]:
+    """Combine rows from ``inputs``; returns ``(rows, problems, notes)``.
+
+    Within one file a later row replaces an earlier one for the same task
+    (that is how ``--resume`` appends). Across files the same task is a
+    duplicate. ``problems`` lists what should block the merge given the
+    ``allow_*`` flags; ``notes`` lists what was accepted anyway.
+    """
+
+    rows: Dict[RowKey, Row] = {}
+    sources: Dict[RowKey, List[str]] = {}
+    shard_counts: Set[int] = set()
+    shards_seen: Set[int] = set()
+    problems: List[str] = []
+    notes: List[str] = []
+
+    for path in inputs:
+        per_file: Dict[RowKey, Row] = {}
+        for _offset, _raw, row in read_results(path):
+            key = (str(row["task_id"]), str(row.get("engine")), str(row.get("label") or ""))
+            per_file[key] = row
+        for key, row in per_file.items():
+            sources.setdefault(key, []).append(str(path))
+            current = rows.get(key)
+            if current is None or str(row.get("timestamp", "")) > str(current.get("timestamp", "")):
+                rows[key] = row
+            shard = row.get("shard")
+            if not shard:
+                continue
+            index, count = parse_shard(str(shard))
+            shard_counts.add(count)
+            shards_seen.add(index)
+            if shard_of(key[0], count) != index:
+                problems.append(f"task '{key[0]}' ({_group(*key[1:])}) in {path} is not in shard {shard}")
+
+    if len(shard_counts) > 1:
+        problems.append(f"inputs mix shard counts {sorted(shard_counts)}; they come from different splits")
+
+    for key, files in sources.items():
+        if len(files) > 1:
+            message = f"task '{key[0]}' ({_group(*key[1:])}) recorded in {len(files)} inputs: {', '.join(files)}"
+            if allow_duplicates:
+                notes.append(f"{message} (kept newest)")
+            else:
+                problems.append(message)
+
+    groups = sorted({key[1:] for key in rows})
+    if expected is not None:
+        order = {task_id: index for index, task_id in enumerate(expected)}
+        for group in groups:
+            present = {key[0] for key in rows if key[1:] == group}
+            missing = [task_id for task_id in expected if task_id not in present]
+            unknown = sorted(present - set(order))
+            label = _group(*group)
+            if missing:
+                message = f"{label}: {len(missing)} of {len(expected)} tasks missing: {_format_ids(missing)}"
+                (notes if allow_partial else problems).append(message)
+            if unknown:
+                problems.append(f"{label}: rows for tasks not in the task file: {_format_ids(unknown)}")
+        ordered = sorted(rows.items(), key=lambda item: (item[0][1:], order.get(item[0][0], len(order))))
+    else:
+        if len(shard_counts) == 1:
+            count = next(iter(shard_counts))
+            missing_shards = [str(index) for index in range(1, count + 1) if index not in shards_seen]
+            if missing_shards:
+                message = f"no rows from shard(s) {', '.join(missing_shards)} of {count}"
+                (notes if allow_partial else problems).append(message)
+        notes.append("no --tasks given; completeness is checked per shard only")
+        ordered = sorted(rows.items(), key=lambda item: item[0][1:])
+
+    merged = []
+    for _key, row in ordered:
+        row = dict(row)
+        row.pop("shard", None)
+        merged.append(row)
+    return merged, problems, notes
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Merge and validate sharded benchmark result files.")
+    parser.add_argument("inputs", type=Path, nargs="+", help="Shard result files (JSONL).")
+    parser.add_argument("--output", type=Path, required=True, help="Merged JSONL file to write.")
+    parser.add_argument(
+        "--tasks",
+        type=Path,
+        default=None,
+        help="Task file the shards were split from; enables the per-task completeness check.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="The --limit the shards were run with, if any.",
+    )
+    parser.add_argument(
+        "--allow-partial",
+        action="store_true",
+        help="Write the merge even when tasks or shards are missing.",
+    )
+    parser.add_argument(
+        "--allow-duplicates",
+        action="store_true",
+        help="Keep the newest row when a task appears in several inputs.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv or sys.argv[1:])
+    missing_inputs = [str(path) for path in args.inputs if not path.exists()]
+    if missing_inputs:
+        print(f"✖ input file(s) not found: {', '.join(missing_inputs)}")
+        return 1
+    expected = None
+    if args.tasks is not None:
+        tasks = load_tasks(args.tasks)
+        expected = [task.task_id for task in (tasks[: args.limit] if args.limit else tasks)]
+
+    rows, problems, notes = merge_results(
+        args.inputs, expected, allow_partial=args.allow_partial, allow_duplicates=args.allow_duplicates
+    )
+    for note in notes:
+        print(f"  · {note}")
+    for problem in problems:
+        print(f"✖ {problem}")
+    if problems:
+        print(f"Merge refused: {len(problems)} problem(s); {args.output} not written.")
+        return 1
+
+    write_results(args.output, rows)
+    successes = sum(1 for row in rows if row.get("success"))
+    print(
+        f"Merged {len(rows)} rows from {len(args.inputs)} files with {successes} successes. "
+        f"Results stored in {args.output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
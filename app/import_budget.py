@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Import-time regression check for the server and benchmark entry points.
+
+Each target is imported in a fresh interpreter under ``python -X importtime``.
+The script parses the per-module timings, reports the slowest top-level
+imports, and fails when a target exceeds its budget or pulls in a module that
+must stay lazy (LangGraph, the OpenAI SDK).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+APP_DIR = Path(__file__).resolve().parent
+
+TARGETS = {
+    "server": "server",
+    "run_bench": "run_bench",
+}
+DEFAULT_BUDGETS_MS = {
+    "server": float(os.getenv("IMPORT_BUDGET_SERVER_MS", "250")),
+    "run_bench": float(os.getenv("IMPORT_BUDGET_RUN_BENCH_MS", "250")),
+}
+FORBIDDEN_MODULES = tuple(
+    name.strip()
+    for name in os.getenv("IMPORT_BUDGET_FORBIDDEN", "langgraph,langchain_core,openai").split(",")
+    if name.strip()
+)
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S.*)$")
+
+
+@dataclass(slots=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass(slots=True)
+class TargetReport:
+    target: str
+    total_ms: float
+    budget_ms: float
+    records: List[ImportRecord] = field(default_factory=list)
+    forbidden: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.total_ms <= self.budget_ms and not self.forbidden
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    records: List[ImportRecord] = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        # CPython indents nested imports by two spaces after a single separator space.
+        depth = max(len(indent) - 1, 0) // 2
+        records.append(ImportRecord(module.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure(module: str) -> List[ImportRecord]:
+    code = f"import sys; sys.path.insert(0, {str(APP_DIR)!r}); import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=APP_DIR.parent,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def _total_ms(records: Sequence[ImportRecord], module: str) -> float:
+    for record in records:
+        if record.module == module and record.depth == 0:
+            return record.cumulative_us / 1000
+    return sum(record.cumulative_us for record in records if record.depth == 0) / 1000
+
+
+def check_target(target: str, budget_ms: float, repeat: int) -> TargetReport:
+    module = TARGETS[target]
+    best: Optional[List[ImportRecord]] = None
+    best_ms = float("inf")
+    # Take the fastest run so one noisy sample does not fail the check.
+    for _ in range(max(repeat, 1)):
+        records = measure(module)
+        total = _total_ms(records, module)
+        if total < best_ms:
+            best, best_ms = records, total
+    loaded = {record.module for record in best or []}
+    forbidden = sorted(name for name in loaded if name in FORBIDDEN_MODULES)
+    return TargetReport(
+        target=target,
+        total_ms=round(best_ms, 1),
+        budget_ms=budget_ms,
+        records=best or [],
+        forbidden=forbidden,
+    )
+
+
+def _format_report(report: TargetReport, top: int) -> str:
+    status = "OK" if report.ok else "FAIL"
+    lines = [f"[{status}] {report.target}: {report.total_ms:.1f} ms (budget {report.budget_ms:.0f} ms)"]
+    if report.forbidden:
+        lines.append(f"  forbidden imports: {', '.join(report.forbidden)}")
+    slowest = sorted(
+        (record for record in report.records if record.depth <= 1),
+        key=lambda record: record.cumulative_us,
+        reverse=True,
+    )[:top]
+    for record in slowest:
+        lines.append(f"  {record.cumulative_us / 1000:8.1f} ms  {'  ' * record.depth}{record.module}")
+    return "\n".join(lines)
+
+
+def _parse_budget(value: str) -> tuple[str, float]:
+    target, _, budget = value.partition("=")
+    if target not in TARGETS or not budget:
+        raise argparse.ArgumentTypeError(f"expected TARGET=MS with TARGET in {', '.join(TARGETS)}")
+    return target, float(budget)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check entry-point import time against budgets.")
+    parser.add_argument(
+        "--target",
+        action="append",
+        choices=sorted(TARGETS),
+        help="Entry point to measure (repeatable). Defaults to all targets.",
+    )
+    parser.add_argument(
+        "--budget",
+        action="append",
+        type=_parse_budget,
+        default=[],
+        help="Override a budget, e.g. --budget server=150.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the fastest counts.")
+    parser.add_argument("--top", type=int, default=8, help="How many slow imports to list per target.")
+    parser.add_argument("--json", action="store_true", help="Print a JSON summary instead of text.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    budgets: Dict[str, float] = {**DEFAULT_BUDGETS_MS, **dict(args.budget)}
+    reports = [
+        check_target(target, budgets[target], args.repeat) for target in (args.target or list(TARGETS))
+    ]
+    if args.json:
+        summary = [
+            {
+                "target": report.target,
+                "total_ms": report.total_ms,
+                "budget_ms": report.budget_ms,
+                "forbidden": report.forbidden,
+                "ok": report.ok,
+            }
+            for report in reports
+        ]
+        print(json.dumps(summary, indent=2))
+    else:
+        print("\n\n".join(_format_report(report, args.top) for report in reports))
+    return 0 if all(report.ok for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+"""Background agent jobs: a priority worker pool and a bounded result store.
+
+A job owns a ``PipelineRun`` that is not tied to any HTTP connection: clients
+submit, then poll its status or follow its events, and a dropped connection
+does not cancel the work. Workers take the highest-priority queued job
+(FIFO within a priority) and only then join the session's lane, so a job
+waiting in the queue never delays interactive requests on its session.
+
+With a ``SqliteJobBackend``, job state and events are also written to a
+database shared by every server process. A process asked about a job it does
+not own serves a read-only mirror that follows the database, and cancelling
+such a job leaves a request that the owning process picks up.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent.cancellation import AgentCancelled
+from runs import PipelineRun, RunCoordinator, RunKey
+
+JOB_WORKERS = int(os.getenv("AGENT_JOB_WORKERS", "2"))
+JOB_MAX_QUEUE = int(os.getenv("AGENT_JOB_MAX_QUEUE", "64"))
+JOB_RETAIN_COUNT = int(os.getenv("AGENT_JOB_RETAIN", "256"))
+JOB_RETAIN_SEC = float(os.getenv("AGENT_JOB_RETAIN_SEC", "3600"))
+JOB_DB_PATH = os.getenv("AGENT_JOB_DB", "")
+JOB_PRIORITY_RANGE = (0, 9)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+_FINAL_STATUSES = JOB_STATUSES[2:]
+_REMOTE_POLL_SEC = 0.25
+_CANCEL_POLL_SEC = 0.5
+
+
+class JobQueueFull(Exception):
+    """Raised by ``JobManager.submit`` when ``max_queue`` jobs are already waiting."""
+
+
+@dataclass(slots=True)
+class Job:
+    job_id: str
+    run: PipelineRun
+    work: Callable[[PipelineRun], Any]
+    priority: int = 0
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    # Process that executes the job; mirrors of other processes' jobs are read-only.
+    owner: str = ""
+
+    @property
+    def status(self) -> str:
+        if not self.run.done:
+            return "running" if self.started is not None else "queued"
+        if self.run.error is None:
+            return "succeeded"
+        if isinstance(self.run.error, AgentCancelled) or self.run.cancel.cancelled:
+            return "cancelled"
+        return "failed"
+
+    def describe(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "jobId": self.job_id,
+            "status": self.status,
+            "priority": self.priority,
+            "sessionId": self.run.key.session_id,
+            "engine": self.run.key.engine,
+            "events": len(self.run.events),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.run.done and self.run.error is None:
+            payload["result"] = self.run.result
+        elif self.run.error is not None:
+            payload["error"] = str(self.run.error)
+        return payload
+
+
+class SqliteJobBackend:
+    """Job rows and their events, shared by server processes through sqlite WAL."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+                "session_id TEXT NOT NULL, message TEXT NOT NULL, engine TEXT NOT NULL, created REAL NOT NULL, "
+                "started REAL, finished REAL, result TEXT, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+            )
+
+    def insert(self, job: Job) -> None:
+        key = job.run.key
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, owner, status, priority, session_id, message, engine, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.owner, "queued", job.priority, key.session_id, key.message, key.engine, job.created),
+            )
+
+    def update(self, job: Job) -> None:
+        result = json.dumps(job.run.result) if job.run.done and job.run.error is None else None
+        error = str(job.run.error) if job.run.error is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                (job.status, job.started, job.finished, result, error, job.job_id),
+            )
+
+    def add_event(self, job_id: str, seq: int, event: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps(event)),
+            )
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        return dict(zip(names, row)) if row is not None else None
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def request_cancel(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def cancel_requests(self, owner: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE owner = ? AND cancel_requested = 1 AND status IN ('queued', 'running')",
+                (owner,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def fail_owner(self, owner: str, error: str) -> int:
+        """Mark unfinished jobs of a process that exited as failed."""
+
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+                "WHERE owner = ? AND status IN ('queued', 'running')",
+                (error, time.time(), owner),
+            ).rowcount
+
+    def purge(self, cutoff: float, keep: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND (finished < ? OR id NOT IN ("
+                "SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT ?))",
+                (cutoff, keep),
+            )
+            self._conn.execute("DELETE FROM job_events WHERE job_id NOT IN (SELECT id FROM jobs)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """Runs submitted jobs on ``workers`` threads and keeps finished ones for a while."""
+
+    def __init__(
+        self,
+        runs: RunCoordinator,
+        workers: int = JOB_WORKERS,
+        max_queue: int = JOB_MAX_QUEUE,
+        retain_count: int = JOB_RETAIN_COUNT,
+        retain_sec: float = JOB_RETAIN_SEC,
+        backend: SqliteJobBackend | None = None,
+        owner: str | None = None,
+    ) -> None:
+        self.runs = runs
+        self.backend = backend
+        self.owner = owner or str(os.getpid())
+        self.workers = max(workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self.retain_count = retain_count
+        self.retain_sec = retain_sec
+        self._jobs: Dict[str, Job] = {}
+        # Entries are (-priority, submission order, job_id); cancelled jobs are skipped lazily.
+        self._queue: List[Tuple[int, int, str]] = []
+        self._order = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._mirror_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self.stats = {status: 0 for status in JOB_STATUSES[2:]}
+
+    def _ensure_workers(self) -> None:
+        # Workers start on first submit so importing the server stays cheap.
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.backend is not None:
+            thread = threading.Thread(target=self._watch_cancel_requests, name="job-cancel-watch", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, run: PipelineRun, work: Callable[[PipelineRun], Any], priority: int = 0) -> Job:
+        low, high = JOB_PRIORITY_RANGE
+        job = Job(uuid.uuid4().hex[:16], run, work, min(max(priority, low), high), owner=self.owner)
+        with self._cond:
+            self._prune()
+            if self._queued >= self.max_queue:
+                raise JobQueueFull(f"job queue full ({self.max_queue} waiting)")
+            if self.backend is not None:
+                self.backend.insert(job)
+                run.listen(self._event_writer(job.job_id))
+            self._ensure_workers()
+            self._jobs[job.job_id] = job
+            heapq.heappush(self._queue, (-job.priority, next(self._order), job.job_id))
+            self._queued += 1
+            self._cond.notify()
+        return job
+
+    def _event_writer(self, job_id: str) -> Callable[[int, Optional[Dict[str, Any]]], None]:
+        def write(seq: int, event: Optional[Dict[str, Any]]) -> None:
+            if event is not None:
+                self.backend.add_event(job_id, seq, event)
+
+        return write
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            self._prune()
+            job = self._jobs.get(job_id)
+        if job is None and self.backend is not None:
+            job = self._mirror(job_id)
+        elif job is not None and job.owner != self.owner and not job.run.done:
+            # Answer with the owner's latest status rather than the last poll.
+            self._sync_mirror(job)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are left as they are."""
+
+        job = self.get(job_id)
+        if job is None or job.run.done:
+            return job
+        if job.owner != self.owner:
+            self.backend.request_cancel(job_id)
+            return job
+        job.run.cancel.cancel("cancelled by client")
+        with self._cond:
+            queued = job.started is None
+            if queued:
+                self._queued -= 1
+        if queued:
+            self._finish(job, error=AgentCancelled("cancelled by client"))
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.started = time.time()
+                self._queued -= 1
+                self._running += 1
+            if self.backend is not None:
+                self.backend.update(job)
+            try:
+                self.runs.enqueue(job.run)
+                job.run.wait_turn()
+                result = job.work(job.run)
+            except BaseException as exc:
+                self._finish(job, error=exc)
+            else:
+                self._finish(job, result=result)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def _next_job(self) -> Optional[Job]:
+        while self._queue:
+            _, _, job_id = heapq.heappop(self._queue)
+            job = self._jobs.get(job_id)
+            if job is not None and job.started is None and not job.run.cancel.cancelled:
+                return job
+        return None
+
+    def _finish(self, job: Job, result: Any = None, error: BaseException | None = None) -> None:
+        job.finished = time.time()
+        job.run.finish(result=result, error=error)
+        with self._cond:
+            self.stats[job.status] = self.stats.get(job.status, 0) + 1
+        if self.backend is not None:
+            self.backend.update(job)
+
+    def _watch_cancel_requests(self) -> None:
+        last_purge = 0.0
+        while True:
+            time.sleep(_CANCEL_POLL_SEC)
+            try:
+                for job_id in self.backend.cancel_requests(self.owner):
+                    self.cancel(job_id)
+                if time.time() - last_purge > 60:
+                    last_purge = time.time()
+                    self.backend.purge(last_purge - self.retain_sec, self.retain_count)
+            except sqlite3.Error as exc:
+                print(f"[jobs] backend poll failed: {exc}")
+
+    # -- mirrors of jobs owned by other processes ----------------------------
+
+    def _mirror(self, job_id: str) -> Optional[Job]:
+        row = self.backend.load(job_id)
+        if row is None:
+            return None
+        key = RunKey(row["session_id"], row["message"], row["engine"])
+        job = Job(job_id, PipelineRun(key, lambda run: None), _remote_work, row["priority"], row["created"])
+        job.owner = row["owner"]
+        with self._cond:
+            existing = self._jobs.get(job_id)
+            if existing is not None:
+                return existing
+            self._jobs[job_id] = job
+        if not self._sync_mirror(job):
+            threading.Thread(target=self._follow_mirror, args=(job,), name=f"job-mirror-{job_id}", daemon=True).start()
+        return job
+
+    def _sync_mirror(self, job: Job) -> bool:
+        """Copy new events and status from the backend; returns whether the job has finished."""
+
+        with self._mirror_lock:
+            if job.run.done:
+                return True
+            # Read the row first: events are written before the final status.
+            row = self.backend.load(job.job_id)
+            for _, event in self.backend.events(job.job_id, after=len(job.run.events)):
+                job.run.publish(event)
+            return self._apply_row(job, row)
+
+    def _apply_row(self, job: Job, row: Optional[Dict[str, Any]]) -> bool:
+        if row is None:
+            job.finished = time.time()
+            job.run.finish(error=RuntimeError("job record expired"))
+            return True
+        job.started = row["started"]
+        if row["status"] not in _FINAL_STATUSES:
+            return False
+        job.finished = row["finished"]
+        if row["status"] == "succeeded":
+            job.run.finish(result=json.loads(row["result"]) if row["result"] else None)
+        elif row["status"] == "cancelled":
+            job.run.finish(error=AgentCancelled(row["error"] or "cancelled"))
+        else:
+            job.run.finish(error=RuntimeError(row["error"] or "job failed"))
+        return True
+
+    def _follow_mirror(self, job: Job) -> None:
+        while True:
+            time.sleep(_REMOTE_POLL_SEC)
+            with self._cond:
+                if self._jobs.get(job.job_id) is not job:
+                    return
+            try:
+                if self._sync_mirror(job):
+                    return
+            except sqlite3.Error as exc:
+                print(f"[jobs] mirror of {job.job_id} failed: {exc}")
+
+    def _prune(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished is not None),
+            key=lambda job: job.finished,
+        )
+        now = time.time()
+        excess = len(finished) - self.retain_count
+        for index, job in enumerate(finished):
+            if index >= excess and now - job.finished <= self.retain_sec:
+                break
+            del self._jobs[job.job_id]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "queued": self._queued,
+                "running": self._running,
+                "retained": sum(1 for job in self._jobs.values() if job.finished is not None),
+                "workers": self.workers,
+                **self.stats,
+            }
+
+
+def _remote_work(_run: PipelineRun) -> Any:
+    raise RuntimeError("job is executed by another process")
+
+
+def build_job_manager(runs: RunCoordinator) -> JobManager:
+    backend = SqliteJobBackend(JOB_DB_PATH) if JOB_DB_PATH else None
+    return JobManager(runs, backend=backend)
+
+
+__all__ = ["Job", "JobManager", "JobQueueFull", "SqliteJobBackend", "build_job_manager"]
@@ -0,0 +1,146 @@
+"""Load-aware engine degradation for interactive requests.
+
+When the local LLM backend is saturated, ``local_multi`` still queues for
+three full LLM calls per request. The policy watches queue depth and the
+recent p95 latency of llama calls. Under load it switches interactive
+requests to cheaper variants: ``multi`` runs as ``single``, retrying engines
+get fewer attempts and consensus draws fewer samples. It switches back once
+both signals have fallen well below their thresholds and the degraded state
+has lasted at least ``AGENT_DEGRADE_HOLD_SEC``, so it does not flap around a
+single threshold.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+
+DEGRADE_ENABLED = os.getenv("AGENT_DEGRADE", "1").lower() not in ("0", "false", "no")
+# Runs in flight (interactive runs plus executing jobs) that count as saturation.
+DEGRADE_QUEUE_DEPTH = int(os.getenv("AGENT_DEGRADE_QUEUE_DEPTH", "4"))
+DEGRADE_P95_SEC = float(os.getenv("AGENT_DEGRADE_P95_SEC", "20"))
+DEGRADE_HOLD_SEC = float(os.getenv("AGENT_DEGRADE_HOLD_SEC", "30"))
+DEGRADE_MAX_ATTEMPTS = int(os.getenv("AGENT_DEGRADE_MAX_ATTEMPTS", "1"))
+DEGRADE_SAMPLES = int(os.getenv("AGENT_DEGRADE_SAMPLES", "2"))
+
+# Recovery needs depth and latency this far below the degrade thresholds.
+_RECOVER_DEPTH_FACTOR = 0.5
+_RECOVER_P95_FACTOR = 0.75
+_EVALUATE_EVERY_SEC = 1.0
+
+# Only engines on the local backend are degraded: the policy reacts to llama-server load.
+_BACKEND = "local"
+_DOWNGRADE_KINDS = {"multi": "single"}
+_ATTEMPT_KINDS = ("exec", "selftest", "cascade")
+
+
+@dataclass(slots=True)
+class EngineChoice:
+    engine: str
+    requested: str
+    options: Dict[str, Any] = field(default_factory=dict)
+    reason: str = ""
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.reason)
+
+    def payload(self) -> Dict[str, Any]:
+        return {"requested": self.requested, "engine": self.engine, "options": self.options, "reason": self.reason}
+
+
+class LoadPolicy:
+    """Hysteresis switch between normal and degraded engine selection."""
+
+    def __init__(
+        self,
+        depth: Callable[[], int],
+        p95: Callable[[], float],
+        queue_depth: int = DEGRADE_QUEUE_DEPTH,
+        p95_sec: float = DEGRADE_P95_SEC,
+        hold_sec: float = DEGRADE_HOLD_SEC,
+        max_attempts: int = DEGRADE_MAX_ATTEMPTS,
+        samples: int = DEGRADE_SAMPLES,
+    ) -> None:
+        self.depth = depth
+        self.p95 = p95
+        self.queue_depth = max(queue_depth, 1)
+        self.p95_sec = p95_sec
+        self.hold_sec = hold_sec
+        self.max_attempts = max(max_attempts, 1)
+        self.samples = max(samples, 1)
+        self.degraded = False
+        self.reason = ""
+        self.stats = {"degraded": 0, "recovered": 0, "downgraded_requests": 0}
+        self._since = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _overloaded(self, depth: int, p95: float) -> str:
+        if depth >= self.queue_depth:
+            return f"{depth} runs in flight, limit {self.queue_depth}"
+        if self.p95_sec > 0 and p95 >= self.p95_sec:
+            return f"p95 LLM latency {p95:.1f}s, limit {self.p95_sec:.0f}s"
+        return ""
+
+    def _calm(self, depth: int, p95: float) -> bool:
+        depth_ok = depth <= int(self.queue_depth * _RECOVER_DEPTH_FACTOR)
+        p95_ok = self.p95_sec <= 0 or p95 < self.p95_sec * _RECOVER_P95_FACTOR
+        return depth_ok and p95_ok
+
+    def evaluate(self, force: bool = False) -> bool:
+        """Re-read the load signals (at most once a second) and return whether degraded."""
+
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked < _EVALUATE_EVERY_SEC:
+                return self.degraded
+            self._checked = now
+            depth, p95 = self.depth(), self.p95()
+            reason = self._overloaded(depth, p95)
+            if reason:
+                if not self.degraded:
+                    self.stats["degraded"] += 1
+                    print(f"[load] degrading engines: {reason}")
+                self.degraded, self.reason, self._since = True, reason, now
+            elif self.degraded and now - self._since >= self.hold_sec and self._calm(depth, p95):
+                self.degraded, self.reason = False, ""
+                self.stats["recovered"] += 1
+                print("[load] load dropped; restoring requested engines")
+            return self.degraded
+
+    def choose(self, engine: str) -> EngineChoice:
+        """Engine and agent options to run a request for ``engine`` with right now."""
+
+        choice = EngineChoice(engine=engine, requested=engine)
+        backend, _, kind = engine.replace("-", "_").partition("_")
+        if backend != _BACKEND or not self.evaluate():
+            return choice
+        if kind in _DOWNGRADE_KINDS:
+            choice.engine = f"{backend}_{_DOWNGRADE_KINDS[kind]}"
+        elif kind in _ATTEMPT_KINDS:
+            choice.options = {"max_attempts": self.max_attempts}
+        elif kind == "consensus":
+            choice.options = {"samples": self.samples}
+        else:
+            return choice
+        choice.reason = self.reason
+        with self._lock:
+            self.stats["downgraded_requests"] += 1
+        return choice
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"degraded": self.degraded, "reason": self.reason, **self.stats}
+
+
+def build_load_policy(depth: Callable[[], int], p95: Callable[[], float]) -> LoadPolicy | None:
+    if not DEGRADE_ENABLED:
+        return None
+    return LoadPolicy(depth, p95)
+
+
+__all__ = ["EngineChoice", "LoadPolicy", "build_load_policy"]
@@ -0,0 +1,309 @@
+"""Near-duplicate prompt cache: MinHash signatures indexed with LSH bands.
+
+Prompts are normalized (Unicode, case, whitespace), split into character
+shingles and summarized by a MinHash signature. Signatures are cut into
+bands; two prompts whose signatures agree on a whole band become candidates.
+A candidate is a hit when the exact Jaccard similarity of the two shingle
+sets reaches the threshold and both prompts mention the same numbers and
+snake_case identifiers; the MinHash estimate is too noisy to decide alone. Entries are bounded by count and age and can be persisted to
+sqlite so the cache survives restarts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+PROMPT_CACHE_ENABLED = os.getenv("AGENT_PROMPT_CACHE", "0").lower() in ("1", "true", "yes")
+PROMPT_CACHE_THRESHOLD = float(os.getenv("AGENT_PROMPT_CACHE_THRESHOLD", "0.97"))
+PROMPT_CACHE_MAX = int(os.getenv("AGENT_PROMPT_CACHE_MAX", "512"))
+PROMPT_CACHE_TTL_SEC = float(os.getenv("AGENT_PROMPT_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+PROMPT_CACHE_DB = os.getenv("AGENT_PROMPT_CACHE_DB", "")
+
+SHINGLE_CHARS = 5
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs above ~0.5 similarity usually share a band.
+BANDS = 16
+_ROWS = NUM_PERM // BANDS
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WHITESPACE_RE = re.compile(r"\s+")
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|\w*_\w*")
+
+# Fixed seed so signatures stay comparable across restarts.
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+Signature = Tuple[int, ...]
+
+
+def normalize_prompt(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_CHARS) -> Set[int]:
+    if len(text) <= size:
+        grams = [text]
+    else:
+        grams = [text[index : index + size] for index in range(len(text) - size + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "big")
+        for gram in grams
+    }
+
+
+def literals(text: str) -> frozenset:
+    """Numbers and snake_case identifiers, which must match exactly for a hit."""
+
+    return frozenset(_LITERAL_RE.findall(text))
+
+
+def jaccard(left: Set[int], right: Set[int]) -> float:
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+def minhash(values: Set[int]) -> Signature:
+    if not values:
+        return tuple([_MAX_HASH] * NUM_PERM)
+    return tuple(min((a * value + b) % _MERSENNE & _MAX_HASH for value in values) for a, b in _PERMUTATIONS)
+
+
+def similarity(left: Signature, right: Signature) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def _bands(signature: Signature) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * _ROWS : (band + 1) * _ROWS]) for band in range(BANDS)]
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    entry_id: str
+    engine: str
+    prompt: str
+    signature: Signature
+    response: Dict[str, Any]
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+    grams: Set[int] = field(default_factory=set, repr=False)
+    literals: frozenset = field(default=frozenset(), repr=False)
+
+
+@dataclass(slots=True)
+class CacheHit:
+    entry: CacheEntry
+    similarity: float
+
+    def payload(self) -> Dict[str, Any]:
+        return {"similarity": round(self.similarity, 3), "prompt": self.entry.prompt, "created": self.entry.created}
+
+
+class SqlitePromptCacheBackend:
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                "id TEXT PRIMARY KEY, engine TEXT NOT NULL, prompt TEXT NOT NULL, "
+                "signature TEXT NOT NULL, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    def load(self, limit: int, min_created: float) -> List[CacheEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, engine, prompt, signature, response, created FROM prompt_cache "
+                "WHERE created >= ? ORDER BY created DESC LIMIT ?",
+                (min_created, limit),
+            ).fetchall()
+        entries = []
+        for entry_id, engine, prompt, signature, response, created in reversed(rows):
+            values = tuple(json.loads(signature))
+            if len(values) != NUM_PERM:
+                continue
+            entries.append(CacheEntry(entry_id, engine, prompt, values, json.loads(response), created))
+        return entries
+
+    def save(self, entry: CacheEntry) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (id, engine, prompt, signature, response, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.entry_id,
+                    entry.engine,
+                    entry.prompt,
+                    json.dumps(list(entry.signature)),
+                    json.dumps(entry.response),
+                    entry.created,
+                ),
+            )
+
+    def delete(self, entry_ids: List[str]) -> None:
+        if not entry_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM prompt_cache WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PromptCache:
+    """LRU-bounded MinHash/LSH index from prompts to finished agent replies.
+
+    Entries are scoped by engine: a reply is only reused for the engine that
+    produced it.
+    """
+
+    def __init__(
+        self,
+        threshold: float = PROMPT_CACHE_THRESHOLD,
+        max_entries: int = PROMPT_CACHE_MAX,
+        ttl_sec: float = PROMPT_CACHE_TTL_SEC,
+        backend: SqlitePromptCacheBackend | None = None,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max(max_entries, 1)
+        self.ttl_sec = ttl_sec
+        self.backend = backend
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._index: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+        if backend is not None:
+            min_created = time.time() - ttl_sec if ttl_sec > 0 else 0.0
+            for entry in backend.load(self.max_entries, min_created):
+                self._insert(entry)
+
+    def _insert(self, entry: CacheEntry) -> None:
+        if not entry.grams:
+            normalized = normalize_prompt(entry.prompt)
+            entry.grams = shingles(normalized)
+            entry.literals = literals(normalized)
+        self._entries[entry.entry_id] = entry
+        for band, rows in _bands(entry.signature):
+            self._index.setdefault((entry.engine, band, rows), set()).add(entry.entry_id)
+
+    def _remove(self, entry_id: str) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band, rows in _bands(entry.signature):
+            bucket = self._index.get((entry.engine, band, rows))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._index[(entry.engine, band, rows)]
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_sec > 0 and now - entry.created > self.ttl_sec
+
+    def lookup(self, prompt: str, engine: str) -> Optional[CacheHit]:
+        normalized = normalize_prompt(prompt)
+        grams = shingles(normalized)
+        wanted = literals(normalized)
+        signature = minhash(grams)
+        now = time.time()
+        best: Optional[CacheHit] = None
+        expired: List[str] = []
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, rows in _bands(signature):
+                candidates |= self._index.get((engine, band, rows), set())
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    expired.append(entry_id)
+                    continue
+                if entry.literals != wanted:
+                    continue
+                score = jaccard(grams, entry.grams)
+                if score >= self.threshold and (best is None or score > best.similarity):
+                    best = CacheHit(entry, score)
+            for entry_id in expired:
+                self._remove(entry_id)
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            best.entry.hits += 1
+            self._entries.move_to_end(best.entry.entry_id)
+        if self.backend is not None:
+            self.backend.delete(expired)
+        return best
+
+    def store(self, prompt: str, engine: str, response: Dict[str, Any]) -> CacheEntry:
+        normalized = normalize_prompt(prompt)
+        entry_id = hashlib.sha1(f"{engine}\0{normalized}".encode("utf-8")).hexdigest()[:20]
+        grams = shingles(normalized)
+        entry = CacheEntry(
+            entry_id,
+            engine,
+            prompt,
+            minhash(grams),
+            dict(response),
+            grams=grams,
+            literals=literals(normalized),
+        )
+        evicted: List[str] = []
+        with self._lock:
+            self._remove(entry_id)
+            self._insert(entry)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                evicted.append(oldest)
+                self.stats["evicted"] += 1
+        if self.backend is not None:
+            self.backend.save(entry)
+            self.backend.delete(evicted)
+        return entry
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {"entries": len(self._entries), "threshold": self.threshold, **self.stats}
+
+
+def build_prompt_cache() -> Optional[PromptCache]:
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    backend = SqlitePromptCacheBackend(PROMPT_CACHE_DB) if PROMPT_CACHE_DB else None
+    return PromptCache(backend=backend)
+
+
+__all__ = [
+    "CacheEntry",
+    "CacheHit",
+    "PromptCache",
+    "SqlitePromptCacheBackend",
+    "build_prompt_cache",
+    "jaccard",
+    "literals",
+    "minhash",
+    "normalize_prompt",
+    "shingles",
+    "similarity",
+]
@@ -3,17 +3,23 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import importlib
+import io
+import itertools
 import json
+import os
 import re
-import subprocess
 import sys
-import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 try:
     from dotenv import load_dotenv
@@ -29,6 +35,19 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 
+from app.agent.cancellation import AgentCancelled, CancelToken
+from app.agent.llm_slots import LLM_SLOTS
+from app.agent.preflight import PREFLIGHT_ENABLED, preflight_check
+from app.agent.sandbox import configure_proc_slots
+from app.agent.sandbox import run_checker as sandbox_run_checker
+
+# Agent kinds whose run()/stream() take the task (checker, tests).
+TASK_AWARE_KINDS = ("exec", "selftest", "cascade", "consensus")
+# Backend label the chat clients use for their LLM call slots.
+LLM_BACKENDS = {"local": "llama", "api": "openai"}
+# Pool size for ``--workers auto`` on hosted API engines, which expose no slot count.
+BENCH_API_WORKERS = int(os.getenv("BENCH_API_WORKERS", "4"))
+
 ENGINE_MODULES = {
     "local-multi": "app.agent.engine_local_multi",
     "local-single": "app.agent.engine_local_single",
@@ -38,8 +57,19 @@ ENGINE_MODULES = {
     "api-exec": "app.agent.engine_api_exec",
     "local-selftest": "app.agent.engine_local_selftest",
     "api-selftest": "app.agent.engine_api_selftest",
+    "local-cascade": "app.agent.engine_local_cascade",
+    "api-cascade": "app.agent.engine_api_cascade",
+    "local-consensus": "app.agent.engine_local_consensus",
+    "api-consensus": "app.agent.engine_api_consensus",
 }
 
+AGENT_ERROR_PREFIX = "agent error: "
+# Why a run was cut short; also the start of its ``error`` text.
+TASK_TIMEOUT = "task timeout"
+BUDGET_EXHAUSTED = "suite budget exhausted"
+# Rows with these errors say nothing about the engine, so --resume runs them again.
+_RETRY_ERROR_PREFIXES = (AGENT_ERROR_PREFIX, BUDGET_EXHAUSTED)
+
 CODE_BLOCK_RE = re.compile(r"```(?P<lang>[^\n]*)\n(?P<code>.*?)```", re.DOTALL)
 
 
@@ -74,16 +104,78 @@ def load_tasks(path: Path) -> List[Task]:
     return tasks
 
 
-def load_agent(engine_name: str) -> Callable[..., Dict[str, str]]:
+def load_agent(
+    engine_name: str, progress: bool = False, model: Optional[str] = None
+) -> Callable[..., Dict[str, str]]:
     module_name = ENGINE_MODULES.get(engine_name)
     if not module_name:
         raise ValueError(f"Unknown engine '{engine_name}'. Choices: {', '.join(ENGINE_MODULES)}")
+    if model:
+        return _model_agent(engine_name, model, progress)
     module = importlib.import_module(module_name)
+    if progress and hasattr(module, "agent_stream"):
+        return _progress_reply(module.agent_stream)
     if not hasattr(module, "agent_reply"):
         raise AttributeError(f"{module_name} is missing agent_reply()")
     return module.agent_reply  
 
 
+def _model_agent(engine_name: str, model: str, progress: bool) -> Callable[..., Dict[str, str]]:
+    """Engine agent on a specific model, built through the shared engine registry."""
+
+    from app.agent.factory import REGISTRY, EngineConfig
+
+    config = EngineConfig.from_name(engine_name, model=model)
+    agent = REGISTRY.get(config)
+
+    def call_kwargs(kwargs: Dict[str, object]) -> Dict[str, object]:
+        # Same arguments the engine_* modules pass: only task-aware kinds take the task.
+        if config.kind in TASK_AWARE_KINDS:
+            return {"task": kwargs.get("task"), "cancel": kwargs.get("cancel")}
+        return {"cancel": kwargs.get("cancel")}
+
+    def stream(message: str, history, **kwargs) -> Iterable[Dict[str, object]]:
+        return agent.stream(message, history, **call_kwargs(kwargs))
+
+    def reply(message: str, history=None, **kwargs) -> Dict[str, str]:
+        return agent.run(message, history, **call_kwargs(kwargs))
+
+    return _progress_reply(stream) if progress else reply
+
+
+def _format_progress(event: Dict[str, object]) -> str:
+    stage = str(event.get("stage", ""))
+    content = str(event.get("content") or "").strip()
+    first_line = content.splitlines()[0] if content else ""
+    if stage == "checker_result":
+        mark = "✔" if event.get("success") else "✖"
+        first_line = f"{mark} {first_line} ({event.get('checker_ms', 0)} ms)"
+    elif stage == "candidate":
+        found = "code found" if event.get("code_found") else "no code block"
+        first_line = f"{found} ({event.get('llm_ms', 0)} ms LLM)"
+    elif stage.startswith("coder"):
+        first_line = f"{len(content)} chars"
+    return f"  · [{event.get('elapsed_ms', '-'):>9} ms] {stage}: {first_line}"
+
+
+def _progress_reply(stream: Callable[..., Iterable[Dict[str, object]]]) -> Callable[..., Dict[str, str]]:
+    """Adapt an engine's agent_stream() into agent_reply() that prints progress."""
+
+    def reply(message: str, **kwargs) -> Dict[str, str]:
+        result: Dict[str, str] = {}
+        for event in stream(message, None, **kwargs):
+            if event.get("stage") == "complete":
+                result = {
+                    "headline": str(event.get("headline", "")),
+                    "body": str(event.get("body", event.get("content", ""))),
+                }
+            else:
+                print(_format_progress(event), flush=True)
+        return result
+
+    return reply
+
+
 def extract_code_block(markdown: str, preferred_language: Optional[str]) -> Optional[str]:
     matches = list(CODE_BLOCK_RE.finditer(markdown))
     if not matches:
@@ -103,21 +195,8 @@ def extract_code_block(markdown: str, preferred_language: Optional[str]) -> Opti
     return matches[-1].group("code").strip()
 
 
-def run_checker(checker: Path, code: str) -> Tuple[bool, str]:
-    with tempfile.TemporaryDirectory(prefix="bench-submission-") as tmpdir:
-        submission = Path(tmpdir) / "submission.py"
-        submission.write_text(code, encoding="utf-8")
-        proc = subprocess.run(
-            [sys.executable, str(checker), str(submission)],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        output = (proc.stdout + proc.stderr).strip()
-        success = proc.returncode == 0
-        if not output:
-            output = "PASS" if success else "checker failed without output"
-        return success, output
+def run_checker(checker: Path, code: str, cancel: Optional[CancelToken] = None) -> Tuple[bool, str]:
+    return sandbox_run_checker(checker, code, cancel=cancel, prefix="bench-submission-")
 
 
 def write_results(path: Path, results: Iterable[Dict[str, object]]) -> None:
@@ -128,84 +207,497 @@ def write_results(path: Path, results: Iterable[Dict[str, object]]) -> None:
             fp.write("\n")
 
 
-def run_suite(
-    tasks: List[Task],
-    agent: Callable[..., Dict[str, str]],
-    engine_name: str,
-    output_path: Path,
-    label: str = "",
+def parse_shard(value: str) -> Tuple[int, int]:
+    """``"2/4"`` -> ``(2, 4)``; shards are numbered from 1."""
+
+    index, sep, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        shard = (0, 0)
+    if not sep or not 1 <= shard[0] <= shard[1]:
+        raise ValueError(f"Invalid shard '{value}'; expected i/n with 1 <= i <= n")
+    return shard
+
+
+def shard_of(task_id: str, count: int) -> int:
+    """Stable 1-based shard for ``task_id``: the same on every host and Python run."""
+
+    digest = hashlib.sha1(task_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def select_shard(tasks: List[Task], shard: Tuple[int, int]) -> List[Task]:
+    index, count = shard
+    return [task for task in tasks if shard_of(task.task_id, count) == index]
+
+
+def _row_key(row: Dict[str, object]) -> Tuple[str, str, str]:
+    return str(row.get("task_id")), str(row.get("engine")), str(row.get("label") or "")
+
+
+def read_results(path: Path) -> Iterator[Tuple[int, bytes, Dict[str, object]]]:
+    """Yield ``(offset, raw line, row)`` for each parseable row.
+
+    A line cut short by a crash mid-write does not parse and is skipped.
+    """
+
+    if not path.exists():
+        return
+    with path.open("rb") as fp:
+        offset = 0
+        for raw in fp:
+            try:
+                row = json.loads(raw)
+            except ValueError:
+                row = None
+            if isinstance(row, dict) and "task_id" in row:
+                yield offset, raw if raw.endswith(b"\n") else raw + b"\n", row
+            offset += len(raw)
+
+
+def completed_task_ids(path: Path, engine_name: str, label: str = "") -> Set[str]:
+    """Task IDs already recorded for this engine and label.
+
+    Rows whose agent call raised (backend down, connection reset) or that
+    the suite budget cut short do not count, so ``--resume`` retries them.
+    """
+
+    done: Set[str] = set()
+    for _offset, _raw, row in read_results(path):
+        if _row_key(row)[1:] != (engine_name, label):
+            continue
+        if str(row.get("error") or "").startswith(_RETRY_ERROR_PREFIXES):
+            done.discard(str(row["task_id"]))
+        else:
+            done.add(str(row["task_id"]))
+    return done
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with path.open("rb") as fp:
+        fp.seek(-1, os.SEEK_END)
+        return fp.read(1) == b"\n"
+
+
+class ResultWriter:
+    """Appends one row per finished task and flushes it straight to disk."""
+
+    def __init__(self, path: Path, append: bool = False) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._fp = path.open("a" if append else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        if append and self._fp.tell() and not _ends_with_newline(path):
+            # Terminate a row torn by a crash so the next row starts on its own line.
+            self._fp.write("\n")
+
+    def write(self, row: Dict[str, object]) -> None:
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._fp.close()
+
+
+def compact_results(path: Path, tasks: List[Task], engine_name: str, label: str = "") -> Tuple[int, int]:
+    """Rewrite ``path`` in task order and keep the latest row per task.
+
+    Rows of other engines or labels stay first, in their original order.
+    Rows are copied from their byte offsets, so memory does not grow with
+    response sizes. Returns ``(rows, successes)`` for this engine and label.
+    """
+
+    order = {task.task_id: index for index, task in enumerate(tasks)}
+    others: List[int] = []
+    latest: Dict[str, Tuple[int, int, bool]] = {}
+    lengths: Dict[int, int] = {}
+    for offset, raw, row in read_results(path):
+        lengths[offset] = len(raw)
+        key = _row_key(row)
+        if key[1:] != (engine_name, label):
+            others.append(offset)
+        else:
+            latest[key[0]] = (offset, len(raw), bool(row.get("success")))
+    ours = sorted(latest.items(), key=lambda item: (order.get(item[0], len(order)), item[1][0]))
+    tmp_path = path.with_name(path.name + ".tmp")
+    with path.open("rb") as src, tmp_path.open("wb") as dst:
+        for offset in others + [entry[0] for _task_id, entry in ours]:
+            src.seek(offset)
+            raw = src.read(lengths[offset])
+            dst.write(raw if raw.endswith(b"\n") else raw + b"\n")
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp_path, path)
+    return len(ours), sum(1 for _task_id, entry in ours if entry[2])
+
+
+class TaskOutput(io.TextIOBase):
+    """``sys.stdout`` proxy that routes each task thread's prints into its own buffer."""
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(text)
+        with self._lock:
+            return self._stream.write(text)
+
+    def flush(self) -> None:
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    @contextmanager
+    def capture(self) -> Iterator[io.StringIO]:
+        buffer = io.StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+    def emit(self, text: str) -> None:
+        """Write a finished task's output in one piece."""
+
+        with self._lock:
+            self._stream.write(text)
+            self._stream.flush()
+
+
+def engine_backend(engine_name: str) -> str:
+    return engine_name.partition("-")[0]
+
+
+def resolve_workers(value: str, backend: str, task_count: int) -> int:
+    """Turn ``--workers`` into a pool size; ``auto`` asks the backend how much it can serve."""
+
+    if value != "auto":
+        workers = int(value)
+        if workers < 1:
+            raise ValueError("--workers must be a positive integer or 'auto'")
+    elif backend == "local":
+        from app.agent.llama_client import LlamaServerClient
+
+        try:
+            workers = LlamaServerClient().total_slots()
+        except RuntimeError as exc:
+            print(f"[bench] could not read llama-server slots ({exc}); running 1 worker")
+            workers = 1
+    else:
+        workers = BENCH_API_WORKERS
+    return max(1, min(workers, task_count))
+
+
+def configure_limits(
+    workers: Dict[str, int], llm_concurrency: Optional[int] = None, checker_concurrency: Optional[int] = None
 ) -> None:
-    results: List[Dict[str, object]] = []
-    total = len(tasks)
-    successes = 0
-
-    for index, task in enumerate(tasks, start=1):
-        print(f"[{index}/{total}] Running task '{task.task_id}'...", flush=True)
-        print("  --- Prompt --------------------------------------------------")
-        print(task.prompt.strip(), flush=True)
-        started = time.perf_counter()
-        error: Optional[str] = None
-        checker_output = ""
-        success = False
-        code_block = None
+    """Cap LLM calls per backend and checker processes for a run using ``workers`` per backend."""
 
+    for backend, count in workers.items():
+        if llm_concurrency is not None:
+            LLM_SLOTS.configure(llm_concurrency, LLM_BACKENDS[backend])
+        elif count > 1:
+            LLM_SLOTS.configure(count, LLM_BACKENDS[backend])
+    if checker_concurrency:
+        configure_proc_slots(checker_concurrency)
+
+
+def run_captured(output: TaskOutput, header: str, work: Callable[[], None]) -> None:
+    """Run ``work`` with its prints buffered, then emit them under ``header``."""
+
+    with output.capture() as buffer:
         try:
-            response = agent(task.prompt, task=task)
-            elapsed = time.perf_counter() - started
-            body = response.get("body", "")
-            headline = response.get("headline", "")
-        except Exception as exc:  
-            elapsed = time.perf_counter() - started
-            body = ""
-            headline = ""
-            error = f"agent error: {exc}"
-            print(f"  ✖ Agent call failed: {exc}")
-        else:
+            work()
+        finally:
+            output.emit(f"{header}\n{buffer.getvalue()}")
 
-            print("  --- Agent response -------------------------------------------")
-            print(body.strip() or "(empty response)", flush=True)
 
-            code_block = extract_code_block(body, task.language)
-            if not code_block:
-                error = "no code block found in response"
-                print("  ✖ Unable to locate code block in agent reply")
+def run_task(
+    task: Task,
+    agent: Callable[..., Dict[str, str]],
+    engine_name: str,
+    label: str = "",
+    fields: Optional[Dict[str, object]] = None,
+    timeout: Optional[float] = None,
+    timeout_reason: str = TASK_TIMEOUT,
+) -> Dict[str, object]:
+    """Run one task and return its result row.
+
+    With ``timeout`` the task's cancel token fires after that many seconds.
+    The token reaches the agent (its LLM streams are closed) and the checker
+    subprocess (its process group is killed), and the row gets status
+    ``timeout``.
+    """
+
+    print("  --- Prompt --------------------------------------------------")
+    print(task.prompt.strip(), flush=True)
+    started = time.perf_counter()
+    error: Optional[str] = None
+    checker_output = ""
+    success = False
+    code_block = None
+    trace = None
+    cancel = CancelToken()
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(max(timeout, 0.0), cancel.cancel, args=(timeout_reason,))
+        timer.daemon = True
+        timer.start()
+
+    try:
+        response = agent(task.prompt, task=task, cancel=cancel)
+        cancel.raise_if_cancelled()
+        elapsed = time.perf_counter() - started
+        body = response.get("body", "")
+        headline = response.get("headline", "")
+        trace = response.get("trace")
+    except AgentCancelled:
+        elapsed = time.perf_counter() - started
+        body = ""
+        headline = ""
+        print(f"  ✖ {cancel.reason} after {elapsed:.1f}s")
+    except Exception as exc:  
+        elapsed = time.perf_counter() - started
+        body = ""
+        headline = ""
+        error = f"{AGENT_ERROR_PREFIX}{exc}"
+        print(f"  ✖ Agent call failed: {exc}")
+    else:
+
+        print("  --- Agent response -------------------------------------------")
+        print(body.strip() or "(empty response)", flush=True)
+
+        code_block = extract_code_block(body, task.language)
+        if not code_block:
+            error = "no code block found in response"
+            print("  ✖ Unable to locate code block in agent reply")
 
+        else:
+            code_block = code_block.replace("<END-OF-CODE>", "").strip()
+            print("  --- Extracted code -------------------------------------------")
+            print(code_block or "(code block empty)", flush=True)
+
+            has_checker = bool(task.checker and task.checker.exists())
+            preflight = (
+                preflight_check(code_block, task.prompt)
+                if has_checker and PREFLIGHT_ENABLED
+                else None
+            )
+            if preflight is not None and not preflight.ok:
+                checker_output = preflight.report()
+                print(f"  ✖ Preflight -> {preflight.diagnostics[0].splitlines()[0]}")
+            elif has_checker:
+                try:
+                    success, checker_output = run_checker(task.checker, code_block, cancel)
+                except AgentCancelled:
+                    checker_output = f"checker killed: {cancel.reason}"
+                    print(f"  ✖ Checker -> {checker_output}")
+                else:
+                    print(f"  {'✔' if success else '✖'} Checker -> {checker_output.splitlines()[0]}")
             else:
-                code_block = code_block.replace("<END-OF-CODE>", "").strip()
-                print("  --- Extracted code -------------------------------------------")
-                print(code_block or "(code block empty)", flush=True)
+                success = True
+                checker_output = "no checker specified"
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if cancel.cancelled and not success:
+        status = "timeout"
+        error = f"{cancel.reason} after {timeout:.1f}s"
+    elif success:
+        status = "pass"
+    else:
+        status = "error" if error and error.startswith(AGENT_ERROR_PREFIX) else "fail"
+
+    result = {
+        "task_id": task.task_id,
+        "engine": engine_name,
+        "label": label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "elapsed_sec": round(elapsed, 3),
+        "success": success,
+        "status": status,
+        "error": error,
+        "checker_output": checker_output,
+        "headline": headline,
+        "response_body": body,
+        "code_block_present": code_block is not None,
+    }
+    if trace is not None:
+        result["trace"] = trace
+    if fields:
+        result.update(fields)
+    return result
+
+
+def previous_runs(path: Path, engine_name: str, label: str = "") -> Dict[str, Dict[str, object]]:
+    """Latest recorded row per task for this engine and label, before the file is rewritten."""
+
+    latest: Dict[str, Dict[str, object]] = {}
+    for _offset, _raw, row in read_results(path):
+        if _row_key(row)[1:] == (engine_name, label):
+            latest[str(row["task_id"])] = {"timestamp": row.get("timestamp"), "elapsed_sec": row.get("elapsed_sec")}
+    return latest
+
+
+def prioritize_new(tasks: List[Task], previous: Dict[str, Dict[str, object]]) -> List[Task]:
+    """Tasks with no recorded row first (in task order), then the longest-unrun ones."""
+
+    fresh = [task for task in tasks if task.task_id not in previous]
+    seen = [task for task in tasks if task.task_id in previous]
+    seen.sort(key=lambda task: str(previous[task.task_id].get("timestamp") or ""))
+    return fresh + seen
+
+
+class SuiteSchedule:
+    """Hands out tasks while the suite budget lasts and bounds how long each may run.
+
+    A task whose previous run took longer than the budget left is skipped so
+    shorter ones can still fit. Once the budget is gone, nothing new starts and
+    the timeout of a running task never reaches past the deadline.
+    """
+
+    def __init__(
+        self,
+        tasks: List[Task],
+        task_timeout: Optional[float] = None,
+        budget: Optional[float] = None,
+        estimates: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.task_timeout = task_timeout
+        self.deadline = time.monotonic() + budget if budget else None
+        self.estimates = estimates or {}
+        self.skipped: List[Task] = []
+        self._pending = deque(tasks)
+        self._lock = threading.Lock()
+
+    def next(self) -> Optional[Tuple[Task, Optional[float], str]]:
+        """``(task, timeout, timeout reason)`` for the next task to run, or ``None``."""
+
+        with self._lock:
+            while self._pending:
+                task = self._pending.popleft()
+                if self.deadline is None:
+                    return task, self.task_timeout, TASK_TIMEOUT
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.skipped.append(task)
+                    self.stop()
+                    return None
+                if self.estimates.get(task.task_id, 0.0) > remaining:
+                    self.skipped.append(task)
+                    continue
+                if self.task_timeout is not None and self.task_timeout <= remaining:
+                    return task, self.task_timeout, TASK_TIMEOUT
+                return task, remaining, BUDGET_EXHAUSTED
+            return None
+
+    def stop(self) -> None:
+        """Skip everything not yet handed out."""
+
+        self.skipped.extend(self._pending)
+        self._pending.clear()
 
-                if task.checker and task.checker.exists():
-                    success, checker_output = run_checker(task.checker, code_block)
-                    print(f"  {'✔' if success else '✖'} Checker -> {checker_output.splitlines()[0]}")
-                else:
-                    success = True
-                    checker_output = "no checker specified"
-
-        if success:
-            successes += 1
-
-        result = {
-            "task_id": task.task_id,
-            "engine": engine_name,
-            "label": label,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "elapsed_sec": round(elapsed, 3),
-            "success": success,
-            "error": error,
-            "checker_output": checker_output,
-            "headline": headline,
-            "response_body": body,
-            "code_block_present": code_block is not None,
-        }
-        results.append(result)
-
-    write_results(output_path, results)
 
+def run_suite(
+    tasks: List[Task],
+    agent: Callable[..., Dict[str, str]],
+    engine_name: str,
+    output_path: Path,
+    label: str = "",
+    workers: int = 1,
+    resume: bool = False,
+    fields: Optional[Dict[str, object]] = None,
+    task_timeout: Optional[float] = None,
+    suite_budget: Optional[float] = None,
+    prioritize: bool = False,
+) -> None:
+    """Run ``tasks`` on ``workers`` threads, appending each row as its task finishes.
+
+    With one worker the output streams live as before. With more, each task's
+    output is buffered and printed as one block when the task finishes. The
+    file is put back in task order at the end; a crash leaves every finished
+    row on disk for ``resume``. Tasks the suite budget leaves no time for are
+    not recorded, so a later ``--resume`` picks them up.
+    """
+
+    pending = tasks
+    if resume:
+        done = completed_task_ids(output_path, engine_name, label)
+        pending = [task for task in tasks if task.task_id not in done]
+        print(f"Resuming: {len(tasks) - len(pending)} of {len(tasks)} tasks already recorded in {output_path}")
+    previous = previous_runs(output_path, engine_name, label) if prioritize or suite_budget else {}
+    if prioritize:
+        pending = prioritize_new(pending, previous)
+    estimates = {
+        task_id: float(entry["elapsed_sec"])
+        for task_id, entry in previous.items()
+        if isinstance(entry.get("elapsed_sec"), (int, float))
+    }
+    schedule = SuiteSchedule(pending, task_timeout, suite_budget, estimates)
+    total = len(pending)
+    numbers = itertools.count(1)
+    statuses: Dict[str, int] = {}
+    status_lock = threading.Lock()
+    writer = ResultWriter(output_path, append=resume)
+
+    def execute(task: Task, timeout: Optional[float], reason: str) -> None:
+        row = run_task(task, agent, engine_name, label, fields, timeout=timeout, timeout_reason=reason)
+        writer.write(row)
+        with status_lock:
+            statuses[str(row["status"])] = statuses.get(str(row["status"]), 0) + 1
+
+    try:
+        if workers <= 1:
+            while (item := schedule.next()) is not None:
+                print(f"[{next(numbers)}/{total}] Running task '{item[0].task_id}'...", flush=True)
+                execute(*item)
+        else:
+            output = TaskOutput(sys.stdout)
+
+            def work() -> None:
+                while (item := schedule.next()) is not None:
+                    header = f"[{next(numbers)}/{total}] Task '{item[0].task_id}'"
+                    run_captured(output, header, lambda: execute(*item))
+
+            print(f"Running {total} tasks on {workers} workers...", flush=True)
+            sys.stdout = output
+            try:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench") as pool:
+                    futures = [pool.submit(work) for _ in range(workers)]
+                    try:
+                        for future in as_completed(futures):
+                            future.result()
+                    except KeyboardInterrupt:
+                        schedule.stop()
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        raise
+            finally:
+                sys.stdout = output._stream
+    finally:
+        writer.close()
+
+    rows, successes = compact_results(output_path, tasks, engine_name, label)
+    ran = sum(statuses.values())
+    breakdown = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
     print(
-        f"\nCompleted {total} tasks with {successes} successes. "
+        f"\nCompleted {ran} tasks ({breakdown or 'none'}); {rows} recorded with {successes} successes. "
         f"Results stored in {output_path}"
     )
+    if schedule.skipped:
+        print(
+            f"Suite budget: {len(schedule.skipped)} tasks not run "
+            f"({', '.join(task.task_id for task in schedule.skipped[:10])}"
+            f"{', ...' if len(schedule.skipped) > 10 else ''}); rerun with --resume to continue."
+        )
 
 
 def parse_args(argv: List[str]) -> argparse.Namespace:
@@ -222,6 +714,12 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         default="local-multi",
         help="Which agent engine implementation to use.",
     )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Model name to run the engine on (default: LLAMA_SERVER_MODEL / OPENAI_MODEL).",
+    )
     parser.add_argument(
         "--limit",
         type=int,
@@ -240,6 +738,60 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         default="",
         help="Optional run label stored in each result row (e.g., pipeline or experiment name).",
     )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Stream per-attempt/per-stage progress events with timings while each task runs.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Run only shard i of n (e.g. 2/4), split by a stable hash of task_id; "
+        "combine shard outputs with app/bench_merge.py.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Append to --output and skip tasks already recorded there for this engine and label.",
+    )
+    parser.add_argument(
+        "--task-timeout",
+        type=float,
+        default=None,
+        help="Cancel a task (agent and checker) after this many seconds and record status 'timeout'.",
+    )
+    parser.add_argument(
+        "--suite-budget",
+        type=float,
+        default=None,
+        help="Stop starting tasks after this many seconds; running tasks are cut off at the deadline.",
+    )
+    parser.add_argument(
+        "--prioritize-new",
+        action="store_true",
+        help="Run tasks with no row in --output first, then those run longest ago.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=str,
+        default="1",
+        help="Tasks to run concurrently, or 'auto' (llama-server slots for local engines, "
+        "BENCH_API_WORKERS for API engines).",
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=None,
+        help="Cap on concurrent LLM calls across all workers (default: the worker count when above 1, "
+        "else LLM_MAX_CONCURRENCY).",
+    )
+    parser.add_argument(
+        "--checker-concurrency",
+        type=int,
+        default=None,
+        help="Cap on concurrent checker subprocesses (default: SANDBOX_MAX_PROCS).",
+    )
     return parser.parse_args(argv)
 
 
@@ -248,8 +800,29 @@ def main(argv: Optional[List[str]] = None) -> None:
     tasks = load_tasks(args.tasks)
     if args.limit:
         tasks = tasks[: args.limit]
-    agent = load_agent(args.engine)
-    run_suite(tasks, agent, args.engine, args.output, label=args.label)
+    fields: Dict[str, object] = {}
+    if args.shard:
+        shard = parse_shard(args.shard)
+        tasks = select_shard(tasks, shard)
+        fields["shard"] = f"{shard[0]}/{shard[1]}"
+        print(f"Shard {fields['shard']}: {len(tasks)} tasks")
+    backend = engine_backend(args.engine)
+    workers = resolve_workers(args.workers, backend, len(tasks))
+    configure_limits({backend: workers}, args.llm_concurrency, args.checker_concurrency)
+    agent = load_agent(args.engine, progress=args.progress, model=args.model)
+    run_suite(
+        tasks,
+        agent,
+        args.engine,
+        args.output,
+        label=args.label,
+        workers=workers,
+        resume=args.resume,
+        fields=fields,
+        task_timeout=args.task_timeout,
+        suite_budget=args.suite_budget,
+        prioritize=args.prioritize_new,
+    )
 
 
 if __name__ == "__main__":
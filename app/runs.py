@@ -0,0 +1,341 @@
+"""Shared pipeline runs: per-session ordering and in-flight deduplication.
+
+A ``PipelineRun`` executes one agent request and buffers everything it
+produces. Identical concurrent requests (same session, message and engine,
+whichever route they arrive on) attach to the same run instead of starting
+another pipeline. Runs on
+the same session are admitted one at a time in arrival order, so every run
+sees the history written by the run before it.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from agent.cancellation import CancelToken, raise_if_cancelled
+
+RUN_RETAIN_COUNT = int(os.getenv("AGENT_RUN_RETAIN", "64"))
+RUN_RETAIN_SEC = float(os.getenv("AGENT_RUN_RETAIN_SEC", "300"))
+# How long a run with no attached clients keeps going, so a reconnect can resume it.
+RUN_ORPHAN_GRACE_SEC = float(os.getenv("AGENT_RUN_ORPHAN_GRACE_SEC", "10"))
+_POLL_SEC = 0.05
+
+# Called with (seq, event) for each event, then (len(events), None) at the end.
+Listener = Callable[[int, Optional[Dict[str, Any]]], None]
+
+
+class RunKey(NamedTuple):
+    session_id: str
+    message: str
+    engine: str
+
+
+class PipelineRun:
+    """One execution of an agent request, observable by many subscribers."""
+
+    def __init__(self, key: RunKey, on_finish: Callable[["PipelineRun"], None]) -> None:
+        self.key = key
+        self.run_id = uuid.uuid4().hex[:12]
+        self.finished_at: float | None = None
+        self.events: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.done = False
+        self.cancel = CancelToken()
+        self.subscribers = 0
+        self._turn = threading.Event()
+        self._turn_callbacks: List[Callable[[], None]] = []
+        self._cond = threading.Condition()
+        self._listeners: List[Listener] = []
+        self._on_finish = on_finish
+
+    # -- subscribers ---------------------------------------------------------
+
+    def attach(self) -> None:
+        with self._cond:
+            self.subscribers += 1
+
+    def detach(self, immediate: bool = False) -> None:
+        """Drop one subscriber; an unfinished run left without any is cancelled.
+
+        Cancellation waits ``RUN_ORPHAN_GRACE_SEC`` so a client that
+        reconnects quickly can re-attach instead of losing the run. An
+        explicit cancel passes ``immediate`` to skip the grace period.
+        """
+
+        with self._cond:
+            self.subscribers -= 1
+            orphaned = self.subscribers <= 0 and not self.done
+        if not orphaned:
+            return
+        if immediate or RUN_ORPHAN_GRACE_SEC <= 0:
+            self._abandon_if_orphaned()
+            return
+        timer = threading.Timer(RUN_ORPHAN_GRACE_SEC, self._abandon_if_orphaned)
+        timer.daemon = True
+        timer.start()
+
+    def _abandon_if_orphaned(self) -> None:
+        with self._cond:
+            orphaned = self.subscribers <= 0 and not self.done
+        if orphaned:
+            self.cancel.cancel("all clients disconnected")
+
+    # -- producer side -------------------------------------------------------
+
+    def on_turn(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call ``callback`` once this run's turn comes; returns an unregister function.
+
+        Lets an event loop wait for its turn without parking a thread in
+        ``wait_turn``. The callback runs on whichever thread frees the lane.
+        """
+
+        with self._cond:
+            if not self._turn.is_set():
+                self._turn_callbacks.append(callback)
+
+                def unregister() -> None:
+                    with self._cond:
+                        if callback in self._turn_callbacks:
+                            self._turn_callbacks.remove(callback)
+
+                return unregister
+        callback()
+        return lambda: None
+
+    def _grant_turn(self) -> None:
+        with self._cond:
+            self._turn.set()
+            callbacks, self._turn_callbacks = self._turn_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def wait_turn(self) -> None:
+        """Block until every earlier run on this session has finished."""
+
+        while not self._turn.wait(_POLL_SEC):
+            raise_if_cancelled(self.cancel)
+        raise_if_cancelled(self.cancel)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        with self._cond:
+            self.events.append(event)
+            seq = len(self.events)
+            listeners = list(self._listeners)
+            self._cond.notify_all()
+        for listener in listeners:
+            listener(seq, event)
+
+    def finish(self, result: Any = None, error: BaseException | None = None) -> None:
+        with self._cond:
+            if self.done:
+                return
+            self.result = result
+            self.error = error
+            self.done = True
+            self.finished_at = time.monotonic()
+            seq = len(self.events)
+            listeners, self._listeners = self._listeners, []
+            self._cond.notify_all()
+        self._on_finish(self)
+        for listener in listeners:
+            listener(seq, None)
+
+    # -- consumer side -------------------------------------------------------
+
+    def listen(self, listener: Listener, start: int = 0) -> Callable[[], None]:
+        """Replay events after sequence number ``start`` and forward new ones.
+
+        A ``None`` event marks the end of the run. Returns an unregister
+        function. Callbacks run on the producer thread and must not block.
+        """
+
+        with self._cond:
+            backlog = self.events[start:]
+            finished = self.done
+            end = len(self.events)
+            if not finished:
+                self._listeners.append(listener)
+        for offset, event in enumerate(backlog, start + 1):
+            listener(offset, event)
+        if finished:
+            listener(end, None)
+            return lambda: None
+
+        def unregister() -> None:
+            with self._cond:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+
+        return unregister
+
+    def follow(
+        self,
+        cancel: CancelToken | None = None,
+        start: int = 0,
+        idle_sec: float | None = None,
+    ) -> Iterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """Blocking iterator of ``(seq, event)`` after sequence number ``start``.
+
+        With ``idle_sec``, yields ``None`` whenever that long passes without an
+        event so the caller can send a heartbeat.
+        """
+
+        index = start
+        while True:
+            idle_since = time.monotonic()
+            with self._cond:
+                while index >= len(self.events) and not self.done:
+                    self._cond.wait(_POLL_SEC)
+                    raise_if_cancelled(cancel)
+                    if idle_sec is not None and time.monotonic() - idle_since >= idle_sec:
+                        break
+                pending = self.events[index:]
+                finished = self.done
+            if not pending and not finished:
+                yield None
+                continue
+            for offset, event in enumerate(pending, index + 1):
+                yield offset, event
+            index += len(pending)
+            if finished and index >= len(self.events):
+                return
+
+    def wait(self, cancel: CancelToken | None = None) -> Any:
+        """Block until the run finishes; return its result or raise its error."""
+
+        with self._cond:
+            while not self.done:
+                self._cond.wait(_POLL_SEC)
+                raise_if_cancelled(cancel)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RunCoordinator:
+    """Registry of in-flight runs and per-session FIFO lanes.
+
+    Finished runs stay addressable by ``run_id`` for a while (bounded by
+    ``retain_count`` and ``retain_sec``) so a reconnecting stream can resume
+    from the buffer instead of recomputing.
+    """
+
+    def __init__(self, retain_count: int = RUN_RETAIN_COUNT, retain_sec: float = RUN_RETAIN_SEC) -> None:
+        self.retain_count = retain_count
+        self.retain_sec = retain_sec
+        self._lock = threading.Lock()
+        self._inflight: Dict[RunKey, PipelineRun] = {}
+        self._lanes: Dict[str, Deque[PipelineRun]] = {}
+        self._by_id: Dict[str, PipelineRun] = {}
+        self._retained: "OrderedDict[str, PipelineRun]" = OrderedDict()
+
+    def join(self, key: RunKey) -> Tuple[PipelineRun, bool]:
+        """Attach to an identical in-flight run or enqueue a new one.
+
+        Returns ``(run, leader)``; the leader is responsible for executing the
+        run and must always call ``run.finish``.
+        """
+
+        with self._lock:
+            run = self._inflight.get(key)
+            if run is not None and not run.done and not run.cancel.cancelled:
+                run.attach()
+                return run, False
+            run = PipelineRun(key, self._finished)
+            run.attach()
+            self._inflight[key] = run
+            self._by_id[run.run_id] = run
+            self._enqueue(run)
+            return run, True
+
+    def create(self, key: RunKey) -> PipelineRun:
+        """A detached run that only joins its session's lane once ``enqueue`` is called.
+
+        Used for background jobs, which wait in their own queue first and must
+        not hold up interactive requests on the same session meanwhile.
+        """
+
+        run = PipelineRun(key, self._finished)
+        with self._lock:
+            self._by_id[run.run_id] = run
+        return run
+
+    def enqueue(self, run: PipelineRun) -> None:
+        with self._lock:
+            self._enqueue(run)
+
+    def _enqueue(self, run: PipelineRun) -> None:
+        lane = self._lanes.setdefault(run.key.session_id, deque())
+        lane.append(run)
+        if len(lane) == 1:
+            run._grant_turn()
+
+    def resume(self, run_id: str, session_id: str) -> Optional[PipelineRun]:
+        """Attach to a live or recently finished run of ``session_id``."""
+
+        with self._lock:
+            self._prune()
+            run = self._by_id.get(run_id)
+            if run is None or run.key.session_id != session_id:
+                return None
+            run.attach()
+            return run
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        while self._retained:
+            run_id, run = next(iter(self._retained.items()))
+            if len(self._retained) <= self.retain_count and now - run.finished_at <= self.retain_sec:
+                break
+            del self._retained[run_id]
+            self._by_id.pop(run_id, None)
+
+    def _finished(self, run: PipelineRun) -> None:
+        with self._lock:
+            if self._inflight.get(run.key) is run:
+                del self._inflight[run.key]
+            self._retained[run.run_id] = run
+            self._prune()
+            lane = self._lanes.get(run.key.session_id)
+            if lane is None:
+                return
+            if run in lane:
+                lane.remove(run)
+            if lane:
+                lane[0]._grant_turn()
+            else:
+                del self._lanes[run.key.session_id]
+
+    def start(self, run: PipelineRun, work: Callable[[PipelineRun], Any]) -> threading.Thread:
+        """Execute ``work`` on a background thread once the run's turn comes."""
+
+        def execute() -> None:
+            try:
+                run.wait_turn()
+                result = work(run)
+            except BaseException as exc:
+                run.finish(error=exc)
+            else:
+                run.finish(result=result)
+
+        thread = threading.Thread(target=execute, name=f"run-{run.run_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "inflight": len(self._inflight),
+                "retained": len(self._retained),
+                "sessions": len(self._lanes),
+                "queued": sum(len(lane) - 1 for lane in self._lanes.values()),
+            }
+
+
+__all__ = ["PipelineRun", "RunCoordinator", "RunKey"]
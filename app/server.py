@@ -4,11 +4,17 @@
 from __future__ import annotations
 
 import json
-import uuid
+import os
+import queue
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
 from http import HTTPStatus
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Dict, Iterator
 from urllib.parse import parse_qs, urlparse
 
 try:
@@ -17,13 +23,49 @@ except ModuleNotFoundError:
     def load_dotenv(*_args, **_kwargs): 
         return False
 
-from agent import ENGINE_ALIAS_MAP, agent_reply, agent_stream, normalize_engine_name
+load_dotenv()
 
-APP_DIR = Path(__file__).resolve().parent
-PUBLIC_DIR = APP_DIR.parent / "public"
-SESSIONS: Dict[str, Dict[str, Any]] = {}
+from agent.cancellation import AgentCancelled, CancelToken
+from runs import PipelineRun
+from service import (
+    ASSETS,
+    JOB_PATH_RE,
+    METRICS_CONTENT_TYPE,
+    PUBLIC_DIR,
+    RUNS,
+    SSE_HEARTBEAT,
+    SSE_HEARTBEAT_SEC,
+    SSE_STREAMS,
+    WARMUP_ENABLED,
+    WS_CONNECTIONS,
+    AgentChannel,
+    RequestError,
+    cached_reply,
+    cancel_job,
+    create_session,
+    execute_turn,
+    final_event,
+    get_job,
+    job_event_start,
+    join_run,
+    observe_request,
+    pending_jobs,
+    prepare_turn,
+    render_metrics,
+    resume_run,
+    sse_frame,
+    sse_preamble,
+    submit_job,
+    warm_up,
+)
+from static_assets import API_CACHE_CONTROL
+from supervisor import LIFECYCLE, SERVER_WORKERS, WORKER_GRACE_SEC, Supervisor, is_worker, worker_socket
+from ws_protocol import CLOSE_GOING_AWAY, HandshakeError, ServerProtocol, accept_handshake, handshake_response
 
-load_dotenv()
+DISCONNECT_POLL_SEC = 0.05
+
+SERVER_MODES = ("threaded", "async")
+SERVER_MODE = os.getenv("AGENT_SERVER_MODE", "threaded").lower()
 
 
 def _read_body(handler: SimpleHTTPRequestHandler) -> Dict:
@@ -35,6 +77,28 @@ def _read_body(handler: SimpleHTTPRequestHandler) -> Dict:
         return {}
 
 
+def _watch_disconnect(sock: socket.socket, token: CancelToken, done: threading.Event) -> None:
+    """Cancel ``token`` as soon as the peer closes its end of ``sock``."""
+
+    while not done.is_set() and not token.cancelled:
+        try:
+            readable, _, _ = select.select([sock], [], [], DISCONNECT_POLL_SEC)
+        except (OSError, ValueError):
+            token.cancel("client disconnected")
+            return
+        if not readable:
+            continue
+        try:
+            peeked = sock.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            continue
+        except OSError:
+            peeked = b""
+        if not peeked:
+            token.cancel("client disconnected")
+        return
+
+
 class AgentHandler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(PUBLIC_DIR), **kwargs)
@@ -43,8 +107,28 @@ class AgentHandler(SimpleHTTPRequestHandler):
         """Silence default stdout logging to keep CLI tidy."""
         return
 
+    def send_response(self, code, message=None) -> None:
+        self._status = int(code)
+        super().send_response(code, message)
+
+    @contextmanager
+    def _observed(self) -> Iterator[None]:
+        """Record the request in the route/engine metrics once it is answered."""
+
+        started = time.perf_counter()
+        self._status = None
+        self._engine = ""
+        LIFECYCLE.request_started()
+        try:
+            yield
+        finally:
+            LIFECYCLE.request_finished()
+            observe_request(urlparse(self.path).path, self._engine, self._status, time.perf_counter() - started)
+
     def end_headers(self) -> None:
-        self.send_header("Cache-Control", "no-store")
+        # Static assets carry their own validators; only API responses are uncacheable.
+        if self.path.startswith("/api/"):
+            self.send_header("Cache-Control", API_CACHE_CONTROL)
         super().end_headers()
 
     def _json_response(
@@ -54,119 +138,311 @@ class AgentHandler(SimpleHTTPRequestHandler):
         self.send_response(status.value)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(data)))
-        super().end_headers()
+        self.end_headers()
         self.wfile.write(data)
 
+    @contextmanager
+    def _cancel_on_disconnect(self) -> Iterator[CancelToken]:
+        token = CancelToken()
+        done = threading.Event()
+        watcher = threading.Thread(
+            target=_watch_disconnect,
+            args=(self.connection, token, done),
+            daemon=True,
+        )
+        watcher.start()
+        try:
+            yield token
+        finally:
+            done.set()
+
     def do_GET(self) -> None:  
-        if self.path.startswith("/api/agent-stream"):
-            return self._handle_agent_stream()
-        return super().do_GET()
+        with self._observed():
+            if self.path.startswith("/api/agent-stream"):
+                return self._handle_agent_stream()
+            path = urlparse(self.path).path
+            if path == "/api/ws":
+                return self._handle_websocket()
+            if path == "/metrics":
+                return self._handle_metrics()
+            match = JOB_PATH_RE.match(path)
+            if match is not None:
+                return self._handle_job(match.group("job_id"), events=bool(match.group("events")))
+            return self._serve_static()
+
+    def do_HEAD(self) -> None:
+        with self._observed():
+            return self._serve_static(head_only=True)
+
+    def _handle_metrics(self) -> None:
+        data = render_metrics()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _serve_static(self, head_only: bool = False) -> None:
+        response = ASSETS.respond(
+            urlparse(self.path).path,
+            self.headers.get("If-None-Match", ""),
+            self.headers.get("Accept-Encoding", ""),
+        )
+        if response is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        self.send_response(response.status.value)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if response.status == HTTPStatus.OK:
+            self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        if response.body and not head_only:
+            self.wfile.write(response.body)
 
     def do_POST(self) -> None: 
-        if self.path == "/api/session":
-            return self._handle_session()
-        if self.path == "/api/agent":
-            return self._handle_agent()
-        self._json_response({"error": "Route not found"}, HTTPStatus.NOT_FOUND)
+        with self._observed():
+            if self.path == "/api/session":
+                return self._handle_session()
+            if self.path == "/api/agent":
+                return self._handle_agent()
+            if self.path == "/api/jobs":
+                return self._handle_job_submit()
+            self._json_response({"error": "Route not found"}, HTTPStatus.NOT_FOUND)
+
+    def do_DELETE(self) -> None:
+        with self._observed():
+            match = JOB_PATH_RE.match(urlparse(self.path).path)
+            if match is None or match.group("events"):
+                self._json_response({"error": "Route not found"}, HTTPStatus.NOT_FOUND)
+                return
+            try:
+                payload = cancel_job(match.group("job_id"))
+            except RequestError as exc:
+                self._json_response(exc.payload(), exc.status)
+                return
+            self._engine = payload["engine"]
+            self._json_response(payload)
 
 
     def _handle_session(self) -> None:
-        payload = _read_body(self)
-        requested_engine = (payload.get("engine") or "").strip().lower()
-        engine_override = normalize_engine_name(requested_engine) if requested_engine else None
-        session_id = str(uuid.uuid4())
-        SESSIONS[session_id] = {
-            "history": [],
-            "engine": engine_override,
-        }
-        effective_engine = engine_override or normalize_engine_name(None)
-        self._json_response(
-            {
-                "sessionId": session_id,
-                "engine": effective_engine,
-                "availableEngines": sorted(ENGINE_ALIAS_MAP.keys()),
-            }
-        )
+        self._json_response(create_session(_read_body(self)))
+
+    def _handle_job_submit(self) -> None:
+        try:
+            job = submit_job(_read_body(self))
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
+            return
+        self._engine = job["engine"]
+        self._json_response(job, HTTPStatus.ACCEPTED)
+
+    def _handle_job(self, job_id: str, events: bool) -> None:
+        try:
+            job = get_job(job_id)
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
+            return
+        self._engine = job.run.key.engine
+        if not events:
+            self._json_response(job.describe())
+            return
+        # Job streams only observe: a disconnect never cancels the job.
+        self._stream_run(job.run, job_event_start(job, self.headers.get("Last-Event-ID")), detach=False)
 
     def _handle_agent(self) -> None:
         payload = _read_body(self)
-        session_id = payload.get("sessionId")
-        message = (payload.get("message") or "").strip()
-        if not session_id or session_id not in SESSIONS:
-            self._json_response({"error": "Unknown session"}, HTTPStatus.BAD_REQUEST)
-            return
-        if not message:
-            self._json_response({"error": "Message required"}, HTTPStatus.BAD_REQUEST)
+        try:
+            turn = prepare_turn(payload.get("sessionId"), payload.get("message"), payload.get("engine"))
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
             return
 
-        session = SESSIONS[session_id]
-        history = list(session["history"])
-        requested_engine = (payload.get("engine") or "").strip().lower()
-        engine_choice = requested_engine or session.get("engine")
+        self._engine = turn.engine_name
+        cached = cached_reply(turn)
+        if cached is not None:
+            self._json_response(cached)
+            return
+        run, leader = join_run(turn)
+        if leader:
+            RUNS.start(run, lambda run: execute_turn(turn, run))
         try:
-            agent_message = agent_reply(message, history, engine=engine_choice)
+            with self._cancel_on_disconnect() as cancel:
+                cancel.register(run.detach)
+                agent_message = run.wait(cancel)
+        except AgentCancelled:
+            return
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
+            return
         except Exception as exc: 
             self._json_response(
                 {"error": f"Agent failed: {exc}"}, HTTPStatus.INTERNAL_SERVER_ERROR
             )
             return
 
-        session["history"].append({"role": "user", "content": message})
-        assistant_content = (agent_message.get("body") or "")[:1200]
-        session["history"].append({"role": "assistant", "content": assistant_content})
         self._json_response(agent_message)
 
     def _handle_agent_stream(self) -> None:
         parsed = urlparse(self.path)
         params = parse_qs(parsed.query or "")
-        session_id = (params.get("sessionId") or [""])[0]
-        message = ((params.get("message") or [""])[0] or "").strip()
-        if not session_id or session_id not in SESSIONS:
-            self._json_response({"error": "Unknown session"}, HTTPStatus.BAD_REQUEST)
+        try:
+            turn = prepare_turn(
+                (params.get("sessionId") or [""])[0],
+                (params.get("message") or [""])[0],
+                (params.get("engine") or [""])[0],
+            )
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
             return
-        if not message:
-            self._json_response({"error": "Message required"}, HTTPStatus.BAD_REQUEST)
+
+        self._engine = turn.engine_name
+        resumed = resume_run(turn, self.headers.get("Last-Event-ID"))
+        if resumed is not None:
+            run, start = resumed
+        else:
+            run, leader = join_run(turn)
+            start = 0
+            if leader:
+                RUNS.start(run, lambda run: execute_turn(turn, run))
+        self._stream_run(run, start, detach=True)
+
+    def _handle_websocket(self) -> None:
+        params = parse_qs(urlparse(self.path).query or "")
+        protocol = ServerProtocol()
+        outbox: "queue.Queue[bytes | None]" = queue.Queue()
+        try:
+            accept = accept_handshake(self.command, {name.lower(): value for name, value in self.headers.items()})
+            channel = AgentChannel(
+                (params.get("sessionId") or [""])[0],
+                lambda message: outbox.put(protocol.text(json.dumps(message))),
+                RUNS.start,
+            )
+        except HandshakeError as exc:
+            self._json_response({"error": str(exc)}, HTTPStatus(exc.status))
+            return
+        except RequestError as exc:
+            self._json_response(exc.payload(), exc.status)
+            return
+
+        self._status = HTTPStatus.SWITCHING_PROTOCOLS.value
+        self.wfile.write(handshake_response(accept))
+        self.close_connection = True
+        writer = threading.Thread(target=self._ws_writer, args=(protocol, channel, outbox), daemon=True)
+        writer.start()
+        WS_CONNECTIONS.inc()
+        try:
+            while not protocol.closed:
+                data = self.rfile.read1(65536)
+                if not data:
+                    break
+                for text in protocol.receive(data):
+                    channel.handle(text)
+                control = protocol.take_outgoing()
+                if control:
+                    outbox.put(control)
+        except OSError:
+            pass
+        finally:
+            channel.close()
+            outbox.put(None)
+            writer.join(SSE_HEARTBEAT_SEC)
+            WS_CONNECTIONS.dec()
+
+    def _ws_writer(self, protocol: ServerProtocol, channel: AgentChannel, outbox: "queue.Queue[bytes | None]") -> None:
+        """Sole writer of a WebSocket: queued frames, pings while idle, and a close when the worker retires."""
+
+        try:
+            while True:
+                try:
+                    data = outbox.get(timeout=SSE_HEARTBEAT_SEC)
+                except queue.Empty:
+                    if protocol.closed:
+                        # Our close frame went unanswered; unblock the reader.
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                        return
+                    if LIFECYCLE.retiring.is_set() and channel.idle:
+                        data = protocol.close(CLOSE_GOING_AWAY, "server restarting")
+                    else:
+                        data = protocol.ping()
+                if data is None:
+                    return
+                self.wfile.write(data)
+        except OSError:
             return
 
-        session = SESSIONS[session_id]
-        history = list(session["history"])
-        requested_engine = (params.get("engine") or [""])[0].strip().lower()
-        engine_choice = requested_engine or session.get("engine")
+    def _stream_run(self, run: PipelineRun, start: int, detach: bool) -> None:
+        """Send ``run``'s events after ``start`` as SSE until it finishes or the client leaves."""
+
         self.send_response(HTTPStatus.OK)
         self.send_header("Content-Type", "text/event-stream; charset=utf-8")
         self.send_header("Cache-Control", "no-store")
         self.send_header("Connection", "keep-alive")
         super().end_headers()
+        # The body has no length, so the stream ends when the connection does.
+        self.close_connection = True
 
-        final_body = ""
+        SSE_STREAMS.inc()
         try:
-            for event in agent_stream(message, history, engine=engine_choice):
-                if event.get("stage") == "complete":
-                    final_body = event.get("content", "")
-                self._sse_write(event)
-        except BrokenPipeError:
+            with self._cancel_on_disconnect() as cancel:
+                if detach:
+                    cancel.register(run.detach)
+                try:
+                    self._sse_send(sse_preamble())
+                    for item in run.follow(cancel, start=start, idle_sec=SSE_HEARTBEAT_SEC):
+                        if item is None:
+                            self._sse_send(SSE_HEARTBEAT)
+                            continue
+                        seq, event = item
+                        self._sse_write(event, f"{run.run_id}:{seq}")
+                    closing = final_event(run)
+                    if closing is not None:
+                        self._sse_write(closing)
+                except (BrokenPipeError, ConnectionResetError):
+                    cancel.cancel("client disconnected")
+                    return
+        except AgentCancelled:
             return
-        except Exception as exc:  
-            self._sse_write({"stage": "error", "content": f"Agent failed: {exc}"})
         finally:
-            if final_body:
-                session["history"].append({"role": "user", "content": message})
-                session["history"].append(
-                    {"role": "assistant", "content": final_body[:1200]}
-                )
+            SSE_STREAMS.dec()
 
-    def _sse_write(self, payload: Dict[str, str]) -> None:
-        data = json.dumps(payload).encode("utf-8")
-        self.wfile.write(b"data: ")
+    def _sse_write(self, payload: Dict[str, str], event_id: str | None = None) -> None:
+        self._sse_send(sse_frame(payload, event_id))
+
+    def _sse_send(self, data: bytes) -> None:
         self.wfile.write(data)
-        self.wfile.write(b"\n\n")
         self.wfile.flush()
 
 
 def run(host: str = "127.0.0.1", port: int = 8000) -> None:
-    server = ThreadingHTTPServer((host, port), AgentHandler)
-    print(f"Agent UI running at http://{host}:{port}")
-    server.serve_forever()
+    if SERVER_MODE not in SERVER_MODES:
+        raise SystemExit(f"Unknown AGENT_SERVER_MODE '{SERVER_MODE}'. Choices: {', '.join(SERVER_MODES)}")
+    if SERVER_WORKERS > 1 and not is_worker():
+        Supervisor(SERVER_WORKERS, host, port, Path(__file__).resolve()).run()
+        return
+    if WARMUP_ENABLED:
+        warm_up()
+    sock = worker_socket(host, port)
+    if SERVER_MODE == "async":
+        from async_server import serve
+
+        serve(host, port, sock=sock)
+        return
+    if sock is None:
+        server = ThreadingHTTPServer((host, port), AgentHandler)
+        print(f"Agent UI running at http://{host}:{port}")
+    else:
+        server = ThreadingHTTPServer(sock.getsockname()[:2], AgentHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+    LIFECYCLE.start(server.shutdown)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    LIFECYCLE.drain(WORKER_GRACE_SEC, busy=pending_jobs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,617 @@
+"""Transport-independent session and turn handling shared by the HTTP servers."""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent import ENGINE_ALIAS_MAP, agent_stream, normalize_engine_name, warm_up_engines
+from agent.cancellation import AgentCancelled
+from agent.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from agent.metrics import LLM_RECENT_SECONDS, METRICS, hit_ratio
+from jobs import Job, JobQueueFull, build_job_manager
+from load_policy import EngineChoice, build_load_policy
+from prompt_cache import CacheHit, build_prompt_cache
+from runs import PipelineRun, RunCoordinator, RunKey
+from session_store import build_session_store
+from static_assets import AssetCache
+
+APP_DIR = Path(__file__).resolve().parent
+PUBLIC_DIR = APP_DIR.parent / "public"
+ASSETS = AssetCache(PUBLIC_DIR)
+SESSIONS = build_session_store()
+RUNS = RunCoordinator()
+JOBS = build_job_manager(RUNS)
+PROMPT_CACHE = build_prompt_cache()
+LOAD_POLICY = build_load_policy(
+    depth=lambda: RUNS.snapshot()["inflight"] + JOBS.snapshot()["running"],
+    p95=lambda: LLM_RECENT_SECONDS.quantile("llama", 0.95),
+)
+HISTORY_CONTENT_CHARS = 1200
+
+SSE_HEARTBEAT_SEC = float(os.getenv("AGENT_SSE_HEARTBEAT_SEC", "15"))
+SSE_RETRY_MS = int(os.getenv("AGENT_SSE_RETRY_MS", "3000"))
+SSE_HEARTBEAT = b": ping\n\n"
+
+WARMUP_ENABLED = os.getenv("AGENT_WARMUP", "1").lower() not in ("0", "false", "no")
+# Comma-separated engine names; empty means just the default AGENT_ENGINE.
+WARMUP_ENGINES = [name.strip() for name in os.getenv("AGENT_WARMUP_ENGINES", "").split(",") if name.strip()]
+WARMUP_PREFILL = os.getenv("AGENT_WARMUP_PREFILL", "0").lower() in ("1", "true", "yes")
+
+ROUTE_LABELS = {
+    "/api/session": "session",
+    "/api/agent": "agent",
+    "/api/agent-stream": "agent-stream",
+    "/api/jobs": "jobs",
+    "/api/ws": "ws",
+    "/metrics": "metrics",
+}
+JOB_PATH_RE = re.compile(r"^/api/jobs/(?P<job_id>[0-9a-f]+)(?P<events>/events)?$")
+
+REQUESTS_TOTAL = METRICS.counter(
+    "agent_http_requests_total", "HTTP requests by route, engine and status.", ("route", "engine", "status")
+)
+REQUEST_SECONDS = METRICS.histogram(
+    "agent_http_request_duration_seconds",
+    "HTTP request latency by route and engine; streams count until they close.",
+    ("route", "engine"),
+)
+STAGE_SECONDS = METRICS.histogram(
+    "agent_stage_duration_seconds", "Time to produce each streamed pipeline stage.", ("engine", "stage")
+)
+SSE_STREAMS = METRICS.gauge("agent_sse_streams_active", "Open /api/agent-stream responses.")
+WS_CONNECTIONS = METRICS.gauge("agent_ws_connections_active", "Open /api/ws WebSocket connections.")
+PROMPT_CACHE_SIMILARITY = METRICS.histogram(
+    "agent_prompt_cache_hit_similarity",
+    "Estimated Jaccard similarity of prompt cache hits.",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0),
+)
+
+
+class RequestError(Exception):
+    """A client error that maps directly onto an HTTP status and JSON body."""
+
+    def __init__(self, message: str, status: HTTPStatus = HTTPStatus.BAD_REQUEST) -> None:
+        super().__init__(message)
+        self.status = status
+
+    def payload(self) -> Dict[str, str]:
+        return {"error": str(self)}
+
+
+@dataclass(slots=True)
+class Turn:
+    session_id: str
+    message: str
+    history: List[Dict[str, str]]
+    engine: str | None
+    # Set when the load policy replaced the requested engine or capped its options.
+    load: EngineChoice | None = None
+
+    @property
+    def engine_name(self) -> str:
+        return normalize_engine_name(self.engine)
+
+    @property
+    def agent_options(self) -> Dict[str, Any] | None:
+        if self.load is None or not self.load.options:
+            return None
+        return self.load.options
+
+    def report(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """``payload`` plus the engine that actually answered."""
+
+        report = {**payload, "engine": self.engine_name}
+        if self.load is not None:
+            report["degraded"] = self.load.payload()
+        return report
+
+
+def create_session(payload: Dict[str, Any]) -> Dict[str, Any]:
+    requested_engine = (payload.get("engine") or "").strip().lower()
+    engine_override = normalize_engine_name(requested_engine) if requested_engine else None
+    session_id = SESSIONS.create(engine_override)
+    effective_engine = engine_override or normalize_engine_name(None)
+    return {
+        "sessionId": session_id,
+        "engine": effective_engine,
+        "availableEngines": sorted(ENGINE_ALIAS_MAP.keys()),
+    }
+
+
+def prepare_turn(
+    session_id: str | None, message: str | None, engine: str | None = None, interactive: bool = True
+) -> Turn:
+    """Validate a chat request and snapshot the session history for the agent.
+
+    Interactive turns go through the load policy, which may pick a cheaper
+    engine while the backend is saturated; background jobs keep theirs.
+    """
+
+    message = (message or "").strip()
+    session = SESSIONS.get(session_id) if session_id else None
+    if session is None:
+        raise RequestError("Unknown session")
+    if not message:
+        raise RequestError("Message required")
+    requested_engine = (engine or "").strip().lower()
+    turn = Turn(
+        session_id=session.session_id,
+        message=message,
+        history=session.history,
+        engine=requested_engine or session.engine,
+    )
+    if interactive and LOAD_POLICY is not None:
+        choice = LOAD_POLICY.choose(turn.engine_name)
+        if choice.degraded:
+            turn.engine, turn.load = choice.engine, choice
+    return turn
+
+
+def record_turn(turn: Turn, body: str) -> None:
+    SESSIONS.append(
+        turn.session_id,
+        [
+            {"role": "user", "content": turn.message},
+            {"role": "assistant", "content": (body or "")[:HISTORY_CONTENT_CHARS]},
+        ],
+    )
+
+
+def join_run(turn: Turn) -> Tuple[PipelineRun, bool]:
+    """Share an identical in-flight request or queue a new run behind the session's.
+
+    JSON, SSE and WebSocket requests share one key, so the same turn sent on two
+    routes runs the pipeline (and writes history) once; the leader starts
+    ``execute_turn``, which serves both the event stream and the JSON reply.
+    """
+
+    return RUNS.join(RunKey(turn.session_id, turn.message, turn.engine_name))
+
+
+def resume_run(turn: Turn, last_event_id: str | None) -> Optional[Tuple[PipelineRun, int]]:
+    """Re-attach a reconnecting stream to its run using ``Last-Event-ID`` (``run:seq``)."""
+
+    parsed = _parse_event_id(last_event_id)
+    if parsed is None:
+        return None
+    run_id, seq = parsed
+    run = RUNS.resume(run_id, turn.session_id)
+    if run is None:
+        return None
+    if run.key.message != turn.message:
+        run.detach()
+        return None
+    return run, min(seq, len(run.events))
+
+
+def _parse_event_id(last_event_id: str | None) -> Optional[Tuple[str, int]]:
+    run_id, sep, seq = (last_event_id or "").strip().partition(":")
+    if not sep or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+def final_event(run: PipelineRun) -> Optional[Dict[str, str]]:
+    """Closing SSE event for a run that did not complete normally."""
+
+    if run.error is None:
+        return None
+    if isinstance(run.error, AgentCancelled):
+        return {"stage": "cancelled", "content": f"Run cancelled: {run.error}"}
+    return {"stage": "error", "content": f"Agent failed: {run.error}"}
+
+
+def submit_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue a background run of the turn in ``payload``; returns the job description."""
+
+    turn = prepare_turn(payload.get("sessionId"), payload.get("message"), payload.get("engine"), interactive=False)
+    try:
+        priority = int(payload.get("priority") or 0)
+    except (TypeError, ValueError):
+        raise RequestError("priority must be an integer") from None
+    run = RUNS.create(RunKey(turn.session_id, turn.message, turn.engine_name))
+    try:
+        job = JOBS.submit(run, lambda run: execute_job(turn, run), priority)
+    except JobQueueFull as exc:
+        run.finish(error=AgentCancelled(str(exc)))
+        raise RequestError(str(exc), HTTPStatus.TOO_MANY_REQUESTS) from None
+    return job.describe()
+
+
+def get_job(job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise RequestError("Unknown job", HTTPStatus.NOT_FOUND)
+    return job
+
+
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    get_job(job_id)
+    return JOBS.cancel(job_id).describe()
+
+
+def pending_jobs() -> int:
+    """Jobs this process still has to run; a retiring worker drains them first."""
+
+    snapshot = JOBS.snapshot()
+    return snapshot["queued"] + snapshot["running"]
+
+
+def job_event_start(job: Job, last_event_id: str | None) -> int:
+    """Sequence number to resume a job's event stream from."""
+
+    parsed = _parse_event_id(last_event_id)
+    if parsed is None or parsed[0] != job.run.run_id:
+        return 0
+    return min(parsed[1], len(job.run.events))
+
+
+def sse_frame(payload: Dict[str, Any], event_id: str | None = None) -> bytes:
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def sse_preamble() -> bytes:
+    return f"retry: {SSE_RETRY_MS}\n\n".encode("ascii")
+
+
+# Executes a leader run's work; each server supplies its own executor.
+RunStarter = Callable[[PipelineRun, Callable[[PipelineRun], Any]], None]
+
+
+class AgentChannel:
+    """Message protocol of one ``/api/ws`` connection, independent of the transport.
+
+    Client messages carry a client-chosen ``id``:
+    - ``{"type": "submit", "id", "message", "engine"?, "lastEventId"?}`` runs a turn.
+    - ``{"type": "cancel", "id"}`` cancels that turn without waiting for the orphan grace.
+
+    Server messages:
+    - ``{"type": "ack", "id", ...}`` answers each accepted message; a submit ack
+      carries ``runId`` and the engine that will answer.
+    - ``{"type": "delta", "id", "eventId", "event"}`` for every pipeline event,
+      ending with a ``complete``, ``error`` or ``cancelled`` event.
+    - ``{"type": "error", "id", "error", "status"}`` for a rejected message.
+
+    ``send`` is called from pipeline threads, so it must be thread-safe and
+    must not block.
+    """
+
+    def __init__(self, session_id: str | None, send: Callable[[Dict[str, Any]], None], start: RunStarter) -> None:
+        session = SESSIONS.get(session_id) if session_id else None
+        if session is None:
+            raise RequestError("Unknown session")
+        self.session_id = session.session_id
+        self.send = send
+        self.start = start
+        self._active: Dict[str, Tuple[PipelineRun, Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def idle(self) -> bool:
+        with self._lock:
+            return not self._active
+
+    def handle(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            message = None
+        if not isinstance(message, dict) or not isinstance(message.get("id"), str) or not message["id"]:
+            self._reject(None, RequestError("Messages must be JSON objects with an id"))
+            return
+        client_id = message["id"]
+        try:
+            if message.get("type") == "submit":
+                self._submit(client_id, message)
+            elif message.get("type") == "cancel":
+                self._cancel(client_id)
+            else:
+                raise RequestError(f"Unknown message type {message.get('type')!r}")
+        except RequestError as exc:
+            self._reject(client_id, exc)
+
+    def close(self) -> None:
+        """Connection gone: stop forwarding and let runs fall back to the orphan grace."""
+
+        with self._lock:
+            active, self._active = self._active, {}
+        for run, unregister in active.values():
+            unregister()
+            run.detach()
+
+    def _reject(self, client_id: str | None, exc: RequestError) -> None:
+        self.send({"type": "error", "id": client_id, "error": str(exc), "status": exc.status.value})
+
+    def _submit(self, client_id: str, message: Dict[str, Any]) -> None:
+        with self._lock:
+            if client_id in self._active:
+                raise RequestError("A turn with this id is still running", HTTPStatus.CONFLICT)
+        turn = prepare_turn(self.session_id, message.get("message"), message.get("engine"))
+        resumed = resume_run(turn, message.get("lastEventId"))
+        if resumed is not None:
+            run, start = resumed
+        else:
+            run, leader = join_run(turn)
+            start = 0
+            if leader:
+                self.start(run, lambda run: execute_turn(turn, run))
+        self.send(turn.report({"type": "ack", "id": client_id, "runId": run.run_id}))
+        with self._lock:
+            self._active[client_id] = (run, lambda: None)
+        # The backlog is replayed synchronously, so a finished run is settled right here.
+        unregister = run.listen(self._forwarder(client_id, run), start)
+        with self._lock:
+            if client_id in self._active:
+                self._active[client_id] = (run, unregister)
+
+    def _forwarder(self, client_id: str, run: PipelineRun) -> Callable[[int, Optional[Dict[str, Any]]], None]:
+        def forward(seq: int, event: Optional[Dict[str, Any]]) -> None:
+            if event is not None:
+                self.send({"type": "delta", "id": client_id, "eventId": f"{run.run_id}:{seq}", "event": event})
+                return
+            with self._lock:
+                entry = self._active.pop(client_id, None)
+            if entry is None:
+                return
+            closing = final_event(run)
+            if closing is not None:
+                self.send({"type": "delta", "id": client_id, "eventId": f"{run.run_id}:{seq}", "event": closing})
+            run.detach()
+
+        return forward
+
+    def _cancel(self, client_id: str) -> None:
+        with self._lock:
+            entry = self._active.pop(client_id, None)
+        if entry is not None:
+            run, unregister = entry
+            unregister()
+            run.detach(immediate=True)
+        self.send({"type": "ack", "id": client_id, "cancelled": entry is not None})
+
+
+def _refresh_history(turn: Turn) -> None:
+    # Runs queue per session, so re-read history written by the previous turn.
+    session = SESSIONS.get(turn.session_id)
+    if session is None:
+        raise RequestError("Unknown session")
+    turn.history = session.history
+
+
+def _cacheable(turn: Turn) -> bool:
+    # Only first turns are cached: later replies depend on the conversation so far.
+    # Degraded turns neither read nor feed the cache, which holds full-strength replies.
+    return PROMPT_CACHE is not None and not turn.history and turn.load is None
+
+
+def _lookup_prompt(turn: Turn) -> Optional[CacheHit]:
+    if not _cacheable(turn):
+        return None
+    hit = PROMPT_CACHE.lookup(turn.message, turn.engine_name)
+    if hit is not None:
+        PROMPT_CACHE_SIMILARITY.observe(value=hit.similarity)
+    return hit
+
+
+def cached_reply(turn: Turn) -> Optional[Dict[str, Any]]:
+    """Answer a first turn from the prompt cache, recording it like a fresh reply."""
+
+    hit = _lookup_prompt(turn)
+    if hit is None:
+        return None
+    reply = turn.report({**hit.entry.response, "cached": hit.payload()})
+    record_turn(turn, reply.get("body") or "")
+    return reply
+
+
+def execute_stream(turn: Turn, run: PipelineRun) -> str:
+    _refresh_history(turn)
+    hit = _lookup_prompt(turn)
+    if hit is not None:
+        # Offer the near-duplicate answer right away; the fresh run keeps streaming.
+        response = hit.entry.response
+        run.publish(
+            {
+                "stage": "cached",
+                "headline": response.get("headline", ""),
+                "content": response.get("body", ""),
+                "cached": hit.payload(),
+            }
+        )
+    final_body = ""
+    engine = turn.engine_name
+    if turn.load is not None:
+        run.publish(
+            {
+                "stage": "degraded",
+                "content": f"Server busy ({turn.load.reason}): answering with {_describe_choice(turn.load)}.",
+                "degraded": turn.load.payload(),
+            }
+        )
+    last = time.perf_counter()
+    try:
+        for event in agent_stream(
+            turn.message, turn.history, engine=turn.engine, cancel=run.cancel, options=turn.agent_options
+        ):
+            now = time.perf_counter()
+            STAGE_SECONDS.observe(engine, str(event.get("stage") or "unknown"), value=now - last)
+            last = now
+            if event.get("stage") == "complete":
+                # Agents that render drafts into ``content`` keep the answer itself in ``body``.
+                final_body = event.get("body", event.get("content", ""))
+                if _cacheable(turn):
+                    PROMPT_CACHE.store(
+                        turn.message, engine, {"headline": event.get("headline", ""), "body": final_body}
+                    )
+                event = turn.report(event)
+            run.publish(event)
+    finally:
+        if final_body:
+            record_turn(turn, final_body)
+    return final_body
+
+
+def _describe_choice(choice: EngineChoice) -> str:
+    if choice.engine != choice.requested:
+        return f"{choice.engine} instead of {choice.requested}"
+    limits = ", ".join(f"{key}={value}" for key, value in choice.options.items())
+    return f"{choice.engine} limited to {limits}"
+
+
+def route_label(path: str) -> str:
+    match = JOB_PATH_RE.match(path)
+    if match is not None:
+        return "job-events" if match.group("events") else "job"
+    return ROUTE_LABELS.get(path, "static")
+
+
+def observe_request(path: str, engine: str, status: int | None, elapsed_sec: float) -> None:
+    route = route_label(path)
+    REQUESTS_TOTAL.inc(route, engine, str(status or 0))
+    REQUEST_SECONDS.observe(route, engine, value=elapsed_sec)
+
+
+def render_metrics() -> bytes:
+    return METRICS.render().encode("utf-8")
+
+
+def _cache_stats() -> Dict[str, Dict[str, int]]:
+    stats = {"sessions": SESSIONS.snapshot(), "static": ASSETS.snapshot()}
+    if PROMPT_CACHE is not None:
+        stats["prompt"] = PROMPT_CACHE.snapshot()
+    return stats
+
+
+METRICS.callback(
+    "agent_runs_inflight", "Pipeline runs started and not yet finished.", lambda: RUNS.snapshot()["inflight"]
+)
+METRICS.callback(
+    "agent_runs_queued", "Runs waiting behind an earlier run on the same session.", lambda: RUNS.snapshot()["queued"]
+)
+METRICS.callback("agent_jobs_queued", "Background jobs waiting for a worker.", lambda: JOBS.snapshot()["queued"])
+METRICS.callback("agent_jobs_running", "Background jobs executing.", lambda: JOBS.snapshot()["running"])
+METRICS.callback(
+    "agent_jobs_total",
+    "Finished background jobs by final status.",
+    lambda: {(status,): JOBS.stats[status] for status in ("succeeded", "failed", "cancelled")},
+    labels=("status",),
+    kind="counter",
+)
+METRICS.callback("agent_sessions", "Sessions held in memory.", lambda: SESSIONS.snapshot()["sessions"])
+METRICS.callback(
+    "agent_session_bytes", "Approximate bytes of in-memory session history.", lambda: SESSIONS.snapshot()["bytes"]
+)
+METRICS.callback(
+    "agent_cache_lookups_total",
+    "Cache lookups by cache and result.",
+    lambda: {
+        (cache, result): stats[key]
+        for cache, stats in _cache_stats().items()
+        for key, result in (("hits", "hit"), ("misses", "miss"))
+    },
+    labels=("cache", "result"),
+    kind="counter",
+)
+if PROMPT_CACHE is not None:
+    METRICS.callback(
+        "agent_prompt_cache_entries", "Prompts held in the prompt cache.", lambda: PROMPT_CACHE.snapshot()["entries"]
+    )
+    METRICS.callback(
+        "agent_prompt_cache_threshold", "Minimum similarity for a prompt cache hit.", lambda: PROMPT_CACHE.threshold
+    )
+METRICS.callback(
+    "agent_cache_hit_ratio", "Lifetime hit ratio per cache.", lambda: hit_ratio(_cache_stats()), labels=("cache",)
+)
+if LOAD_POLICY is not None:
+    METRICS.callback(
+        "agent_load_degraded", "1 while the load policy runs cheaper engines.", lambda: int(LOAD_POLICY.degraded)
+    )
+    METRICS.callback(
+        "agent_load_degraded_requests_total",
+        "Interactive requests answered with a cheaper engine or fewer attempts.",
+        lambda: LOAD_POLICY.stats["downgraded_requests"],
+        kind="counter",
+    )
+
+
+def _complete_event(run: PipelineRun) -> Dict[str, Any]:
+    for event in reversed(run.events):
+        if event.get("stage") == "complete":
+            return event
+    raise RuntimeError("agent finished without a complete event")
+
+
+def execute_turn(turn: Turn, run: PipelineRun) -> Dict[str, Any]:
+    """Stream an interactive turn into ``run`` and return the JSON reply built from it."""
+
+    execute_stream(turn, run)
+    event = _complete_event(run)
+    reply = {key: value for key, value in event.items() if key not in ("stage", "content", "elapsed_ms")}
+    reply.setdefault("body", event.get("content", ""))
+    return reply
+
+
+def execute_job(turn: Turn, run: PipelineRun) -> Dict[str, Any]:
+    execute_stream(turn, run)
+    return _complete_event(run)
+
+
+def warm_up() -> None:
+    """Build configured engines before serving so the first request is not cold."""
+
+    names = WARMUP_ENGINES or [None]
+    for entry in warm_up_engines(names, prefill=WARMUP_PREFILL):
+        if entry["ok"]:
+            print(f"[warmup] {entry['engine']} ready in {entry['elapsed_ms']:.0f} ms")
+        else:
+            print(f"[warmup] {entry['engine']} failed: {entry['error']}")
+
+
+__all__ = [
+    "ASSETS",
+    "JOBS",
+    "JOB_PATH_RE",
+    "LOAD_POLICY",
+    "METRICS_CONTENT_TYPE",
+    "PROMPT_CACHE",
+    "PUBLIC_DIR",
+    "RUNS",
+    "SESSIONS",
+    "SSE_STREAMS",
+    "SSE_HEARTBEAT",
+    "SSE_HEARTBEAT_SEC",
+    "WS_CONNECTIONS",
+    "WARMUP_ENABLED",
+    "AgentChannel",
+    "RequestError",
+    "Turn",
+    "cancel_job",
+    "cached_reply",
+    "create_session",
+    "execute_job",
+    "execute_stream",
+    "execute_turn",
+    "final_event",
+    "get_job",
+    "job_event_start",
+    "join_run",
+    "observe_request",
+    "pending_jobs",
+    "prepare_turn",
+    "record_turn",
+    "render_metrics",
+    "resume_run",
+    "sse_frame",
+    "sse_preamble",
+    "submit_job",
+    "warm_up",
+]
@@ -0,0 +1,321 @@
+"""Chat session storage: bounded in-memory LRU/TTL tier with optional sqlite persistence."""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+SESSION_MAX_COUNT = int(os.getenv("AGENT_SESSION_MAX", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("AGENT_SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_TTL_SEC = float(os.getenv("AGENT_SESSION_TTL_SEC", str(6 * 3600)))
+SESSION_DB_PATH = os.getenv("AGENT_SESSION_DB", "")
+SESSION_FLUSH_SEC = float(os.getenv("AGENT_SESSION_FLUSH_SEC", "2"))
+# Several server processes on one database: read and write through on every access.
+SESSION_SHARED = os.getenv("AGENT_SESSION_SHARED", "0").lower() in ("1", "true", "yes")
+
+# Rough per-object overhead so many tiny sessions still count against the budget.
+_SESSION_OVERHEAD_BYTES = 256
+_MESSAGE_OVERHEAD_BYTES = 64
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    session_id: str
+    engine: str | None = None
+    history: List[Dict[str, str]] = field(default_factory=list)
+    updated: float = field(default_factory=time.time)
+
+    def size_bytes(self) -> int:
+        return _SESSION_OVERHEAD_BYTES + sum(
+            _MESSAGE_OVERHEAD_BYTES + len(message.get("content", "").encode("utf-8"))
+            for message in self.history
+        )
+
+    def copy(self) -> "SessionRecord":
+        return SessionRecord(self.session_id, self.engine, list(self.history), self.updated)
+
+
+class SqliteSessionBackend:
+    """Durable tier; rows are written in batches by the store's flush thread."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, engine TEXT, history TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def load(self, session_id: str, min_updated: float = 0.0) -> Optional[SessionRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT engine, history, updated FROM sessions WHERE id = ? AND updated >= ?",
+                (session_id, min_updated),
+            ).fetchone()
+        if row is None:
+            return None
+        engine, history, updated = row
+        return SessionRecord(session_id, engine, json.loads(history), updated)
+
+    def save_many(self, records: Iterable[SessionRecord]) -> None:
+        rows = [
+            (record.session_id, record.engine, json.dumps(record.history), record.updated)
+            for record in records
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO sessions (id, engine, history, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET engine = excluded.engine, "
+                "history = excluded.history, updated = excluded.updated",
+                rows,
+            )
+
+    def append(self, session_id: str, messages: List[Dict[str, str]], updated: float) -> bool:
+        """Atomically extend a stored history, even with other processes writing."""
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT history FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                if row is None:
+                    self._conn.rollback()
+                    return False
+                history = json.loads(row[0]) + list(messages)
+                self._conn.execute(
+                    "UPDATE sessions SET history = ?, updated = ? WHERE id = ?",
+                    (json.dumps(history), updated, session_id),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return True
+
+    def purge_older_than(self, cutoff: float) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """LRU/TTL session cache bounded by count and approximate bytes.
+
+    With a ``backend``, changed sessions are written behind on a background
+    thread every ``flush_sec``. Sessions evicted from memory stay readable and
+    are rehydrated from the backend on their next access, and a restarted
+    server picks up every session younger than the TTL.
+
+    In ``shared`` mode the backend is the source of truth: every read loads
+    the row and every write commits before returning, so several server
+    processes can serve the same sessions.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_COUNT,
+        max_bytes: int = SESSION_MAX_BYTES,
+        ttl_sec: float = SESSION_TTL_SEC,
+        backend: SqliteSessionBackend | None = None,
+        flush_sec: float = SESSION_FLUSH_SEC,
+        shared: bool = False,
+    ) -> None:
+        if shared and backend is None:
+            raise ValueError("a shared session store needs a backend")
+        self.shared = shared
+        self.max_sessions = max(max_sessions, 1)
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.backend = backend
+        self.flush_sec = flush_sec
+        self._sessions: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._dirty: Dict[str, SessionRecord] = {}
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self.stats = {"hits": 0, "misses": 0, "rehydrated": 0, "evicted": 0, "expired": 0}
+        if backend is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _expired(self, record: SessionRecord, now: float) -> bool:
+        return self.ttl_sec > 0 and now - record.updated > self.ttl_sec
+
+    def _put(self, record: SessionRecord) -> None:
+        self._drop(record.session_id)
+        size = record.size_bytes()
+        self._sessions[record.session_id] = record
+        self._sizes[record.session_id] = size
+        self._bytes += size
+        self._evict()
+
+    def _drop(self, session_id: str) -> None:
+        if self._sessions.pop(session_id, None) is not None:
+            self._bytes -= self._sizes.pop(session_id)
+
+    def _evict(self) -> None:
+        now = time.time()
+        # Least recently used entries sit at the front; stop at the first live one
+        # once the store is back within budget.
+        while self._sessions:
+            session_id, record = next(iter(self._sessions.items()))
+            if self._expired(record, now):
+                self.stats["expired"] += 1
+            elif len(self._sessions) > self.max_sessions or (
+                self.max_bytes and self._bytes > self.max_bytes and len(self._sessions) > 1
+            ):
+                self.stats["evicted"] += 1
+            else:
+                break
+            self._drop(session_id)
+
+    def _mark_dirty(self, record: SessionRecord) -> None:
+        if self.backend is not None:
+            self._dirty[record.session_id] = record.copy()
+
+    def create(self, engine: str | None = None) -> str:
+        record = SessionRecord(session_id=str(uuid.uuid4()), engine=engine)
+        if self.shared:
+            self.backend.save_many([record])
+            return record.session_id
+        with self._lock:
+            self._put(record)
+            self._mark_dirty(record)
+        return record.session_id
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        """Return a snapshot of the session, rehydrating it if it is not in memory."""
+
+        now = time.time()
+        if self.shared:
+            return self._load_shared(session_id, now)
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None and self._expired(record, now):
+                self._drop(session_id)
+                self.stats["expired"] += 1
+                record = None
+            if record is not None:
+                self._sessions.move_to_end(session_id)
+                self.stats["hits"] += 1
+                return record.copy()
+            self.stats["misses"] += 1
+            record = self._dirty.get(session_id)
+            if record is not None and self._expired(record, now):
+                record = None
+        if record is None and self.backend is not None:
+            min_updated = now - self.ttl_sec if self.ttl_sec > 0 else 0.0
+            record = self.backend.load(session_id, min_updated)
+        if record is None:
+            return None
+        with self._lock:
+            self.stats["rehydrated"] += 1
+            if session_id not in self._sessions:
+                self._put(record.copy())
+            return self._sessions.get(session_id, record).copy()
+
+    def _load_shared(self, session_id: str, now: float) -> Optional[SessionRecord]:
+        min_updated = now - self.ttl_sec if self.ttl_sec > 0 else 0.0
+        record = self.backend.load(session_id, min_updated)
+        with self._lock:
+            self.stats["hits" if record is not None else "misses"] += 1
+        return record
+
+    def append(self, session_id: str, messages: Iterable[Dict[str, str]]) -> bool:
+        if self.shared:
+            return self.backend.append(session_id, list(messages), time.time())
+        if self.get(session_id) is None:
+            return False
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return False
+            record.history.extend(messages)
+            record.updated = time.time()
+            self._put(record)
+            self._mark_dirty(record)
+        return True
+
+    def __contains__(self, session_id: object) -> bool:
+        return isinstance(session_id, str) and self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def flush(self) -> int:
+        if self.backend is None:
+            return 0
+        with self._lock:
+            pending = dict(self._dirty)
+        # Records stay dirty until saved, so a failed batch is retried on the
+        # next flush and evicted sessions remain readable from ``_dirty``.
+        self.backend.save_many(list(pending.values()))
+        with self._lock:
+            for session_id, record in pending.items():
+                if self._dirty.get(session_id) is record:
+                    del self._dirty[session_id]
+        return len(pending)
+
+    def _flush_loop(self) -> None:
+        last_purge = 0.0
+        while not self._closed.wait(self.flush_sec):
+            try:
+                self.flush()
+                if self.ttl_sec > 0 and time.time() - last_purge > self.ttl_sec / 10:
+                    last_purge = time.time()
+                    self.backend.purge_older_than(last_purge - self.ttl_sec)
+            except sqlite3.Error as exc:
+                print(f"[sessions] flush failed: {exc}")
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_sec + 1)
+        if self.backend is not None:
+            self.flush()
+            self.backend.close()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "dirty": len(self._dirty),
+                **self.stats,
+            }
+
+
+def build_session_store() -> SessionStore:
+    backend = SqliteSessionBackend(SESSION_DB_PATH) if SESSION_DB_PATH else None
+    return SessionStore(backend=backend, shared=SESSION_SHARED and backend is not None)
+
+
+__all__ = [
+    "SessionRecord",
+    "SessionStore",
+    "SqliteSessionBackend",
+    "build_session_store",
+]
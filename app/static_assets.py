@@ -0,0 +1,211 @@
+"""In-memory static asset cache with ETags, content-hashed URLs and gzip variants."""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+STATIC_RELOAD = os.getenv("AGENT_STATIC_RELOAD", "1").lower() not in ("0", "false", "no")
+GZIP_MIN_BYTES = int(os.getenv("AGENT_STATIC_GZIP_MIN_BYTES", "512"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+API_CACHE_CONTROL = "no-store"
+
+_HASH_CHARS = 12
+HASHED_NAME_RE = re.compile(rf"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{{{_HASH_CHARS}}})(?P<suffix>\.[^./]+)$")
+ASSET_REF_RE = re.compile(r'(?P<attr>\b(?:href|src))="(?P<url>/[^"?#:]+)"')
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+@dataclass(slots=True)
+class StaticAsset:
+    relative: str
+    content_type: str
+    body: bytes
+    digest: str
+    gzip_body: Optional[bytes] = None
+    # (path, mtime_ns, size) of every file the rendered body depends on.
+    sources: List[Tuple[Path, int, int]] = field(default_factory=list)
+
+    @property
+    def hashed_url(self) -> str:
+        stem, dot, suffix = self.relative.rpartition(".")
+        if not dot:
+            return f"/{self.relative}.{self.digest}"
+        return f"/{stem}.{self.digest}.{suffix}"
+
+    def etag(self, encoding: str | None = None) -> str:
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+@dataclass(slots=True)
+class StaticResponse:
+    status: HTTPStatus
+    headers: List[Tuple[str, str]]
+    body: bytes = b""
+
+
+def _stat(path: Path) -> Tuple[Path, int, int]:
+    info = path.stat()
+    return path, info.st_mtime_ns, info.st_size
+
+
+def _etag_matches(header: str, etags: Tuple[str, ...]) -> bool:
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or any(tag in candidates for tag in etags)
+
+
+def _accepts_gzip(header: str) -> bool:
+    for part in header.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class AssetCache:
+    """Serves files under ``root`` from memory.
+
+    HTML pages are rewritten so local ``href``/``src`` references point at
+    content-hashed URLs (``/app.<digest>.js``), which are safe to cache
+    forever. The pages themselves and unhashed URLs revalidate with ETags.
+    With ``reload`` on, a changed file on disk is picked up on the next
+    request.
+    """
+
+    def __init__(self, root: Path, reload: bool = STATIC_RELOAD) -> None:
+        self.root = root.resolve()
+        self.reload = reload
+        self._assets: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def _path_for(self, relative: str) -> Optional[Path]:
+        target = (self.root / relative).resolve()
+        if target.is_dir():
+            target = target / "index.html"
+        if self.root not in target.parents or not target.is_file():
+            return None
+        return target
+
+    def _fresh(self, asset: StaticAsset) -> bool:
+        try:
+            return all(_stat(path) == (path, mtime, size) for path, mtime, size in asset.sources)
+        except OSError:
+            return False
+
+    def _load(self, relative: str, path: Path) -> StaticAsset:
+        body = path.read_bytes()
+        sources = [_stat(path)]
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if content_type == "text/html":
+            body, deps = self._rewrite_html(body.decode("utf-8"))
+            body = body.encode("utf-8")
+            sources.extend(deps)
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        digest = hashlib.sha256(body).hexdigest()[:_HASH_CHARS]
+        gzip_body = None
+        if len(body) >= GZIP_MIN_BYTES and content_type.startswith(_COMPRESSIBLE):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                gzip_body = compressed
+        return StaticAsset(relative, content_type, body, digest, gzip_body, sources)
+
+    def _rewrite_html(self, html: str) -> Tuple[str, List[Tuple[Path, int, int]]]:
+        deps: List[Tuple[Path, int, int]] = []
+
+        def replace(match: re.Match) -> str:
+            relative = unquote(match.group("url")).lstrip("/")
+            if not relative or relative.endswith(".html"):
+                return match.group(0)
+            asset = self.get(relative)
+            if asset is None:
+                return match.group(0)
+            deps.extend(asset.sources)
+            return f'{match.group("attr")}="{asset.hashed_url}"'
+
+        return ASSET_REF_RE.sub(replace, html), deps
+
+    def get(self, relative: str) -> Optional[StaticAsset]:
+        relative = relative.lstrip("/") or "index.html"
+        with self._lock:
+            asset = self._assets.get(relative)
+        if asset is not None and (not self.reload or self._fresh(asset)):
+            with self._lock:
+                self.stats["hits"] += 1
+            return asset
+        path = self._path_for(relative)
+        if path is None:
+            return None
+        asset = self._load(relative, path)
+        with self._lock:
+            self._assets[relative] = asset
+            self.stats["misses"] += 1
+        return asset
+
+    def resolve(self, url_path: str) -> Tuple[Optional[StaticAsset], bool]:
+        """Map a request path to ``(asset, immutable)``."""
+
+        relative = unquote(url_path).lstrip("/")
+        asset = self.get(relative)
+        if asset is not None:
+            return asset, False
+        match = HASHED_NAME_RE.match(relative)
+        if match is None:
+            return None, False
+        asset = self.get(match.group("stem") + match.group("suffix"))
+        if asset is None:
+            return None, False
+        # A stale digest still gets the current file, but must not be cached forever.
+        return asset, asset.digest == match.group("digest")
+
+    def respond(
+        self,
+        url_path: str,
+        if_none_match: str = "",
+        accept_encoding: str = "",
+    ) -> Optional[StaticResponse]:
+        asset, immutable = self.resolve(url_path)
+        if asset is None:
+            return None
+        use_gzip = asset.gzip_body is not None and _accepts_gzip(accept_encoding)
+        etag = asset.etag("gzip" if use_gzip else None)
+        headers = [
+            ("ETag", etag),
+            ("Cache-Control", IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL),
+        ]
+        if asset.gzip_body is not None:
+            headers.append(("Vary", "Accept-Encoding"))
+        if _etag_matches(if_none_match, (asset.etag(), asset.etag("gzip"))):
+            with self._lock:
+                self.stats["not_modified"] += 1
+            return StaticResponse(HTTPStatus.NOT_MODIFIED, headers)
+        headers.append(("Content-Type", asset.content_type))
+        if use_gzip:
+            headers.append(("Content-Encoding", "gzip"))
+        return StaticResponse(HTTPStatus.OK, headers, asset.gzip_body if use_gzip else asset.body)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"assets": len(self._assets), **self.stats}
+
+
+__all__ = [
+    "API_CACHE_CONTROL",
+    "AssetCache",
+    "StaticAsset",
+    "StaticResponse",
+]
@@ -0,0 +1,234 @@
+"""Multi-process serving: a supervisor running several server workers on one port.
+
+Each worker is a fresh ``python app/server.py`` process. By default the
+supervisor binds once and the workers inherit the listening descriptor, so a
+retiring worker simply stops accepting and queued connections go to its
+siblings. With ``AGENT_REUSEPORT=1`` every worker binds its own socket and
+the kernel spreads connections across them; this balances better but drops
+connections still queued on a worker's socket when it exits. Sessions and jobs move to sqlite (WAL) so any worker
+can serve any request. Workers retire gracefully after a request or age
+budget: they stop accepting, drain in-flight requests and jobs, and exit,
+and the supervisor starts a replacement.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+SERVER_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+WORKER_ID = os.getenv("AGENT_WORKER_ID", "")
+WORKER_MAX_REQUESTS = int(os.getenv("AGENT_WORKER_MAX_REQUESTS", "0"))
+WORKER_MAX_AGE_SEC = float(os.getenv("AGENT_WORKER_MAX_AGE_SEC", "0"))
+WORKER_GRACE_SEC = float(os.getenv("AGENT_WORKER_GRACE_SEC", "30"))
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT") and os.getenv("AGENT_REUSEPORT", "0").lower() in ("1", "true", "yes")
+LISTEN_FD_ENV = "AGENT_LISTEN_FD"
+
+APP_DIR = Path(__file__).resolve().parent
+DEFAULT_SESSION_DB = APP_DIR.parent / "results" / "sessions.db"
+DEFAULT_JOB_DB = APP_DIR.parent / "results" / "jobs.db"
+
+_LISTEN_BACKLOG = 128
+_POLL_SEC = 0.5
+# A worker that dies sooner than this after starting is restarted with backoff.
+_CRASH_WINDOW_SEC = 5.0
+_MAX_BACKOFF_SEC = 10.0
+
+
+def is_worker() -> bool:
+    return bool(WORKER_ID)
+
+
+def _listen(host: str, port: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(_LISTEN_BACKLOG)
+    return sock
+
+
+def worker_socket(host: str, port: int) -> Optional[socket.socket]:
+    """Listening socket for this worker, or ``None`` when running single-process."""
+
+    fd = os.getenv(LISTEN_FD_ENV)
+    if fd:
+        sock = socket.socket(fileno=int(fd))
+        # Siblings accept from the same queue; a lost race must not block this worker.
+        sock.setblocking(False)
+        return sock
+    if is_worker():
+        return _listen(host, port, reuse_port=True)
+    return None
+
+
+class WorkerLifecycle:
+    """Request accounting and graceful retirement for one server process."""
+
+    def __init__(self, max_requests: int = WORKER_MAX_REQUESTS, max_age_sec: float = WORKER_MAX_AGE_SEC) -> None:
+        self.max_requests = max_requests
+        # Jitter keeps workers started together from all retiring at once.
+        self.max_age_sec = max_age_sec * random.uniform(0.9, 1.1) if max_age_sec > 0 else 0.0
+        self.requests = 0
+        self.active = 0
+        self.retiring = threading.Event()
+        self._cond = threading.Condition()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def start(self, on_retire: Callable[[], None]) -> None:
+        """Register the server's stop function and arm the age limit and SIGTERM."""
+
+        self._callbacks.append(on_retire)
+        if self.max_age_sec > 0:
+            timer = threading.Timer(self.max_age_sec, self.retire, args=("max age reached",))
+            timer.daemon = True
+            timer.start()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.retire("SIGTERM"))
+
+    def request_started(self) -> None:
+        with self._cond:
+            self.requests += 1
+            self.active += 1
+            due = 0 < self.max_requests <= self.requests
+        if due:
+            self.retire("max requests reached")
+
+    def request_finished(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def retire(self, reason: str) -> None:
+        if self.retiring.is_set():
+            return
+        self.retiring.set()
+        print(f"[{f'worker {WORKER_ID}' if WORKER_ID else 'server'}] retiring: {reason}")
+        # Stop functions may block until the accept loop exits, so never call them inline.
+        for callback in self._callbacks:
+            threading.Thread(target=callback, name="worker-retire", daemon=True).start()
+
+    def drain(self, timeout: float = WORKER_GRACE_SEC, busy: Callable[[], int] = lambda: 0) -> bool:
+        """Wait for in-flight requests and ``busy()`` work to finish; returns whether they did."""
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.active > 0 or busy() > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, _POLL_SEC))
+        return True
+
+
+LIFECYCLE = WorkerLifecycle()
+
+
+class Supervisor:
+    """Keeps ``workers`` server processes running until SIGTERM/SIGINT."""
+
+    def __init__(self, workers: int, host: str, port: int, script: Path) -> None:
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.script = script
+        self.stopping = False
+        self._listener: Optional[socket.socket] = None
+        self._children: Dict[int, subprocess.Popen] = {}
+        self._started: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+
+    def _worker_env(self, index: int) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["AGENT_WORKER_ID"] = str(index)
+        env.setdefault("AGENT_SESSION_DB", str(DEFAULT_SESSION_DB))
+        env.setdefault("AGENT_JOB_DB", str(DEFAULT_JOB_DB))
+        env["AGENT_SESSION_SHARED"] = "1"
+        if self._listener is not None:
+            env[LISTEN_FD_ENV] = str(self._listener.fileno())
+        return env
+
+    def _spawn(self, index: int) -> None:
+        pass_fds = (self._listener.fileno(),) if self._listener is not None else ()
+        child = subprocess.Popen([sys.executable, str(self.script)], env=self._worker_env(index), pass_fds=pass_fds)
+        self._children[index] = child
+        self._started[index] = time.monotonic()
+
+    def _stop(self, *_args) -> None:
+        self.stopping = True
+        for child in self._children.values():
+            if child.poll() is None:
+                child.send_signal(signal.SIGTERM)
+
+    def _fail_jobs(self, pid: int) -> None:
+        job_db = os.getenv("AGENT_JOB_DB", str(DEFAULT_JOB_DB))
+        if not Path(job_db).exists():
+            return
+        from jobs import SqliteJobBackend
+
+        backend = SqliteJobBackend(job_db)
+        try:
+            failed = backend.fail_owner(str(pid), "worker exited before the job finished")
+        finally:
+            backend.close()
+        if failed:
+            print(f"[supervisor] marked {failed} job(s) of worker pid {pid} as failed")
+
+    def _reap(self) -> None:
+        for index, child in list(self._children.items()):
+            code = child.poll()
+            if code is None:
+                continue
+            del self._children[index]
+            self._fail_jobs(child.pid)
+            if self.stopping:
+                continue
+            uptime = time.monotonic() - self._started[index]
+            if code != 0 and uptime < _CRASH_WINDOW_SEC:
+                delay = min(self._backoff.get(index, 0.25) * 2, _MAX_BACKOFF_SEC)
+                self._backoff[index] = delay
+                print(f"[supervisor] worker {index} exited with {code}; restarting in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                self._backoff.pop(index, None)
+            self._spawn(index)
+
+    def run(self) -> None:
+        if not REUSE_PORT:
+            self._listener = _listen(self.host, self.port, reuse_port=False)
+            self._listener.set_inheritable(True)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        mode = "SO_REUSEPORT" if REUSE_PORT else "shared socket"
+        print(f"Agent UI running at http://{self.host}:{self.port} ({self.workers} workers, {mode})")
+        while not self.stopping:
+            self._reap()
+            time.sleep(_POLL_SEC)
+        deadline = time.monotonic() + WORKER_GRACE_SEC + 5
+        for child in self._children.values():
+            try:
+                child.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                child.kill()
+        self._reap()
+
+
+__all__ = [
+    "LIFECYCLE",
+    "SERVER_WORKERS",
+    "Supervisor",
+    "WorkerLifecycle",
+    "is_worker",
+    "worker_socket",
+]
@@ -0,0 +1,245 @@
+"""Minimal RFC 6455 WebSocket server protocol without any I/O.
+
+``ServerProtocol`` turns received bytes into text messages and builds the
+frames to send back, so the threaded and the asyncio server share one
+implementation and only move bytes. Extensions (compression) and
+subprotocols are not negotiated; binary messages are refused.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import os
+import struct
+from typing import List, Mapping
+from urllib.parse import urlparse
+
+WS_MAX_MESSAGE_BYTES = int(os.getenv("AGENT_WS_MAX_MESSAGE_BYTES", str(1024 * 1024)))
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED = 1003
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+
+
+class HandshakeError(Exception):
+    """The upgrade request is not a valid WebSocket handshake; answer with ``status``."""
+
+    def __init__(self, message: str, status: int = 400) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ProtocolError(Exception):
+    def __init__(self, message: str, code: int = CLOSE_PROTOCOL_ERROR) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+def accept_handshake(method: str, headers: Mapping[str, str]) -> str:
+    """Validate an upgrade request (lower-case header names); returns ``Sec-WebSocket-Accept``."""
+
+    if method != "GET":
+        raise HandshakeError("WebSocket upgrade requires GET", 405)
+    if headers.get("upgrade", "").lower() != "websocket":
+        raise HandshakeError("Expected Upgrade: websocket", 426)
+    if "upgrade" not in [token.strip().lower() for token in headers.get("connection", "").split(",")]:
+        raise HandshakeError("Expected Connection: Upgrade")
+    if headers.get("sec-websocket-version") != "13":
+        raise HandshakeError("Unsupported WebSocket version", 426)
+    key = headers.get("sec-websocket-key", "")
+    try:
+        if len(base64.b64decode(key, validate=True)) != 16:
+            raise ValueError
+    except (binascii.Error, ValueError):
+        raise HandshakeError("Invalid Sec-WebSocket-Key") from None
+    # Browsers always send Origin; refuse pages from other sites driving the agent.
+    origin = headers.get("origin")
+    if origin and urlparse(origin).netloc != headers.get("host", ""):
+        raise HandshakeError("Cross-origin WebSocket refused", 403)
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def handshake_response(accept: str) -> bytes:
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+    ).encode("ascii")
+
+
+def encode_frame(opcode: int, payload: bytes = b"") -> bytes:
+    """One final, unmasked frame (servers never mask)."""
+
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    if not payload:
+        return payload
+    # XOR the whole payload at once as big integers instead of byte by byte.
+    repeated = (mask * (len(payload) // 4 + 1))[: len(payload)]
+    value = int.from_bytes(payload, "little") ^ int.from_bytes(repeated, "little")
+    return value.to_bytes(len(payload), "little")
+
+
+class ServerProtocol:
+    """Server side of one WebSocket connection after the handshake."""
+
+    def __init__(self, max_message_bytes: int = WS_MAX_MESSAGE_BYTES) -> None:
+        self.max_message_bytes = max_message_bytes
+        self.closed = False
+        self._buffer = bytearray()
+        self._fragments: List[bytes] = []
+        self._fragment_opcode: int | None = None
+        self._outgoing: List[bytes] = []
+        self._close_sent = False
+
+    # -- sending --------------------------------------------------------------
+
+    def text(self, message: str) -> bytes:
+        return encode_frame(OP_TEXT, message.encode("utf-8"))
+
+    def ping(self) -> bytes:
+        return encode_frame(OP_PING)
+
+    def close(self, code: int = CLOSE_NORMAL, reason: str = "") -> bytes:
+        """Close frame to send; the connection counts as closed from now on."""
+
+        self.closed = True
+        if self._close_sent:
+            return b""
+        self._close_sent = True
+        return encode_frame(OP_CLOSE, struct.pack("!H", code) + reason.encode("utf-8")[:120])
+
+    def take_outgoing(self) -> bytes:
+        """Control frames (pongs, close replies) produced while receiving."""
+
+        data = b"".join(self._outgoing)
+        self._outgoing.clear()
+        return data
+
+    # -- receiving ------------------------------------------------------------
+
+    def receive(self, data: bytes) -> List[str]:
+        """Feed received bytes; returns complete text messages.
+
+        Protocol violations queue a close frame and mark the connection
+        closed instead of raising.
+        """
+
+        if self.closed:
+            return []
+        self._buffer.extend(data)
+        messages: List[str] = []
+        try:
+            while not self.closed:
+                frame = self._next_frame()
+                if frame is None:
+                    break
+                message = self._handle(*frame)
+                if message is not None:
+                    messages.append(message)
+        except ProtocolError as exc:
+            self._outgoing.append(self.close(exc.code, str(exc)))
+        return messages
+
+    def _next_frame(self) -> tuple[bool, int, bytes] | None:
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return None
+        first, second = buffer[0], buffer[1]
+        if first & 0x70:
+            raise ProtocolError("reserved bits set without an extension")
+        if not second & 0x80:
+            raise ProtocolError("client frames must be masked")
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            (length,) = struct.unpack_from("!H", buffer, 2)
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            (length,) = struct.unpack_from("!Q", buffer, 2)
+            offset = 10
+        opcode = first & 0x0F
+        if opcode >= OP_CLOSE and (length > 125 or not first & 0x80):
+            raise ProtocolError("invalid control frame")
+        if length > self.max_message_bytes:
+            raise ProtocolError("message too big", CLOSE_TOO_BIG)
+        end = offset + 4 + length
+        if len(buffer) < end:
+            return None
+        mask = bytes(buffer[offset : offset + 4])
+        payload = _unmask(bytes(buffer[offset + 4 : end]), mask)
+        del buffer[:end]
+        return bool(first & 0x80), opcode, payload
+
+    def _handle(self, fin: bool, opcode: int, payload: bytes) -> str | None:
+        if opcode == OP_PING:
+            self._outgoing.append(encode_frame(OP_PONG, payload))
+            return None
+        if opcode == OP_PONG:
+            return None
+        if opcode == OP_CLOSE:
+            code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+            self._outgoing.append(self.close(code if code != 1005 else CLOSE_NORMAL))
+            return None
+        if opcode == OP_CONTINUATION:
+            if self._fragment_opcode is None:
+                raise ProtocolError("continuation without a message")
+        elif opcode in (OP_TEXT, OP_BINARY):
+            if self._fragment_opcode is not None:
+                raise ProtocolError("new message inside a fragmented one")
+            self._fragment_opcode = opcode
+        else:
+            raise ProtocolError(f"unknown opcode {opcode}")
+        self._fragments.append(payload)
+        if sum(len(part) for part in self._fragments) > self.max_message_bytes:
+            raise ProtocolError("message too big", CLOSE_TOO_BIG)
+        if not fin:
+            return None
+        message_opcode, data = self._fragment_opcode, b"".join(self._fragments)
+        self._fragment_opcode, self._fragments = None, []
+        if message_opcode == OP_BINARY:
+            raise ProtocolError("binary messages are not supported", CLOSE_UNSUPPORTED)
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ProtocolError("text message is not valid UTF-8", CLOSE_INVALID_DATA) from None
+
+
+__all__ = [
+    "CLOSE_GOING_AWAY",
+    "CLOSE_NORMAL",
+    "HandshakeError",
+    "ServerProtocol",
+    "WS_MAX_MESSAGE_BYTES",
+    "accept_handshake",
+    "encode_frame",
+    "handshake_response",
+]
@@ -1,12 +1,28 @@
 const state = {
   sessionId: null,
   history: [],
+  // Stops the turn in progress, whichever transport carries it.
+  cancelTurn: null,
+};
+
+const PROGRESS_STAGES = new Set(["attempt", "checker_start", "retry"]);
+const MAX_STREAM_RECONNECTS = 5;
+const SOCKET_RECONNECT_DELAY_MS = 1000;
+
+// One WebSocket per session carries every turn; SSE is the fallback when it cannot connect.
+const socket = {
+  ws: null,
+  connecting: null,
+  unavailable: !("WebSocket" in window),
+  turns: new Map(),
+  nextId: 1,
 };
 
 const historyEl = document.getElementById("history");
 const statusEl = document.getElementById("status");
 const formEl = document.getElementById("prompt-form");
 const promptEl = document.getElementById("prompt");
+const cancelEl = document.getElementById("cancel");
 
 bootstrap();
 renderHistory();
@@ -19,7 +35,7 @@ formEl.addEventListener("submit", async (event) => {
   pushEntry("user", value);
   renderHistory();
   try {
-    await streamAgent(value);
+    await runTurn(value);
   } catch (error) {
     pushEntry("assistant", `Agent failed: ${error.message}`, "error");
     renderHistory();
@@ -35,12 +51,135 @@ async function bootstrap() {
     const data = await res.json();
     state.sessionId = data.sessionId;
     statusEl.textContent = "Agent ready";
+    connectSocket();
   } catch (error) {
     statusEl.textContent = "Session failed";
     console.error(error);
   }
 }
 
+cancelEl.addEventListener("click", () => {
+  if (state.cancelTurn) state.cancelTurn();
+});
+
+async function runTurn(message) {
+  const ws = await connectSocket();
+  return ws ? socketTurn(message) : streamAgent(message);
+}
+
+// Shows one pipeline event; returns an Error for failed turns, true once complete.
+function showEvent(payload) {
+  if (payload.stage === "error" || payload.stage === "cancelled") {
+    return new Error(payload.content);
+  }
+  if (PROGRESS_STAGES.has(payload.stage)) {
+    statusEl.textContent = `${payload.content} · ${formatSeconds(payload.elapsed_ms)}`;
+    return false;
+  }
+  const stage =
+    payload.stage === "complete" ? "summary" : payload.stage || "assistant";
+  pushEntry("assistant", payload.content, stage);
+  renderHistory();
+  return payload.stage === "complete";
+}
+
+function connectSocket() {
+  if (socket.unavailable || !state.sessionId) return Promise.resolve(null);
+  if (socket.ws) return Promise.resolve(socket.ws);
+  if (socket.connecting) return socket.connecting;
+  socket.connecting = new Promise((resolve) => {
+    const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+    const ws = new WebSocket(
+      `${scheme}://${window.location.host}/api/ws?sessionId=${encodeURIComponent(state.sessionId)}`,
+    );
+    let opened = false;
+    ws.onopen = () => {
+      opened = true;
+      socket.ws = ws;
+      socket.connecting = null;
+      resolve(ws);
+    };
+    ws.onmessage = (event) => onSocketMessage(JSON.parse(event.data));
+    ws.onclose = () => {
+      socket.ws = null;
+      socket.connecting = null;
+      if (!opened) {
+        // Never connected (proxy, old server): use SSE from now on.
+        socket.unavailable = true;
+        resolve(null);
+      }
+      socket.turns.forEach((turn) => turn.interrupted());
+    };
+  });
+  return socket.connecting;
+}
+
+function socketTurn(message) {
+  return new Promise((resolve, reject) => {
+    const turn = {
+      id: `turn-${socket.nextId++}`,
+      message,
+      lastEventId: null,
+      reconnects: 0,
+    };
+    const settle = (error) => {
+      socket.turns.delete(turn.id);
+      state.cancelTurn = null;
+      if (error) reject(error);
+      else resolve();
+    };
+    const submit = (ws) => {
+      ws.send(
+        JSON.stringify({
+          type: "submit",
+          id: turn.id,
+          message: turn.message,
+          lastEventId: turn.lastEventId,
+        }),
+      );
+    };
+    turn.onMessage = (data) => {
+      if (data.type === "error") {
+        settle(new Error(data.error));
+      } else if (data.type === "ack") {
+        turn.reconnects = 0;
+        if ("cancelled" in data) settle(new Error("Run cancelled"));
+      } else if (data.type === "delta") {
+        turn.lastEventId = data.eventId;
+        const outcome = showEvent(data.event);
+        if (outcome instanceof Error) settle(outcome);
+        else if (outcome) settle();
+      }
+    };
+    // The server resumes the same run from lastEventId after a reconnect.
+    turn.interrupted = () => {
+      turn.reconnects += 1;
+      if (turn.reconnects > MAX_STREAM_RECONNECTS) {
+        settle(new Error("Stream interrupted"));
+        return;
+      }
+      statusEl.textContent = "Reconnecting…";
+      setTimeout(async () => {
+        if (!socket.turns.has(turn.id)) return;
+        const ws = await connectSocket();
+        if (ws) submit(ws);
+        else settle(new Error("Stream interrupted"));
+      }, SOCKET_RECONNECT_DELAY_MS);
+    };
+    socket.turns.set(turn.id, turn);
+    state.cancelTurn = () => {
+      if (socket.ws) socket.ws.send(JSON.stringify({ type: "cancel", id: turn.id }));
+      else settle(new Error("Run cancelled"));
+    };
+    submit(socket.ws);
+  });
+}
+
+function onSocketMessage(data) {
+  const turn = socket.turns.get(data.id);
+  if (turn) turn.onMessage(data);
+}
+
 function streamAgent(message) {
   return new Promise((resolve, reject) => {
     const url = `/api/agent-stream?sessionId=${encodeURIComponent(
@@ -49,45 +188,61 @@ function streamAgent(message) {
     const source = new EventSource(url);
     let settled = false;
 
+    state.cancelTurn = () => {
+      // Closing the stream cancels the run once the server's grace period ends.
+      source.close();
+      settled = true;
+      reject(new Error("Run cancelled"));
+    };
+
     source.onmessage = (event) => {
-      const payload = JSON.parse(event.data);
-      if (payload.stage === "error") {
+      const outcome = showEvent(JSON.parse(event.data));
+      if (outcome instanceof Error) {
         source.close();
         settled = true;
-        reject(new Error(payload.content));
-        return;
-      }
-
-      const stage =
-        payload.stage === "complete" ? "summary" : payload.stage || "assistant";
-      pushEntry("assistant", payload.content, stage);
-      renderHistory();
-
-      if (payload.stage === "complete") {
+        reject(outcome);
+      } else if (outcome) {
         source.close();
         settled = true;
         resolve();
       }
     };
 
+    // EventSource reconnects on its own and sends Last-Event-ID, so the
+    // server resumes the same run; give up only after repeated failures.
+    let reconnects = 0;
+    source.onopen = () => {
+      reconnects = 0;
+    };
     source.onerror = () => {
-      if (!settled) {
+      if (settled) return;
+      reconnects += 1;
+      if (source.readyState === EventSource.CLOSED || reconnects > MAX_STREAM_RECONNECTS) {
         source.close();
         settled = true;
         reject(new Error("Stream interrupted"));
+        return;
       }
+      statusEl.textContent = "Reconnecting…";
     };
   });
 }
 
+function formatSeconds(elapsedMs) {
+  if (typeof elapsedMs !== "number") return "";
+  return `${(elapsedMs / 1000).toFixed(1)}s`;
+}
+
 function pushEntry(role, content, stage) {
   state.history.push({ role, content, stage });
 }
 
 function toggleForm(disabled) {
   Array.from(formEl.elements).forEach((element) => {
-    element.disabled = disabled;
+    if (element !== cancelEl) element.disabled = disabled;
   });
+  cancelEl.hidden = !disabled;
+  if (!disabled) state.cancelTurn = null;
   statusEl.textContent = disabled ? "Thinking…" : "Agent ready";
 }
 
@@ -150,7 +305,10 @@ function stageLabel(stage) {
     planner: "Agent · Planner",
     coder: "Agent · Coder",
     reviewer: "Agent · Reviewer",
+    candidate: "Agent · Candidate",
+    checker_result: "Agent · Checker",
     summary: "Agent · Summary",
+    degraded: "Agent · Server busy",
     error: "Agent · Error",
   };
   return labels[stage] || "Agent";